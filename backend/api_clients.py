@@ -2,9 +2,28 @@
 API 客户端模块
 统一处理不同 LLM API 提供商
 """
+import json
 import requests
 import time
-from typing import Dict, Optional
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterator, Optional, Tuple
+
+from config import Config
+from http_transport import get_http_transport
+
+
+def strip_code_fence(content: str) -> str:
+    """清理 JSON 输出外层的 markdown 代码块标记"""
+    if content.startswith('```'):
+        lines = content.split('\n')
+        content = '\n'.join(lines[1:-1]) if len(lines) > 2 else content
+    return content
+
+
+class APIStreamError(Exception):
+    """流式调用失败"""
+
 
 class APIResponse:
     """统一的 API 响应格式"""
@@ -24,12 +43,16 @@ class APIResponse:
         }
 
 
-class OpenAIFormatClient:
+class OpenAIFormatBase:
     """
-    OpenAI 格式 API 客户端
-    支持 OpenRouter、OpenAI、SiliconFlow 等
+    OpenAI 格式 API 的公共部分
+    请求头、请求体构造与响应解析，供同步与异步客户端共用，不包含任何网络调用
     """
     
+    # 采样温度（响应缓存的键也依赖这两个值）
+    FAST_TEMPERATURE = 0.2  # 低温度保证输出稳定
+    FULL_TEMPERATURE = 0.3
+    
     def __init__(self, api_key: str, base_url: str, model: str, provider_name: str = "openai"):
         """
         初始化客户端
@@ -45,18 +68,50 @@ class OpenAIFormatClient:
         self.model = model
         self.provider_name = provider_name
     
-    def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
-        """
-        生成快速模式的JSON操作指令
+    def _build_headers(self) -> Dict[str, str]:
+        """构造请求 headers"""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
         
-        Args:
-            instruction: 修改指令
-            html_code: 原始 HTML（用于分析）
-            max_retries: 最大重试次数
-            
-        Returns:
-            APIResponse 对象，content为JSON字符串
-        """
+        # OpenRouter 特定的 headers
+        if self.provider_name == 'openrouter':
+            headers["HTTP-Referer"] = "https://github.com/html-editor-app"
+            headers["X-Title"] = "HTML Editor App"
+        
+        return headers
+    
+    def _build_modify_payload(self, instruction: str, html_code: str) -> dict:
+        """构造完整模式的请求体"""
+        system_prompt = (
+            "You are a skilled frontend developer who modifies HTML code based on design instructions. "
+            "Return ONLY the complete modified HTML code without any explanations or markdown formatting."
+        )
+        
+        user_prompt = f"""Given the HTML code and a design instruction, apply the change and return the full modified HTML file.
+Do NOT skip any parts of the code — output the complete modified HTML with only the necessary edits.
+
+Instruction:
+{instruction}
+
+Original HTML:
+{html_code}
+
+Modified HTML:"""
+        
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": 16384,
+            "temperature": self.FULL_TEMPERATURE
+        }
+    
+    def _build_fast_payload(self, instruction: str, html_code: str) -> dict:
+        """构造快速模式的请求体"""
         system_prompt = """You are a frontend expert that generates precise DOM manipulation instructions.
 Your task is to analyze a user's design instruction and output a JSON array of operations.
 
@@ -91,28 +146,80 @@ HTML structure (first 2000 chars for context):
 
 Generate JSON operations array:"""
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        
-        if self.provider_name == 'openrouter':
-            headers["HTTP-Referer"] = "https://github.com/html-editor-app"
-            headers["X-Title"] = "HTML Editor App"
-        
-        data = {
+        return {
             "model": self.model,
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
             "max_tokens": 1500,
-            "temperature": 0.2  # 低温度保证输出稳定
+            "temperature": self.FAST_TEMPERATURE
         }
+    
+    def _parse_completion(self, result: dict, mode: Optional[str] = None) -> APIResponse:
+        """
+        解析 chat/completions 响应
+        
+        Args:
+            result: 响应 JSON
+            mode: 为 'fast' 时清理 JSON 外的 markdown 代码块标记
+            
+        Returns:
+            APIResponse 对象
+        """
+        if 'choices' in result and len(result['choices']) > 0:
+            content = result['choices'][0]['message']['content'].strip()
+            
+            metadata = {
+                'model': self.model,
+                'provider': self.provider_name,
+                'usage': result.get('usage', {})
+            }
+            
+            if mode == 'fast':
+                content = strip_code_fence(content)
+                metadata['mode'] = 'fast'
+            
+            return APIResponse(
+                success=True,
+                content=content,
+                metadata=metadata
+            )
+        
+        return APIResponse(
+            success=False,
+            error="API 返回格式错误：未找到 choices"
+        )
+
+
+class OpenAIFormatClient(OpenAIFormatBase):
+    """
+    OpenAI 格式 API 客户端
+    支持 OpenRouter、OpenAI、SiliconFlow 等
+    """
+    
+    def __init__(self, api_key: str, base_url: str, model: str, provider_name: str = "openai"):
+        super().__init__(api_key=api_key, base_url=base_url, model=model, provider_name=provider_name)
+        self.transport = get_http_transport()
+    
+    def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """
+        生成快速模式的JSON操作指令
+        
+        Args:
+            instruction: 修改指令
+            html_code: 原始 HTML（用于分析）
+            max_retries: 最大重试次数
+            
+        Returns:
+            APIResponse 对象，content为JSON字符串
+        """
+        headers = self._build_headers()
+        data = self._build_fast_payload(instruction, html_code)
         
         for attempt in range(max_retries):
             try:
-                response = requests.post(
+                response = self.transport.post(
                     self.base_url,
                     headers=headers,
                     json=data,
@@ -134,33 +241,7 @@ Generate JSON operations array:"""
                     error_msg = f"API 错误 {response.status_code}: {response.text}"
                     return APIResponse(success=False, error=error_msg)
                 
-                result = response.json()
-                
-                if 'choices' in result and len(result['choices']) > 0:
-                    content = result['choices'][0]['message']['content'].strip()
-                    
-                    # 清理markdown代码块标记
-                    if content.startswith('```'):
-                        lines = content.split('\n')
-                        content = '\n'.join(lines[1:-1]) if len(lines) > 2 else content
-                    
-                    metadata = {
-                        'model': self.model,
-                        'provider': self.provider_name,
-                        'usage': result.get('usage', {}),
-                        'mode': 'fast'
-                    }
-                    
-                    return APIResponse(
-                        success=True,
-                        content=content,
-                        metadata=metadata
-                    )
-                else:
-                    return APIResponse(
-                        success=False,
-                        error="API 返回格式错误：未找到 choices"
-                    )
+                return self._parse_completion(response.json(), mode='fast')
                     
             except requests.exceptions.Timeout:
                 if attempt < max_retries - 1:
@@ -187,45 +268,12 @@ Generate JSON operations array:"""
         Returns:
             APIResponse 对象
         """
-        system_prompt = (
-            "You are a skilled frontend developer who modifies HTML code based on design instructions. "
-            "Return ONLY the complete modified HTML code without any explanations or markdown formatting."
-        )
-        
-        user_prompt = f"""Given the HTML code and a design instruction, apply the change and return the full modified HTML file.
-Do NOT skip any parts of the code — output the complete modified HTML with only the necessary edits.
-
-Instruction:
-{instruction}
-
-Original HTML:
-{html_code}
-
-Modified HTML:"""
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        
-        # OpenRouter 特定的 headers
-        if self.provider_name == 'openrouter':
-            headers["HTTP-Referer"] = "https://github.com/html-editor-app"
-            headers["X-Title"] = "HTML Editor App"
-        
-        data = {
-            "model": self.model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "max_tokens": 16384,
-            "temperature": 0.3
-        }
+        headers = self._build_headers()
+        data = self._build_modify_payload(instruction, html_code)
         
         for attempt in range(max_retries):
             try:
-                response = requests.post(
+                response = self.transport.post(
                     self.base_url,
                     headers=headers,
                     json=data,
@@ -250,28 +298,7 @@ Modified HTML:"""
                     return APIResponse(success=False, error=error_msg)
                 
                 # 解析响应
-                result = response.json()
-                
-                if 'choices' in result and len(result['choices']) > 0:
-                    content = result['choices'][0]['message']['content'].strip()
-                    
-                    # 提取 metadata
-                    metadata = {
-                        'model': self.model,
-                        'provider': self.provider_name,
-                        'usage': result.get('usage', {})
-                    }
-                    
-                    return APIResponse(
-                        success=True,
-                        content=content,
-                        metadata=metadata
-                    )
-                else:
-                    return APIResponse(
-                        success=False,
-                        error="API 返回格式错误：未找到 choices"
-                    )
+                return self._parse_completion(response.json())
                     
             except requests.exceptions.Timeout:
                 if attempt < max_retries - 1:
@@ -286,9 +313,90 @@ Modified HTML:"""
         
         return APIResponse(success=False, error="达到最大重试次数")
 
+    def stream_modify_html(self, instruction: str, html_code: str, max_retries: int = 3) -> Iterator[str]:
+        """
+        以流式方式调用 LLM 修改 HTML
+        
+        Args:
+            instruction: 修改指令
+            html_code: 原始 HTML
+            max_retries: 首个分片到达前的最大重试次数
+            
+        Yields:
+            模型输出的文本分片
+            
+        Raises:
+            APIStreamError: 请求失败或流中断
+        """
+        headers = self._build_headers()
+        data = self._build_modify_payload(instruction, html_code)
+        data["stream"] = True
+        
+        response = None
+        for attempt in range(max_retries):
+            try:
+                response = self.transport.post(
+                    self.base_url,
+                    headers=headers,
+                    json=data,
+                    timeout=120,
+                    stream=True
+                )
+            except requests.exceptions.Timeout:
+                if attempt < max_retries - 1:
+                    continue
+                raise APIStreamError("请求超时")
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    time.sleep(5)
+                    continue
+                raise APIStreamError(f"请求失败: {str(e)}")
+            
+            # 处理速率限制（仅在尚未输出任何分片时重试）
+            if response.status_code == 429:
+                response.close()
+                if attempt < max_retries - 1:
+                    time.sleep((attempt + 1) * 30)
+                    continue
+                raise APIStreamError("速率限制：请稍后重试")
+            
+            if response.status_code != 200:
+                error_msg = f"API 错误 {response.status_code}: {response.text}"
+                response.close()
+                raise APIStreamError(error_msg)
+            
+            break
+        
+        # SSE 响应通常不带 charset，显式按 UTF-8 解码
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                payload = line[5:].strip()
+                if payload == '[DONE]':
+                    break
+                try:
+                    event = json.loads(payload)
+                except json.JSONDecodeError:
+                    continue
+                choices = event.get('choices') or []
+                if not choices:
+                    continue
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+        except requests.exceptions.RequestException as e:
+            raise APIStreamError(f"流式响应中断: {str(e)}")
+        finally:
+            response.close()
 
-class GeminiClient:
-    """Google Gemini API 客户端"""
+
+class GeminiBase:
+    """
+    Gemini 客户端的公共部分
+    SDK 初始化与 prompt 构造，供同步与异步客户端共用
+    """
     
     def __init__(self, api_key: str, model: str = "gemini-2.0-flash-exp"):
         """
@@ -314,25 +422,10 @@ class GeminiClient:
             self.initialized = False
             self.error_message = f"Gemini 初始化失败: {str(e)}"
     
-    def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
-        """
-        生成快速模式的JSON操作指令
-        
-        Args:
-            instruction: 修改指令
-            html_code: 原始 HTML（用于分析）
-            max_retries: 最大重试次数
-            
-        Returns:
-            APIResponse 对象，content为JSON字符串
-        """
-        if not self.initialized:
-            return APIResponse(
-                success=False,
-                error=self.error_message
-            )
-        
-        prompt = f"""You are a frontend expert that generates precise DOM manipulation instructions.
+    @staticmethod
+    def _build_fast_prompt(instruction: str, html_code: str) -> str:
+        """构造快速模式的 prompt"""
+        return f"""You are a frontend expert that generates precise DOM manipulation instructions.
 Analyze this design instruction and output a JSON array of operations.
 
 IMPORTANT: Return ONLY valid JSON, no explanations or markdown.
@@ -356,6 +449,47 @@ HTML structure (first 2000 chars):
 {html_code[:2000]}
 
 JSON operations array:"""
+    
+    @staticmethod
+    def _build_modify_prompt(instruction: str, html_code: str) -> str:
+        """构造完整模式的 prompt"""
+        return f"""You are a skilled frontend developer who modifies HTML code based on design instructions.
+
+Given the HTML code and a design instruction, apply the change and return the full modified HTML file.
+Do NOT skip any parts of the code — output the complete modified HTML with only the necessary edits.
+Return ONLY the HTML code without any explanations or markdown formatting.
+
+Instruction:
+{instruction}
+
+Original HTML:
+{html_code}
+
+Modified HTML:"""
+
+
+class GeminiClient(GeminiBase):
+    """Google Gemini API 客户端"""
+    
+    def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """
+        生成快速模式的JSON操作指令
+        
+        Args:
+            instruction: 修改指令
+            html_code: 原始 HTML（用于分析）
+            max_retries: 最大重试次数
+            
+        Returns:
+            APIResponse 对象，content为JSON字符串
+        """
+        if not self.initialized:
+            return APIResponse(
+                success=False,
+                error=self.error_message
+            )
+        
+        prompt = self._build_fast_prompt(instruction, html_code)
         
         for attempt in range(max_retries):
             try:
@@ -363,12 +497,7 @@ JSON operations array:"""
                 response = model.generate_content(prompt)
                 
                 if response and response.text:
-                    content = response.text.strip()
-                    
-                    # 清理markdown代码块标记
-                    if content.startswith('```'):
-                        lines = content.split('\n')
-                        content = '\n'.join(lines[1:-1]) if len(lines) > 2 else content
+                    content = strip_code_fence(response.text.strip())
                     
                     metadata = {
                         'model': self.model,
@@ -416,19 +545,7 @@ JSON operations array:"""
                 error=self.error_message
             )
         
-        prompt = f"""You are a skilled frontend developer who modifies HTML code based on design instructions.
-
-Given the HTML code and a design instruction, apply the change and return the full modified HTML file.
-Do NOT skip any parts of the code — output the complete modified HTML with only the necessary edits.
-Return ONLY the HTML code without any explanations or markdown formatting.
-
-Instruction:
-{instruction}
-
-Original HTML:
-{html_code}
-
-Modified HTML:"""
+        prompt = self._build_modify_prompt(instruction, html_code)
         
         for attempt in range(max_retries):
             try:
@@ -465,14 +582,62 @@ Modified HTML:"""
         
         return APIResponse(success=False, error="达到最大重试次数")
 
+    def stream_modify_html(self, instruction: str, html_code: str, max_retries: int = 3) -> Iterator[str]:
+        """
+        以流式方式调用 Gemini 修改 HTML
+        
+        Args:
+            instruction: 修改指令
+            html_code: 原始 HTML
+            max_retries: 首个分片到达前的最大重试次数
+            
+        Yields:
+            模型输出的文本分片
+            
+        Raises:
+            APIStreamError: 请求失败或流中断
+        """
+        if not self.initialized:
+            raise APIStreamError(self.error_message)
+        
+        prompt = self._build_modify_prompt(instruction, html_code)
+        
+        response = None
+        for attempt in range(max_retries):
+            try:
+                model = self.genai.GenerativeModel(self.model)
+                response = model.generate_content(prompt, stream=True)
+                break
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    time.sleep(5)
+                    continue
+                raise APIStreamError(f"Gemini API 调用失败: {str(e)}")
+        
+        try:
+            for chunk in response:
+                text = getattr(chunk, 'text', '')
+                if text:
+                    yield text
+        except Exception as e:
+            raise APIStreamError(f"Gemini 流式响应中断: {str(e)}")
+
 
 class APIClientFactory:
-    """API 客户端工厂"""
+    """
+    API 客户端工厂
+    按 (provider, model, api_key, base_url) 缓存客户端实例，跨请求复用
+    """
     
-    @staticmethod
-    def create_client(provider: str, api_key: str, model: str, base_url: Optional[str] = None):
+    _clients: "OrderedDict[Tuple[str, str, str, Optional[str]], object]" = OrderedDict()
+    _lock: Lock = Lock()
+    _hits = 0
+    _misses = 0
+    
+    @classmethod
+    def create_client(cls, provider: str, api_key: str, model: str, base_url: Optional[str] = None):
         """
-        创建 API 客户端
+        获取（或创建）API 客户端
         
         Args:
             provider: 提供商名称 (openrouter, openai, siliconflow, gemini)
@@ -483,19 +648,79 @@ class APIClientFactory:
         Returns:
             API 客户端实例
         """
+        if provider != 'gemini' and not base_url:
+            # 使用默认端点
+            base_url = Config.get_endpoint(provider)
+        
+        cache_key = (provider, model, api_key, base_url)
+        with cls._lock:
+            client = cls._clients.get(cache_key)
+            if client is not None:
+                cls._clients.move_to_end(cache_key)
+                cls._hits += 1
+                return client
+            cls._misses += 1
+        
+        client = cls._build_client(provider, api_key, model, base_url)
+        
+        # 初始化失败的 Gemini 客户端不缓存，便于下次重试
+        if getattr(client, 'initialized', True):
+            with cls._lock:
+                client = cls._clients.setdefault(cache_key, client)
+                cls._clients.move_to_end(cache_key)
+                while len(cls._clients) > Config.CLIENT_CACHE_SIZE:
+                    cls._clients.popitem(last=False)
+        
+        return client
+    
+    @staticmethod
+    def _build_client(provider: str, api_key: str, model: str, base_url: Optional[str]):
+        """创建新的客户端实例（启用响应缓存时包装一层 CachedAPIClient）"""
         if provider == 'gemini':
-            return GeminiClient(api_key=api_key, model=model)
+            client = GeminiClient(api_key=api_key, model=model)
         else:
             # OpenAI 格式的提供商
-            if not base_url:
-                # 使用默认端点
-                from config import Config
-                base_url = Config.get_endpoint(provider)
-            
-            return OpenAIFormatClient(
+            client = OpenAIFormatClient(
                 api_key=api_key,
                 base_url=base_url,
                 model=model,
                 provider_name=provider
             )
-
+        
+        if Config.RESPONSE_CACHE_ENABLED and getattr(client, 'initialized', True):
+            # 延迟导入，避免循环依赖
+            from response_cache import CachedAPIClient
+            client = CachedAPIClient(client, provider=provider, model=model)
+        
+        return client
+    
+    @classmethod
+    def get_stats(cls) -> Dict[str, object]:
+        """
+        获取客户端缓存与连接池统计
+        
+        Returns:
+            统计信息字典
+        """
+        with cls._lock:
+            cached = [
+                {'provider': key[0], 'model': key[1]}
+                for key in cls._clients.keys()
+            ]
+            hits, misses = cls._hits, cls._misses
+        
+        return {
+            'clients': {
+                'cached': len(cached),
+                'hits': hits,
+                'misses': misses,
+                'entries': cached
+            },
+            'transport': get_http_transport().get_stats()
+        }
+    
+    @classmethod
+    def clear(cls):
+        """清空客户端缓存"""
+        with cls._lock:
+            cls._clients.clear()
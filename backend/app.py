@@ -2,18 +2,30 @@
 Flask 主应用
 提供 REST API 服务
 """
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
+import hashlib
 import io
+import json
+import time
 from datetime import datetime
+from typing import Optional, Tuple
 
 from config import Config
-from api_clients import APIClientFactory
+from api_clients import APIClientFactory, APIStreamError
 from html_processor import HTMLProcessor
-from session_manager import SessionManager
+from fast_operations import FastOperationExecutor
+from session_manager import SessionConflictError, SessionManager
 from instruction_classifier import InstructionClassifier
-from dataset_loader import get_dataset_loader, DatasetLoaderError
+from learned_router import get_learned_router
+from routing_feedback import get_routing_feedback
+from dataset_loader import get_dataset_loader, get_dataset_warmup, DatasetLoaderError
 from provider_validator import ProviderValidator
+from http_transport import get_http_transport
+from response_cache import CachedContent, get_response_cache
+from response_compression import choose_encoding, compress_response
+from routing_evaluator import get_routing_report_job
+from speculative_executor import parse_fast_operations, run_speculative, should_speculate, validate_fast_operations
 
 # 创建 Flask 应用
 app = Flask(__name__)
@@ -35,8 +47,54 @@ CORS(app, resources={
 
 # 初始化管理器
 session_manager = SessionManager()
+session_manager.start_sweeper()
 html_processor = HTMLProcessor()
 
+def _record_fast_outcome(instruction: str, signature: str, success: bool, latency_ms: int,
+                         cached: bool = False):
+    """
+    记录一次快速模式结果：写入路由反馈存储，并追加为路由模型的训练标签
+    
+    缓存命中（cached）只是重放已记录过的结果，耗时也不代表真实调用，两处都不记录
+    """
+    if cached:
+        return
+    get_routing_feedback().record(signature, 'fast', success, latency_ms)
+    get_learned_router().record_outcome(instruction, success, latency_ms)
+
+
+def _execute_fast_operations(current_html: str, operations: Optional[list]) -> Tuple[Optional[str], Optional[dict]]:
+    """
+    校验并在服务端应用快速操作
+
+    Returns:
+        (修改后的 HTML, 执行报告)；操作无效或没有任何操作命中元素时 HTML 为 None
+    """
+    if operations is None or validate_fast_operations(operations) is not None:
+        return None, None
+    modified_html, report = FastOperationExecutor.apply(current_html, operations)
+    if report['applied'] == 0:
+        return None, report
+    return modified_html, report
+
+
+# 启动时加载最新的路由模型（没有模型时分类器使用关键词启发式）
+get_learned_router()
+
+# 可选：后台预热数据集（加载分片并构建搜索索引），避免首个请求阻塞
+if Config.DATASET_WARMUP:
+    get_dataset_warmup().start()
+
+@app.after_request
+def compress_json_response(response):
+    """按 Accept-Encoding 压缩较大的 JSON 响应（如数据集样本的完整 HTML）"""
+    return compress_response(
+        response,
+        request.accept_encodings,
+        min_bytes=Config.RESPONSE_COMPRESSION_MIN_BYTES
+    )
+
+
 # 提供商与可用模型映射
 MODELS_MAP = {
     'openrouter': [
@@ -165,7 +223,11 @@ def modify_html():
         "instruction": "...",
         "api_provider": "openrouter|openai|siliconflow|gemini",
         "model": "...",
-        "force_mode": "fast|full" (可选，强制使用某种模式)
+        "force_mode": "fast|full" (可选，强制使用某种模式),
+        "no_cache": true (可选，跳过响应缓存),
+        "speculative": true (可选，分类分数接近时并发执行快速与完整模式),
+        "stream_full": true (可选，需要完整模式时不在此调用 LLM，返回 {"mode": "full", "stream": true}，
+                             由客户端改用 /api/modify-stream 流式获取)
     }
     """
     try:
@@ -182,6 +244,8 @@ def modify_html():
         api_provider = data.get('api_provider', 'openrouter')
         model = data.get('model')
         force_mode = data.get('force_mode')  # 新增：允许强制模式
+        no_cache = bool(data.get('no_cache'))  # 跳过响应缓存（例如用户希望重新生成）
+        stream_full = bool(data.get('stream_full'))
         
         # 验证必需参数
         if not session_id:
@@ -189,13 +253,11 @@ def modify_html():
         if not instruction:
             return jsonify({'success': False, 'error': '缺少 instruction'}), 400
         
-        # 获取会话
-        session = session_manager.get_session(session_id)
-        if not session:
+        # 获取会话当前 HTML 及版本号（写入历史时据此拒绝过期修改）
+        version = session_manager.get_current_version(session_id)
+        if version is None:
             return jsonify({'success': False, 'error': '无效的会话 ID'}), 404
-        
-        # 获取当前 HTML
-        current_html = session_manager.get_current_html(session_id)
+        current_html, base_revision = version
         if not current_html:
             return jsonify({
                 'success': False,
@@ -227,9 +289,14 @@ def modify_html():
                 'error': f'创建 API 客户端失败: {str(e)}'
             }), 500
         
+        if no_cache:
+            client = getattr(client, 'uncached', client)
+        
         # 智能路由：决定使用快速模式还是完整模式
         use_fast_mode = False
         selected_mode = 'full'  # 默认完整模式
+        classify_meta = None
+        signature = InstructionClassifier.signature(instruction)
         
         if force_mode == 'fast':
             use_fast_mode = True
@@ -240,34 +307,108 @@ def modify_html():
         else:
             # 使用分类器自动判断
             mode, classify_meta = InstructionClassifier.classify(instruction)
+            # 少量完整模式请求改试快速模式，为路由模型采集这类指令的训练标签
+            mode = get_learned_router().explore(mode, classify_meta)
+            # 同类指令近期快速模式频繁失败时直接走完整模式，避免双重调用
+            mode = get_routing_feedback().adjust(signature, mode, classify_meta)
             use_fast_mode = (mode == 'fast')
             selected_mode = mode
         
-        # 尝试快速模式
-        if use_fast_mode:
+        response = None
+        speculative_meta = None
+        fast_html = None
+        
+        if use_fast_mode and should_speculate(classify_meta, bool(data.get('speculative'))):
+            # 推测执行：分数接近时同时发起快速与完整调用，快速操作在服务端应用成功才取消完整调用
+            def apply_fast(ops):
+                patched_html, patch_report = _execute_fast_operations(current_html, ops)
+                return (patched_html, patch_report) if patched_html is not None else None
+            
+            operations, applied, response, speculative_meta = run_speculative(
+                provider=api_provider,
+                api_key=api_key,
+                model=model,
+                instruction=instruction,
+                html_code=current_html,
+                accept=apply_fast
+            )
+            if 'fast_latency' in speculative_meta:
+                # 完整调用先结束时快速结果被丢弃，没有可记录的结果
+                # 部分操作未生效时仍采用快速结果，但不计为成功：训练标签只认全部操作干净应用
+                _record_fast_outcome(
+                    instruction, signature, applied is not None and not applied[1]['failed'],
+                    int(speculative_meta['fast_latency'] * 1000)
+                )
+            if applied is not None:
+                fast_html, fast_report = applied
+                fast_response, fast_meta = response, {**response.metadata, **speculative_meta}
+            elif speculative_meta['winner'] == 'full':
+                # 与顺序降级路径一致，记录完整模式结果（耗时自两路调用同时发起起算）
+                get_routing_feedback().record(
+                    signature, 'full', response.success, int(speculative_meta['full_latency'] * 1000)
+                )
+        
+        elif use_fast_mode:
+            # 尝试快速模式
+            fast_started = time.time()
             fast_response = client.generate_fast_operations(instruction, current_html)
             
-            if fast_response.success:
-                # 验证返回的JSON
-                import json
-                try:
-                    operations = json.loads(fast_response.content)
-                    if isinstance(operations, list) and len(operations) > 0:
-                        # 快速模式成功，返回操作指令
-                        return jsonify({
-                            'success': True,
-                            'mode': 'fast',
-                            'operations': operations,
-                            'metadata': fast_response.metadata
-                        })
-                except json.JSONDecodeError:
-                    pass  # JSON解析失败，降级到完整模式
+            # 验证返回的JSON及操作结构并在服务端应用，结果记录为路由反馈与训练标签
+            operations = parse_fast_operations(fast_response)
+            fast_html, fast_report = _execute_fast_operations(current_html, operations)
+            # 部分操作未生效时仍写入历史，但只有全部操作干净应用才记为成功
+            _record_fast_outcome(
+                instruction, signature, fast_html is not None and not fast_report['failed'],
+                int((time.time() - fast_started) * 1000),
+                cached=bool(fast_response.metadata.get('cached'))
+            )
+            fast_meta = fast_response.metadata
             
-            # 快速模式失败，自动降级到完整模式
-            # 继续执行下面的完整模式逻辑
+            # 快速模式失败（空数组、JSON 解析失败、操作结构无效或未命中任何元素），
+            # 自动降级到下面的完整模式逻辑
+        
+        if fast_html is not None:
+            # 快速模式成功：服务端已应用操作，写入历史
+            try:
+                session_manager.add_history(
+                    session_id=session_id,
+                    instruction=instruction,
+                    modified_html=fast_html,
+                    api_provider=api_provider,
+                    model=model,
+                    change_description=None,
+                    mode='fast',
+                    expected_revision=base_revision
+                )
+            except SessionConflictError:
+                return jsonify({
+                    'success': False,
+                    'error': '会话在修改期间已被其他请求更新，请刷新后重试'
+                }), 409
+            return jsonify({
+                'success': True,
+                'mode': 'fast',
+                'operations': operations,
+                'html_content': fast_html,
+                'metadata': {**fast_meta, 'patch': fast_report}
+            })
+        
+        # 完整模式：客户端支持流式时交给 /api/modify-stream，尽早展示首个分片
+        if response is None and stream_full:
+            return jsonify({
+                'success': True,
+                'mode': 'full',
+                'stream': True
+            })
         
         # 完整模式：调用 LLM 修改 HTML
-        response = client.modify_html(instruction, current_html)
+        if response is None:
+            full_started = time.time()
+            response = client.modify_html(instruction, current_html)
+            if not response.metadata.get('cached'):
+                get_routing_feedback().record(
+                    signature, 'full', response.success, int((time.time() - full_started) * 1000)
+                )
         selected_mode = 'full'  # 标记实际使用了完整模式
         
         if not response.success:
@@ -288,21 +429,28 @@ def modify_html():
             )
         
         # 添加到历史
-        session_manager.add_history(
-            session_id=session_id,
-            instruction=instruction,
-            modified_html=modified_html,
-            api_provider=api_provider,
-            model=model,
-            change_description=None,  # 预留字段
-            mode=selected_mode  # 新增：记录使用的模式
-        )
+        try:
+            session_manager.add_history(
+                session_id=session_id,
+                instruction=instruction,
+                modified_html=modified_html,
+                api_provider=api_provider,
+                model=model,
+                change_description=None,  # 预留字段
+                mode=selected_mode,  # 新增：记录使用的模式
+                expected_revision=base_revision
+            )
+        except SessionConflictError:
+            return jsonify({
+                'success': False,
+                'error': '会话在修改期间已被其他请求更新，请刷新后重试'
+            }), 409
         
         return jsonify({
             'success': True,
             'mode': 'full',  # 完整模式
             'html_content': modified_html,
-            'metadata': response.metadata
+            'metadata': {**response.metadata, **(speculative_meta or {})}
         })
         
     except Exception as e:
@@ -312,11 +460,174 @@ def modify_html():
         }), 500
 
 
+def _sse_event(event: str, payload: dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/modify-stream', methods=['POST'])
+def modify_html_stream():
+    """
+    流式完整模式修改 HTML（Server-Sent Events）
+    Body: {
+        "session_id": "...",
+        "instruction": "...",
+        "api_provider": "openrouter|openai|siliconflow|gemini",
+        "model": "...",
+        "no_cache": true (可选，跳过响应缓存)
+    }
+    事件:
+        chunk - {"delta": "..."} 模型输出分片
+        done  - {"success": true, "mode": "full", "html_content": "...", "metadata": {...}}
+        error - {"success": false, "error": "..."}
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': '请求数据为空'
+            }), 400
+        
+        session_id = data.get('session_id')
+        instruction = data.get('instruction')
+        api_provider = data.get('api_provider', 'openrouter')
+        model = data.get('model')
+        no_cache = bool(data.get('no_cache'))
+        
+        # 验证必需参数
+        if not session_id:
+            return jsonify({'success': False, 'error': '缺少 session_id'}), 400
+        if not instruction:
+            return jsonify({'success': False, 'error': '缺少 instruction'}), 400
+        
+        # 获取会话当前 HTML 及版本号（写入历史时据此拒绝过期修改）
+        version = session_manager.get_current_version(session_id)
+        if version is None:
+            return jsonify({'success': False, 'error': '无效的会话 ID'}), 404
+        current_html, base_revision = version
+        if not current_html:
+            return jsonify({
+                'success': False,
+                'error': '请先上传 HTML 文件'
+            }), 400
+        
+        # 获取 API 密钥
+        api_key = Config.get_api_key(api_provider)
+        if not api_key:
+            return jsonify({
+                'success': False,
+                'error': f'未配置 {api_provider} API 密钥'
+            }), 400
+        
+        # 使用默认模型（如果未指定）
+        if not model:
+            model = Config.get_default_model(api_provider)
+        
+        # 创建 API 客户端
+        try:
+            client = APIClientFactory.create_client(
+                provider=api_provider,
+                api_key=api_key,
+                model=model
+            )
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f'创建 API 客户端失败: {str(e)}'
+            }), 500
+        
+        if no_cache:
+            client = getattr(client, 'uncached', client)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'服务器错误: {str(e)}'
+        }), 500
+    
+    signature = InstructionClassifier.signature(instruction)
+    
+    def generate():
+        chunks = []
+        stream_started = time.time()
+        # 缓存命中只是重放已记录过的结果，不计入路由反馈（与非流式路径一致）
+        cached = False
+        
+        def record_full(success):
+            if not cached:
+                get_routing_feedback().record(
+                    signature, 'full', success, int((time.time() - stream_started) * 1000)
+                )
+        
+        try:
+            for delta in client.stream_modify_html(instruction, current_html):
+                cached = cached or isinstance(delta, CachedContent)
+                chunks.append(delta)
+                yield _sse_event('chunk', {'delta': delta})
+        except APIStreamError as e:
+            record_full(False)
+            yield _sse_event('error', {'success': False, 'error': str(e)})
+            return
+        except Exception as e:
+            yield _sse_event('error', {'success': False, 'error': f'服务器错误: {str(e)}'})
+            return
+        
+        record_full(True)
+        
+        # 流结束后统一清理、验证并写入历史
+        modified_html = html_processor.clean_markdown_code_block(''.join(chunks))
+        is_valid, error_msg = html_processor.validate_html(modified_html)
+        if not is_valid:
+            modified_html = html_processor.format_error_html(
+                f"LLM 返回的 HTML 无效: {error_msg}"
+            )
+        
+        try:
+            session_manager.add_history(
+                session_id=session_id,
+                instruction=instruction,
+                modified_html=modified_html,
+                api_provider=api_provider,
+                model=model,
+                change_description=None,
+                mode='full',
+                expected_revision=base_revision
+            )
+        except SessionConflictError:
+            yield _sse_event('error', {
+                'success': False,
+                'error': '会话在修改期间已被其他请求更新，请刷新后重试'
+            })
+            return
+        
+        yield _sse_event('done', {
+            'success': True,
+            'mode': 'full',
+            'html_content': modified_html,
+            'metadata': {
+                'model': model,
+                'provider': api_provider,
+                'streamed': True
+            }
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route('/api/modify-fast', methods=['POST'])
 def modify_html_fast():
     """
     快速模式修改 HTML
-    生成JSON操作指令而非完整HTML
+    生成JSON操作指令而非完整HTML，在服务端应用后写入历史（mode 为 'fast'）
     Body: {
         "session_id": "...",
         "instruction": "...",
@@ -344,13 +655,11 @@ def modify_html_fast():
         if not instruction:
             return jsonify({'success': False, 'error': '缺少 instruction'}), 400
         
-        # 获取会话
-        session = session_manager.get_session(session_id)
-        if not session:
+        # 获取会话当前 HTML 及版本号（写入历史时据此拒绝过期修改）
+        version = session_manager.get_current_version(session_id)
+        if version is None:
             return jsonify({'success': False, 'error': '无效的会话 ID'}), 404
-        
-        # 获取当前 HTML
-        current_html = session_manager.get_current_html(session_id)
+        current_html, base_revision = version
         if not current_html:
             return jsonify({
                 'success': False,
@@ -383,6 +692,7 @@ def modify_html_fast():
             }), 500
         
         # 调用 LLM 生成操作指令
+        fast_started = time.time()
         response = client.generate_fast_operations(instruction, current_html)
         
         if not response.success:
@@ -392,39 +702,59 @@ def modify_html_fast():
                 'fallback_needed': True  # 提示前端需要降级
             }), 500
         
-        # 验证返回的是否为有效JSON
-        import json
-        try:
-            operations = json.loads(response.content)
-            if not isinstance(operations, list):
-                # 不是数组，返回失败要求降级
-                return jsonify({
-                    'success': False,
-                    'error': 'LLM返回格式无效',
-                    'fallback_needed': True
-                }), 500
-            
-            # 如果LLM返回空数组，表示认为太复杂，需要降级
-            if len(operations) == 0:
-                return jsonify({
-                    'success': False,
-                    'error': '指令过于复杂，需要完整模式处理',
-                    'fallback_needed': True
-                }), 500
-                
-        except json.JSONDecodeError:
+        # 验证返回的操作并在服务端应用
+        operations = parse_fast_operations(response)
+        fast_html, fast_report = _execute_fast_operations(current_html, operations)
+        
+        # 记录快速模式结果（路由反馈与路由模型训练标签）
+        _record_fast_outcome(
+            instruction,
+            InstructionClassifier.signature(instruction),
+            fast_html is not None and not fast_report['failed'],
+            int((time.time() - fast_started) * 1000),
+            cached=bool(response.metadata.get('cached'))
+        )
+        
+        if operations is None:
+            # 空数组表示 LLM 认为太复杂，或返回的不是有效 JSON 数组，需要降级
             return jsonify({
                 'success': False,
-                'error': 'JSON解析失败',
+                'error': '指令过于复杂或 LLM 返回格式无效，需要完整模式处理',
                 'fallback_needed': True
             }), 500
         
-        # 返回操作指令（前端负责执行）
+        if fast_html is None:
+            return jsonify({
+                'success': False,
+                'error': validate_fast_operations(operations) or '操作未匹配到任何元素',
+                'fallback_needed': True,
+                'metadata': {'patch': fast_report} if fast_report else {}
+            }), 500
+        
+        # 服务端已应用操作，写入历史
+        try:
+            session_manager.add_history(
+                session_id=session_id,
+                instruction=instruction,
+                modified_html=fast_html,
+                api_provider=api_provider,
+                model=model,
+                change_description=None,
+                mode='fast',
+                expected_revision=base_revision
+            )
+        except SessionConflictError:
+            return jsonify({
+                'success': False,
+                'error': '会话在修改期间已被其他请求更新，请刷新后重试'
+            }), 409
+        
         return jsonify({
             'success': True,
             'mode': 'fast',
             'operations': operations,
-            'metadata': response.metadata
+            'html_content': fast_html,
+            'metadata': {**response.metadata, 'patch': fast_report}
         })
         
     except Exception as e:
@@ -488,7 +818,13 @@ def revert_to_history():
             }), 400
         
         # 回退到指定版本
-        html_content = session_manager.revert_to_history(session_id, history_id)
+        try:
+            html_content = session_manager.revert_to_history(session_id, history_id)
+        except SessionConflictError:
+            return jsonify({
+                'success': False,
+                'error': '会话在回退期间已被其他请求更新，请刷新后重试'
+            }), 409
         
         if html_content is None:
             return jsonify({
@@ -660,6 +996,9 @@ def generate_suggestions():
                 'error': f'创建 API 客户端失败: {str(e)}'
             }), 500
         
+        # 建议需要多样性，不走响应缓存
+        client = getattr(client, 'uncached', client)
+        
         # 生成建议的 prompt
         suggestion_prompt = f"""You are a UI/UX expert analyzing an HTML webpage. 
 Generate 5 specific, actionable suggestions to improve this webpage's design and user experience.
@@ -694,8 +1033,7 @@ Suggestions:
                 }), 500
             response_content = response_text.content
         else:
-            # 直接调用 API
-            import requests
+            # 直接调用 API（复用共享连接池）
             headers = {
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
@@ -715,7 +1053,7 @@ Suggestions:
                 "temperature": 0.7
             }
             
-            api_response = requests.post(endpoint, headers=headers, json=req_data, timeout=60)
+            api_response = get_http_transport().post(endpoint, headers=headers, json=req_data, timeout=60)
             if api_response.status_code != 200:
                 return jsonify({
                     'success': False,
@@ -778,16 +1116,140 @@ def provider_support_check():
     })
 
 
+@app.route('/api/transport/stats', methods=['GET'])
+def transport_stats():
+    """返回 API 客户端缓存与 HTTP 连接池统计"""
+    return jsonify({
+        'success': True,
+        'stats': APIClientFactory.get_stats()
+    })
+
+
+@app.route('/api/sessions/stats', methods=['GET'])
+def sessions_stats():
+    """返回会话数量、内存占用与淘汰统计"""
+    return jsonify({
+        'success': True,
+        'stats': session_manager.get_stats()
+    })
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """返回 LLM 响应缓存统计"""
+    return jsonify({
+        'success': True,
+        'enabled': Config.RESPONSE_CACHE_ENABLED,
+        'stats': get_response_cache().get_stats()
+    })
+
+
+@app.route('/api/router/status', methods=['GET'])
+def router_status():
+    """返回学习型路由模型状态（版本、阈值、训练信息）及路由反馈统计"""
+    return jsonify({
+        'success': True,
+        **get_learned_router().status(),
+        'feedback': get_routing_feedback().get_stats()
+    })
+
+
+def _dataset_warming_up(needs_validity: bool = False):
+    """
+    数据集仍在预热时返回 503 响应（带 Retry-After），否则返回 None
+    
+    Args:
+        needs_validity: 请求需要样本有效性（valid_only）；尚未计算时在后台开始计算，
+            期间同样返回 503，避免在请求线程中逐行验证全部 HTML
+    """
+    warmup = get_dataset_warmup()
+    if warmup.busy:
+        error = '数据集正在加载，请稍后重试'
+    elif needs_validity:
+        try:
+            if warmup.ensure_validity():
+                return None
+        except DatasetLoaderError:
+            # 数据集本身不可用，由接口返回具体错误
+            return None
+        error = '正在计算样本有效性，请稍后重试'
+    else:
+        return None
+    response = jsonify({
+        'success': False,
+        'error': error,
+        'warmup': warmup.status()
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(Config.DATASET_RETRY_AFTER)
+    return response
+
+
+def _dataset_etag(loader) -> str:
+    """
+    数据集只读接口的强 ETag：由 (接口, 查询参数, 数据集指纹) 决定，无需先生成响应体
+    """
+    key = json.dumps([
+        request.path,
+        sorted(request.args.items(multi=True)),
+        loader.fingerprint,
+        Config.DATASET_PROMPT_PREVIEW_CHARS
+    ], ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _not_modified(etag: str):
+    """
+    If-None-Match 命中时返回 304 响应，否则返回 None
+
+    只接受本次请求会得到的表示的 ETag：按 Accept-Encoding 选出的压缩编码对应的带后缀 ETag，
+    以及未压缩表示的原始 ETag（小于压缩阈值的响应总是不压缩）
+    """
+    encoding = choose_encoding(request.accept_encodings)
+    candidates = (etag,) if encoding is None else (f'{etag}-{encoding}', etag)
+    for candidate in candidates:
+        if request.if_none_match.contains(candidate):
+            response = Response(status=304)
+            response.set_etag(candidate)
+            response.headers['Cache-Control'] = 'no-cache'
+            # ETag 随编码变化，缓存必须按 Accept-Encoding 区分表示
+            response.vary.add('Accept-Encoding')
+            return response
+    return None
+
+
+def _with_etag(response, etag: str):
+    """为响应附加 ETag，浏览器每次使用前重新验证（无论是否压缩都声明 Vary: Accept-Encoding）"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/api/dataset/status', methods=['GET'])
 def dataset_status():
-    """返回数据集状态信息"""
+    """返回数据集状态信息（预热期间立即返回进度，不阻塞）"""
+    warmup = get_dataset_warmup()
+    if warmup.busy:
+        return jsonify({
+            'success': True,
+            'ready': False,
+            'warmup': warmup.status(),
+            'path': Config.DATASET_ARROW_FILE
+        })
+    
     try:
         loader = get_dataset_loader()
         return jsonify({
             'success': True,
             'ready': loader.ready,
+            'warmup': warmup.status(),
             'total': loader.size,
-            'path': Config.DATASET_ARROW_FILE
+            'path': Config.DATASET_ARROW_FILE,
+            'shards': len(loader.shards),
+            'open_shards': sum(1 for shard in loader.shards if shard.is_open),
+            'fingerprint': loader.fingerprint,
+            'sample_cache': loader.sample_cache_stats()
         })
     except DatasetLoaderError as e:
         return jsonify({
@@ -798,17 +1260,51 @@ def dataset_status():
 
 @app.route('/api/dataset/samples', methods=['GET'])
 def dataset_samples():
-    """分页获取数据集样本列表"""
+    """
+    分页获取数据集样本列表
+    Query: offset, limit, fields（可选，逗号分隔的字段列表）, prompt_chars（可选，prompt 预览长度，0 表示不截断）,
+           valid_only（可选，仅返回 HTML 有效的样本）,
+           prompt_type / dataset_source（可选，可重复，按分面位图过滤）
+    """
+    valid_only = request.args.get('valid_only', '').lower() in ('1', 'true')
+    not_ready = _dataset_warming_up(needs_validity=valid_only)
+    if not_ready:
+        return not_ready
+
     try:
         loader = get_dataset_loader()
+        etag = _dataset_etag(loader)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
         offset = int(request.args.get('offset', 0))
         limit = int(request.args.get('limit', 20))
-        data = loader.list_samples(offset=offset, limit=limit)
-        return jsonify({
+        fields = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+        unknown = [name for name in fields if name != 'id' and name not in loader.LIST_FIELDS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"不支持的字段: {', '.join(unknown)}"
+            }), 400
+        prompt_chars = request.args.get('prompt_chars')
+        filters = {
+            name: request.args.getlist(name)
+            for name in loader.FILTER_COLUMNS
+            if request.args.getlist(name)
+        }
+        data = loader.list_samples(
+            offset=offset,
+            limit=limit,
+            fields=fields or None,
+            prompt_chars=int(prompt_chars) if prompt_chars is not None else None,
+            valid_only=valid_only,
+            filters=filters
+        )
+        return _with_etag(jsonify({
             'success': True,
             'total': data['total'],
             'samples': data['samples']
-        })
+        }), etag)
     except DatasetLoaderError as e:
         return jsonify({
             'success': False,
@@ -817,33 +1313,145 @@ def dataset_samples():
     except ValueError:
         return jsonify({
             'success': False,
-            'error': 'offset 和 limit 必须为整数'
+            'error': 'offset、limit 和 prompt_chars 必须为整数'
         }), 400
 
 
+@app.route('/api/dataset/facets', methods=['GET'])
+def dataset_facets():
+    """获取分面取值计数（prompt_type、dataset_source）及 HTML 长度分布"""
+    not_ready = _dataset_warming_up()
+    if not_ready:
+        return not_ready
+
+    try:
+        loader = get_dataset_loader()
+        etag = _dataset_etag(loader)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        data = loader.facets()
+        return _with_etag(jsonify({
+            'success': True,
+            'total': data['total'],
+            'facets': data['facets'],
+            'html_length': data['html_length']
+        }), etag)
+    except DatasetLoaderError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/dataset/search', methods=['GET'])
 def dataset_search():
-    """按 prompt 关键字搜索样本"""
+    """
+    按 prompt 关键字搜索样本
+    Query: query, limit, offset（可选）, prompt_type / dataset_source（可选，可重复，精确匹配过滤）,
+           valid_only（可选，仅返回 HTML 有效的样本）
+    """
+    valid_only = request.args.get('valid_only', '').lower() in ('1', 'true')
+    not_ready = _dataset_warming_up(needs_validity=valid_only)
+    if not_ready:
+        return not_ready
+
     try:
         loader = get_dataset_loader()
+        etag = _dataset_etag(loader)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
         query = request.args.get('query', '').strip()
         limit = int(request.args.get('limit', 50))
-        data = loader.search_samples(query=query, limit=limit)
-        return jsonify({
+        offset = int(request.args.get('offset', 0))
+        filters = {
+            name: request.args.getlist(name)
+            for name in loader.FILTER_COLUMNS
+            if request.args.getlist(name)
+        }
+        if filters or offset or valid_only:
+            data = loader.filter_samples(
+                query=query, filters=filters, offset=offset, limit=limit, valid_only=valid_only
+            )
+        else:
+            data = loader.search_samples(query=query, limit=limit)
+        return _with_etag(jsonify({
             'success': True,
             'total': data['total'],
             'matched': data['matched'],
             'samples': data['samples']
-        })
+        }), etag)
     except DatasetLoaderError as e:
         return jsonify({'success': False, 'error': str(e)}), 500
     except ValueError:
-        return jsonify({'success': False, 'error': 'limit 必须为整数'}), 400
+        return jsonify({'success': False, 'error': 'offset 和 limit 必须为整数'}), 400
+
+
+@app.route('/api/dataset/similar', methods=['GET'])
+def dataset_similar():
+    """
+    按 prompt 相似度查找样本（TF-IDF 字符 n-gram 余弦相似度）
+    Query: query（文本）或 sample_id（以该样本的 prompt 为查询）, limit（可选）
+    """
+    not_ready = _dataset_warming_up()
+    if not_ready:
+        return not_ready
+
+    try:
+        loader = get_dataset_loader()
+        etag = _dataset_etag(loader)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        query = request.args.get('query', '').strip()
+        sample_id = request.args.get('sample_id')
+        limit = int(request.args.get('limit', 10))
+        if not query and sample_id is None:
+            return jsonify({'success': False, 'error': '缺少 query 或 sample_id'}), 400
+        data = loader.similar_samples(
+            query=query,
+            sample_id=int(sample_id) if sample_id is not None else None,
+            limit=limit
+        )
+        return _with_etag(jsonify({
+            'success': True,
+            'total': data['total'],
+            'samples': data['samples']
+        }), etag)
+    except DatasetLoaderError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    except ValueError:
+        return jsonify({'success': False, 'error': 'sample_id 和 limit 必须为整数'}), 400
+
+
+@app.route('/api/dataset/routing-report', methods=['POST'])
+def start_dataset_routing_report():
+    """
+    在后台开始离线评估数据集全部 prompt 的指令路由（快速/完整模式分布、分数直方图、关键词命中），
+    立即返回 202，进度与结果通过 GET /api/dataset/routing-report 查询
+    Body: write_report（可选，默认 true，是否在数据集目录写出 Arrow 报告）
+    """
+    not_ready = _dataset_warming_up()
+    if not_ready:
+        return not_ready
+
+    data = request.get_json(silent=True) or {}
+    job = get_routing_report_job()
+    started = job.start(write_report=bool(data.get('write_report', True)))
+    return jsonify({'success': True, 'started': started, **job.status()}), 202
+
+
+@app.route('/api/dataset/routing-report', methods=['GET'])
+def dataset_routing_report():
+    """返回路由评估任务的状态，完成后包含汇总结果（result）"""
+    return jsonify({'success': True, **get_routing_report_job().status()})
 
 
 @app.route('/api/dataset/select', methods=['POST'])
 def dataset_select():
     """将指定数据集样本加载到会话中"""
+    not_ready = _dataset_warming_up()
+    if not_ready:
+        return not_ready
+
     try:
         data = request.get_json()
         if not data:
@@ -862,21 +1470,18 @@ def dataset_select():
             return jsonify({'success': False, 'error': '无效的会话 ID'}), 404
 
         loader = get_dataset_loader()
-        sample = loader.get_sample(int(sample_id))
-        html_content = sample.get('html')
+        # 清理与验证结果按 (样本 ID, 数据集指纹) 缓存，重复选择同一样本时直接命中
+        prepared = loader.get_prepared_sample(int(sample_id))
+        sample = prepared['sample']
+        cleaned_html = prepared['html']
 
-        if not html_content:
+        if not cleaned_html:
             return jsonify({'success': False, 'error': '该样本不包含 HTML 内容'}), 400
 
-        cleaned_html = html_processor.clean_markdown_code_block(html_content)
-        is_valid, error_msg = html_processor.validate_html(cleaned_html)
-
-        if not is_valid:
-            return jsonify({'success': False, 'error': f'HTML 验证失败: {error_msg}'}), 400
+        if not prepared['valid']:
+            return jsonify({'success': False, 'error': f"HTML 验证失败: {prepared['error']}"}), 400
 
         session_manager.set_original_html(session_id, cleaned_html)
-        # 清空历史记录
-        session['history'] = []
 
         return jsonify({
             'success': True,
@@ -0,0 +1,303 @@
+"""
+异步 API 客户端模块
+基于 asyncio 的 LLM 调用层，共享 aiohttp 会话并按提供商限制并发
+"""
+import asyncio
+import concurrent.futures
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from threading import Lock, Thread
+from typing import Awaitable, Dict, Optional, Tuple
+
+import aiohttp
+
+from api_clients import APIResponse, GeminiBase, OpenAIFormatBase, strip_code_fence
+from config import Config
+
+
+class AsyncLLMRuntime:
+    """
+    异步运行时
+
+    在独立线程中运行一个事件循环，循环内持有共享的 aiohttp 会话和
+    每个提供商的信号量。同步代码（如 Flask 视图）通过 submit/run 提交协程，
+    速率限制退避使用 asyncio.sleep，不再占用工作线程。
+    """
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    def __init__(self, provider_concurrency: int, connection_limit: int):
+        """
+        初始化运行时
+
+        Args:
+            provider_concurrency: 每个提供商允许的最大在途请求数
+            connection_limit: aiohttp 连接器的总连接上限
+        """
+        self.provider_concurrency = provider_concurrency
+        self.connection_limit = connection_limit
+        self._session = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._run_loop, name='async-llm-runtime', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    provider_concurrency=Config.ASYNC_PROVIDER_CONCURRENCY,
+                    connection_limit=Config.ASYNC_CONNECTION_LIMIT
+                )
+            return cls._instance
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def get_session(self):
+        """获取共享 aiohttp 会话（仅在运行时事件循环内调用）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    @asynccontextmanager
+    async def acquire(self, provider: str):
+        """
+        占用提供商的一个并发名额（仅在运行时事件循环内调用）
+
+        Args:
+            provider: 提供商名称
+        """
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.provider_concurrency)
+            self._semaphores[provider] = semaphore
+
+        async with semaphore:
+            self._in_flight[provider] = self._in_flight.get(provider, 0) + 1
+            try:
+                yield
+            finally:
+                self._in_flight[provider] -= 1
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """
+        从任意线程提交协程到运行时事件循环
+
+        Args:
+            coro: 协程对象
+
+        Returns:
+            concurrent.futures.Future 对象
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        """提交协程并阻塞等待结果"""
+        return self.submit(coro).result(timeout=timeout)
+
+    def get_stats(self) -> Dict[str, object]:
+        """获取每个提供商的在途请求数"""
+        return {
+            'provider_concurrency': self.provider_concurrency,
+            'connection_limit': self.connection_limit,
+            'in_flight': dict(self._in_flight)
+        }
+
+
+def get_async_runtime() -> AsyncLLMRuntime:
+    """获取进程级共享的异步运行时"""
+    return AsyncLLMRuntime.get_instance()
+
+
+class AsyncOpenAIFormatClient(OpenAIFormatBase):
+    """
+    OpenAI 格式 API 的异步客户端
+    generate_fast_operations / modify_html 为协程，需在 AsyncLLMRuntime 的事件循环中执行
+    """
+
+    def __init__(self, api_key: str, base_url: str, model: str, provider_name: str = "openai"):
+        super().__init__(api_key=api_key, base_url=base_url, model=model, provider_name=provider_name)
+        self.runtime = get_async_runtime()
+
+    async def _post_with_retry(self, data: dict, timeout: int, backoff: int,
+                               mode: Optional[str], max_retries: int) -> APIResponse:
+        """发送请求，处理 429 退避、超时与重试"""
+        session = await self.runtime.get_session()
+        headers = self._build_headers()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+        for attempt in range(max_retries):
+            try:
+                async with self.runtime.acquire(self.provider_name):
+                    async with session.post(self.base_url, headers=headers, json=data,
+                                            timeout=client_timeout) as response:
+                        status = response.status
+                        if status == 200:
+                            return self._parse_completion(await response.json(content_type=None), mode=mode)
+                        if status != 429:
+                            text = await response.text()
+                            return APIResponse(success=False, error=f"API 错误 {status}: {text}")
+
+                # 速率限制：在信号量外退避，不占用并发名额
+                if attempt < max_retries - 1:
+                    await asyncio.sleep((attempt + 1) * backoff)
+                    continue
+                return APIResponse(
+                    success=False,
+                    error="速率限制：请稍后重试"
+                )
+
+            except asyncio.TimeoutError:
+                if attempt < max_retries - 1:
+                    continue
+                return APIResponse(success=False, error="请求超时")
+
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(3)
+                    continue
+                return APIResponse(success=False, error=f"请求失败: {str(e)}")
+
+        return APIResponse(success=False, error="达到最大重试次数")
+
+    async def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """
+        异步生成快速模式的JSON操作指令
+
+        Args:
+            instruction: 修改指令
+            html_code: 原始 HTML（用于分析）
+            max_retries: 最大重试次数
+
+        Returns:
+            APIResponse 对象，content为JSON字符串
+        """
+        data = self._build_fast_payload(instruction, html_code)
+        return await self._post_with_retry(data, timeout=60, backoff=20, mode='fast', max_retries=max_retries)
+
+    async def modify_html(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """
+        异步调用 LLM 修改 HTML
+
+        Args:
+            instruction: 修改指令
+            html_code: 原始 HTML
+            max_retries: 最大重试次数
+
+        Returns:
+            APIResponse 对象
+        """
+        data = self._build_modify_payload(instruction, html_code)
+        return await self._post_with_retry(data, timeout=120, backoff=30, mode=None, max_retries=max_retries)
+
+
+class AsyncGeminiClient(GeminiBase):
+    """
+    Gemini 的异步客户端
+    使用 SDK 的 generate_content_async，并受 gemini 信号量限制
+    """
+
+    def __init__(self, api_key: str, model: str = "gemini-2.0-flash-exp"):
+        super().__init__(api_key=api_key, model=model)
+        self.runtime = get_async_runtime()
+
+    async def _generate(self, prompt: str, mode: Optional[str], backoff: int, max_retries: int) -> APIResponse:
+        if not self.initialized:
+            return APIResponse(success=False, error=self.error_message)
+
+        for attempt in range(max_retries):
+            try:
+                model = self.genai.GenerativeModel(self.model)
+                async with self.runtime.acquire('gemini'):
+                    response = await model.generate_content_async(prompt)
+
+                if response and response.text:
+                    content = response.text.strip()
+                    metadata = {
+                        'model': self.model,
+                        'provider': 'gemini'
+                    }
+                    if mode == 'fast':
+                        content = strip_code_fence(content)
+                        metadata['mode'] = 'fast'
+                    return APIResponse(success=True, content=content, metadata=metadata)
+
+                return APIResponse(success=False, error="Gemini 返回空响应")
+
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(backoff)
+                    continue
+                return APIResponse(success=False, error=f"Gemini API 调用失败: {str(e)}")
+
+        return APIResponse(success=False, error="达到最大重试次数")
+
+    async def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """异步生成快速模式的JSON操作指令"""
+        prompt = self._build_fast_prompt(instruction, html_code)
+        return await self._generate(prompt, mode='fast', backoff=3, max_retries=max_retries)
+
+    async def modify_html(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """异步调用 Gemini 修改 HTML"""
+        prompt = self._build_modify_prompt(instruction, html_code)
+        return await self._generate(prompt, mode=None, backoff=5, max_retries=max_retries)
+
+
+class AsyncAPIClientFactory:
+    """异步 API 客户端工厂，按 (provider, model, api_key, base_url) 缓存实例"""
+
+    _clients: "OrderedDict[Tuple[str, str, str, Optional[str]], object]" = OrderedDict()
+    _lock: Lock = Lock()
+
+    @classmethod
+    def create_client(cls, provider: str, api_key: str, model: str, base_url: Optional[str] = None):
+        """
+        获取（或创建）异步 API 客户端
+
+        Args:
+            provider: 提供商名称 (openrouter, openai, siliconflow, gemini)
+            api_key: API 密钥
+            model: 模型名称
+            base_url: API 端点（可选）
+
+        Returns:
+            异步 API 客户端实例
+        """
+        if provider != 'gemini' and not base_url:
+            base_url = Config.get_endpoint(provider)
+
+        cache_key = (provider, model, api_key, base_url)
+        with cls._lock:
+            client = cls._clients.get(cache_key)
+            if client is not None:
+                cls._clients.move_to_end(cache_key)
+                return client
+
+        if provider == 'gemini':
+            client = AsyncGeminiClient(api_key=api_key, model=model)
+        else:
+            client = AsyncOpenAIFormatClient(
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                provider_name=provider
+            )
+
+        if getattr(client, 'initialized', True):
+            with cls._lock:
+                client = cls._clients.setdefault(cache_key, client)
+                cls._clients.move_to_end(cache_key)
+                while len(cls._clients) > Config.CLIENT_CACHE_SIZE:
+                    cls._clients.popitem(last=False)
+
+        return client
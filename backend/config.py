@@ -40,12 +40,64 @@ class Config:
         'gemini': 'gemini-2.0-flash-exp'
     }
     
+    # HTTP 连接池配置
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))  # 缓存的主机连接池数量
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 20))  # 每个主机的最大连接数
+    CLIENT_CACHE_SIZE = int(os.getenv('CLIENT_CACHE_SIZE', 32))  # 客户端实例缓存上限
+    
+    # 异步调用配置
+    ASYNC_PROVIDER_CONCURRENCY = int(os.getenv('ASYNC_PROVIDER_CONCURRENCY', 64))  # 每个提供商的最大在途请求数
+    ASYNC_CONNECTION_LIMIT = int(os.getenv('ASYNC_CONNECTION_LIMIT', 256))  # aiohttp 总连接上限
+    
+    # 推测执行配置（快速/完整模式并发）
+    SPECULATIVE_EXECUTION = os.getenv('SPECULATIVE_EXECUTION', 'false').lower() == 'true'  # 默认仅在请求显式要求时启用
+    SPECULATIVE_SCORE_MARGIN = int(os.getenv('SPECULATIVE_SCORE_MARGIN', 1))  # 简单/复杂分数差不超过该值时视为接近
+    SPECULATIVE_PROBABILITY_MARGIN = float(os.getenv('SPECULATIVE_PROBABILITY_MARGIN', 0.15))  # 路由模型给出的快速模式概率与阈值之差不超过该值时视为接近
+    SPECULATIVE_TIMEOUT = int(os.getenv('SPECULATIVE_TIMEOUT', 150))  # 推测执行总超时（秒）
+    
+    # 学习型路由配置
+    ROUTER_ENABLED = os.getenv('ROUTER_ENABLED', 'true').lower() == 'true'  # 有已训练模型时用模型决定快速/完整模式
+    ROUTER_MODEL_DIR = os.getenv('ROUTER_MODEL_DIR', os.path.join(BASE_DIR, 'data', 'router'))  # 版本化模型目录（router-vNNNN.npz）
+    ROUTER_MODEL_VERSION = int(os.getenv('ROUTER_MODEL_VERSION', 0))  # 固定使用的模型版本，0 表示最新
+    ROUTER_OUTCOME_LOG = os.getenv('ROUTER_OUTCOME_LOG', '')  # 快速模式结果日志（训练标签），为空（默认）则不记录
+    ROUTER_EXPLORATION_RATE = float(os.getenv('ROUTER_EXPLORATION_RATE', 0))  # 分类为完整模式的请求中改试快速模式的比例（需同时配置结果日志），0 表示不探索
+    
+    # 路由反馈配置（按指令签名统计快速模式失败率）
+    ROUTING_FEEDBACK_ENABLED = os.getenv('ROUTING_FEEDBACK_ENABLED', 'true').lower() == 'true'
+    ROUTING_FEEDBACK_MAX_SIGNATURES = int(os.getenv('ROUTING_FEEDBACK_MAX_SIGNATURES', 1000))  # 最多保留的签名数
+    ROUTING_FEEDBACK_WINDOW = int(os.getenv('ROUTING_FEEDBACK_WINDOW', 20))  # 每个签名保留的最近结果数
+    ROUTING_FEEDBACK_MIN_SAMPLES = int(os.getenv('ROUTING_FEEDBACK_MIN_SAMPLES', 3))  # 参与决策所需的最少快速模式结果数
+    ROUTING_FEEDBACK_FAILURE_RATE = float(os.getenv('ROUTING_FEEDBACK_FAILURE_RATE', 0.6))  # 失败率达到该值时直接走完整模式
+    ROUTING_FEEDBACK_PROBE_INTERVAL = int(os.getenv('ROUTING_FEEDBACK_PROBE_INTERVAL', 10))  # 每跳过 N 次仍探测一次快速模式，0 表示不探测
+    
+    # 响应缓存配置
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 内存层字节预算
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))  # 条目有效期（秒）
+    RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '')  # 磁盘层目录，为空则不启用
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))  # JSON 响应超过该字节数时按 Accept-Encoding 压缩
+    
     # 会话配置
-    MAX_HISTORY_SIZE = 50  # 最大历史记录数
+    MAX_HISTORY_SIZE = int(os.getenv('MAX_HISTORY_SIZE', 50))  # 最大历史记录数
+    HISTORY_KEYFRAME_INTERVAL = int(os.getenv('HISTORY_KEYFRAME_INTERVAL', 20))  # 历史完整快照间隔
+    SESSION_STORE = os.getenv('SESSION_STORE', 'memory')  # 会话存储后端：memory 或 sqlite
+    SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', os.path.join(BASE_DIR, 'data', 'sessions.db'))  # SQLite 数据库路径
+    SESSION_TOUCH_INTERVAL = float(os.getenv('SESSION_TOUCH_INTERVAL', 5))  # SQLite 后端刷新访问时间的最小间隔（秒），避免只读请求写库
+    SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', 2 * 3600))  # 会话空闲超时（秒），0 表示不限制
+    SESSION_MAX_COUNT = int(os.getenv('SESSION_MAX_COUNT', 1000))  # 最大会话数，0 表示不限制
+    SESSION_MAX_TOTAL_BYTES = int(os.getenv('SESSION_MAX_TOTAL_BYTES', 512 * 1024 * 1024))  # 会话 HTML 总字节预算
+    SESSION_SWEEP_INTERVAL = int(os.getenv('SESSION_SWEEP_INTERVAL', 60))  # 后台清理间隔（秒），0 表示不启动
+    SESSION_HISTORY_CACHE_SIZE = int(os.getenv('SESSION_HISTORY_CACHE_SIZE', 256))  # 进程内缓存历史记录的会话数（按 revision 失效），0 表示不缓存
 
     # 数据集配置
     DATASET_DIR = os.getenv('DATASET_DIR', os.path.join(BASE_DIR, '00-ui-datasets', 'webcode2m-natural-prompts', 'train'))
     DATASET_ARROW_FILE = os.getenv('DATASET_ARROW_FILE', os.path.join(DATASET_DIR, 'data-00000-of-00001.arrow'))
+    DATASET_SEARCH_BACKEND = os.getenv('DATASET_SEARCH_BACKEND', 'index')  # 关键字搜索：index（倒排索引）或 compute（Arrow 向量化扫描）
+    DATASET_PROMPT_PREVIEW_CHARS = int(os.getenv('DATASET_PROMPT_PREVIEW_CHARS', 500))  # 样本列表中 prompt 预览的最大字符数，0 表示不截断
+    DATASET_WARMUP = os.getenv('DATASET_WARMUP', 'false').lower() == 'true'  # 启动时在后台线程预热数据集
+    DATASET_RETRY_AFTER = int(os.getenv('DATASET_RETRY_AFTER', 5))  # 预热期间 503 响应的 Retry-After（秒）
+    DATASET_SAMPLE_CACHE_SIZE = int(os.getenv('DATASET_SAMPLE_CACHE_SIZE', 128))  # 已清理/验证样本 HTML 的 LRU 容量
+    DATASET_PRECOMPUTE_VALIDITY = os.getenv('DATASET_PRECOMPUTE_VALIDITY', 'false').lower() == 'true'  # 预热时预计算每行 HTML 的有效性
     
     @classmethod
     def get_api_key(cls, provider):
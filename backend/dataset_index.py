@@ -0,0 +1,508 @@
+"""Indexes over dataset columns for keyword, similarity and facet lookups."""
+
+import os
+import re
+import zipfile
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def lowercase_terms(words: Sequence[str]) -> List[str]:
+    """
+    Lowercase terms with the same Arrow kernel as the lowered prompt column,
+    de-duplicating them; Python's str.lower() differs for characters such as 'İ'.
+
+    >>> lowercase_terms(['İstanbul', 'ISTANBUL', 'Café'])
+    ['istanbul', 'café']
+    """
+    if not words:
+        return []
+    terms: List[str] = []
+    for term in pc.utf8_lower(pa.array(list(words), type=pa.string())).to_pylist():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def tokenize_query(query: str) -> List[str]:
+    """Split a search query into lowercase, de-duplicated terms (see lowercase_terms)."""
+    return lowercase_terms(query.split())
+
+
+class PromptIndex:
+    """
+    Character n-gram inverted index over the prompt column.
+
+    Every prompt is lowercased and split into overlapping n-grams; each n-gram
+    maps to a sorted array of row ids. A query term is resolved by intersecting
+    the postings of its n-grams and handing the surviving candidates to a
+    caller-supplied substring check, so results match plain substring search
+    exactly while only a handful of rows are ever inspected and the index never
+    needs the prompts themselves in memory.
+    """
+
+    NGRAM = 3
+    FORMAT_VERSION = 2
+    # Rows between progress callbacks while building
+    PROGRESS_STEP = 1000
+
+    def __init__(self, keys: Sequence[str], offsets: np.ndarray, postings: np.ndarray, num_rows: int):
+        self._lookup: Dict[str, int] = {key: idx for idx, key in enumerate(keys)}
+        self._offsets = offsets
+        self._postings = postings
+        self.num_rows = num_rows
+
+    @classmethod
+    def build(cls, prompts_lower: Iterable[str], num_rows: int,
+              progress: Optional[Callable[[int, int], None]] = None) -> 'PromptIndex':
+        """
+        Build the index from already-lowercased prompts.
+
+        Args:
+            prompts_lower: lowercased prompt per row, in row order (consumed once)
+            num_rows: number of rows the iterable yields
+            progress: optional callback receiving (rows_done, total_rows)
+        """
+        grams: Dict[str, List[int]] = {}
+        n = cls.NGRAM
+        total = num_rows
+        for row_id, text in enumerate(prompts_lower):
+            for gram in {text[pos:pos + n] for pos in range(len(text) - n + 1)}:
+                grams.setdefault(gram, []).append(row_id)
+            if progress and (row_id + 1) % cls.PROGRESS_STEP == 0:
+                progress(row_id + 1, total)
+
+        keys = sorted(grams)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        for idx, key in enumerate(keys):
+            offsets[idx + 1] = offsets[idx] + len(grams[key])
+        postings = np.empty(int(offsets[-1]), dtype=np.int32)
+        for idx, key in enumerate(keys):
+            # Rows are visited in order, so each posting list is already sorted
+            postings[offsets[idx]:offsets[idx + 1]] = grams[key]
+        return cls(keys, offsets, postings, num_rows)
+
+    @classmethod
+    def load(cls, path: str, num_rows: int) -> Optional['PromptIndex']:
+        """Load a persisted index, returning None if it is missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != cls.FORMAT_VERSION or int(data['num_rows']) != num_rows:
+                    return None
+                return cls(data['keys'].tolist(), data['offsets'], data['postings'], num_rows)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def save(self, path: str):
+        """Persist the index; failures (e.g. read-only dataset dir) are ignored."""
+        keys = sorted(self._lookup, key=self._lookup.get)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(
+                tmp_path,
+                version=np.int64(self.FORMAT_VERSION),
+                num_rows=np.int64(self.num_rows),
+                keys=np.array(keys, dtype=f'<U{self.NGRAM}'),
+                offsets=self._offsets,
+                postings=self._postings
+            )
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _postings_for(self, gram: str) -> np.ndarray:
+        idx = self._lookup.get(gram)
+        if idx is None:
+            return np.empty(0, dtype=np.int32)
+        return self._postings[self._offsets[idx]:self._offsets[idx + 1]]
+
+    def candidates(self, term: str) -> Optional[np.ndarray]:
+        """
+        Candidate rows for a term (a superset of the true matches).
+
+        Returns None when the term is shorter than the n-gram size and
+        therefore cannot narrow the search.
+        """
+        n = self.NGRAM
+        if len(term) < n:
+            return None
+        grams = sorted(
+            {term[pos:pos + n] for pos in range(len(term) - n + 1)},
+            key=lambda gram: len(self._postings_for(gram))
+        )
+        # Intersect from the rarest n-gram up so the working set shrinks fast
+        result = self._postings_for(grams[0])
+        for gram in grams[1:]:
+            if result.size == 0:
+                break
+            result = np.intersect1d(result, self._postings_for(gram), assume_unique=True)
+        return result
+
+    def search(self, terms: Sequence[str],
+               verify: Callable[[np.ndarray, Sequence[str]], np.ndarray]) -> List[int]:
+        """
+        Rows whose prompt contains every term (multi-term AND).
+
+        Args:
+            terms: lowercase query terms
+            verify: callback receiving (candidate row ids, terms) and returning a
+                boolean mask of the candidates whose prompt contains every term
+
+        Returns:
+            Matching row ids in ascending order
+        """
+        if not terms:
+            return []
+
+        candidate_ids: Optional[np.ndarray] = None
+        for term in terms:
+            rows = self.candidates(term)
+            if rows is None:
+                continue
+            candidate_ids = rows if candidate_ids is None else np.intersect1d(
+                candidate_ids, rows, assume_unique=True
+            )
+            if candidate_ids.size == 0:
+                return []
+
+        if candidate_ids is None:
+            # Every term is shorter than an n-gram: nothing to narrow, check all rows
+            candidate_ids = np.arange(self.num_rows, dtype=np.int64)
+        return candidate_ids[verify(candidate_ids, terms)].tolist()
+
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+class SimilarityIndex:
+    """
+    TF-IDF similarity index over prompts using hashed character n-grams.
+
+    Each prompt is normalized, split into words and represented by the
+    character n-grams of every space-padded word plus the word itself, hashed
+    into a fixed feature space. Rows are sublinear-TF x IDF weighted and L2
+    normalized, and stored feature-major (CSC: colptr / rows / values), so a
+    query only touches the postings of its own features. Sharing sub-word
+    n-grams lets "call-to-action" match "call to action" or "buttons" match
+    "button" without any embedding model.
+    """
+
+    NGRAM_RANGE = (3, 4)
+    N_FEATURES = 1 << 18
+    FORMAT_VERSION = 1
+    PROGRESS_STEP = 1000
+
+    def __init__(self, colptr: np.ndarray, rows: np.ndarray, values: np.ndarray, idf: np.ndarray,
+                 num_rows: int):
+        self._colptr = colptr
+        self._rows = rows
+        self._values = values
+        self._idf = idf
+        self.num_rows = num_rows
+
+    @classmethod
+    def _feature_counts(cls, text: str) -> Dict[int, int]:
+        """Hashed feature id -> occurrence count for one text."""
+        counts: Dict[int, int] = {}
+        low, high = cls.NGRAM_RANGE
+        for word in _NON_WORD.sub(' ', (text or '').lower()).split():
+            grams = [f"w:{word}"]
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                grams.extend(padded[pos:pos + n] for pos in range(len(padded) - n + 1))
+            for gram in grams:
+                feature = zlib.crc32(gram.encode('utf-8')) % cls.N_FEATURES
+                counts[feature] = counts.get(feature, 0) + 1
+        return counts
+
+    @classmethod
+    def build(cls, prompts: Sequence[str],
+              progress: Optional[Callable[[int, int], None]] = None) -> 'SimilarityIndex':
+        """
+        Build the index from raw prompts.
+
+        Args:
+            prompts: prompt per row
+            progress: optional callback receiving (rows_done, total_rows)
+        """
+        total = len(prompts)
+        row_ids: List[np.ndarray] = []
+        features: List[np.ndarray] = []
+        counts: List[np.ndarray] = []
+        for row_id, prompt in enumerate(prompts):
+            row_counts = cls._feature_counts(prompt)
+            features.append(np.fromiter(row_counts.keys(), dtype=np.int64, count=len(row_counts)))
+            counts.append(np.fromiter(row_counts.values(), dtype=np.float32, count=len(row_counts)))
+            row_ids.append(np.full(len(row_counts), row_id, dtype=np.int32))
+            if progress and (row_id + 1) % cls.PROGRESS_STEP == 0:
+                progress(row_id + 1, total)
+
+        feature_arr = np.concatenate(features) if features else np.empty(0, dtype=np.int64)
+        count_arr = np.concatenate(counts) if counts else np.empty(0, dtype=np.float32)
+        row_arr = np.concatenate(row_ids) if row_ids else np.empty(0, dtype=np.int32)
+
+        doc_freq = np.bincount(feature_arr, minlength=cls.N_FEATURES)
+        idf = (np.log((1.0 + total) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+        values = (1.0 + np.log(count_arr)) * idf[feature_arr]
+
+        # L2-normalize every row so a dot product is a cosine similarity
+        norms = np.sqrt(np.bincount(row_arr, weights=values * values, minlength=total))
+        values = (values / np.maximum(norms[row_arr], 1e-12)).astype(np.float32)
+
+        order = np.argsort(feature_arr, kind='stable')
+        colptr = np.zeros(cls.N_FEATURES + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=colptr[1:])
+        return cls(colptr, row_arr[order], values[order], idf, total)
+
+    @classmethod
+    def load(cls, path: str, num_rows: int) -> Optional['SimilarityIndex']:
+        """Load a persisted index, returning None if it is missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if (int(data['version']) != cls.FORMAT_VERSION or int(data['num_rows']) != num_rows
+                        or data['idf'].shape != (cls.N_FEATURES,)):
+                    return None
+                return cls(data['colptr'], data['rows'], data['values'], data['idf'], num_rows)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def save(self, path: str):
+        """Persist the index; failures (e.g. read-only dataset dir) are ignored."""
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(
+                tmp_path,
+                version=np.int64(self.FORMAT_VERSION),
+                num_rows=np.int64(self.num_rows),
+                colptr=self._colptr,
+                rows=self._rows,
+                values=self._values,
+                idf=self._idf
+            )
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _query_vector(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalized (feature ids, weights) of a query."""
+        counts = self._feature_counts(text)
+        feature_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts))))
+        weights = weights * self._idf[feature_ids]
+        norm = np.sqrt(np.dot(weights, weights))
+        if norm > 0:
+            weights = weights / norm
+        return feature_ids, weights
+
+    def query_many(self, texts: Sequence[str], k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k most similar rows for each text, scored in one batch.
+
+        The postings of every query feature are gathered at once and the
+        per-(query, row) dot products accumulated with a single bincount.
+
+        Returns:
+            For each text, a list of (row_id, cosine score) sorted by score, zero scores omitted
+        """
+        if not texts or self.num_rows == 0:
+            return [[] for _ in texts]
+
+        gathered_rows: List[np.ndarray] = []
+        gathered_scores: List[np.ndarray] = []
+        for query_idx, text in enumerate(texts):
+            feature_ids, weights = self._query_vector(text)
+            for feature, weight in zip(feature_ids.tolist(), weights.tolist()):
+                start, end = self._colptr[feature], self._colptr[feature + 1]
+                if start == end:
+                    continue
+                gathered_rows.append(self._rows[start:end].astype(np.int64) + query_idx * self.num_rows)
+                gathered_scores.append(self._values[start:end] * weight)
+
+        if not gathered_rows:
+            return [[] for _ in texts]
+        scores = np.bincount(
+            np.concatenate(gathered_rows),
+            weights=np.concatenate(gathered_scores),
+            minlength=len(texts) * self.num_rows
+        ).reshape(len(texts), self.num_rows)
+
+        k = max(min(k, self.num_rows), 1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results: List[List[Tuple[int, float]]] = []
+        for query_idx in range(len(texts)):
+            candidates = top[query_idx]
+            candidate_scores = scores[query_idx, candidates]
+            order = np.argsort(-candidate_scores, kind='stable')
+            results.append([
+                (int(candidates[pos]), round(float(candidate_scores[pos]), 4))
+                for pos in order if candidate_scores[pos] > 0
+            ])
+        return results
+
+    def query(self, text: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k most similar rows for a single text."""
+        return self.query_many([text], k)[0]
+
+
+class FacetIndex:
+    """
+    Per-value row bitmaps and statistics for categorical columns.
+
+    Each distinct value of a facet column owns a packed bitmap (one bit per
+    row), so a filter is resolved by OR-ing the bitmaps of the requested
+    values and AND-ing across columns; no column data is scanned at query
+    time. HTML byte lengths are kept alongside to describe the size
+    distribution overall and per facet value.
+    """
+
+    FORMAT_VERSION = 1
+    # Upper edges of the HTML length histogram buckets in bytes (the last bucket is open-ended)
+    LENGTH_BUCKETS = tuple(1 << shift for shift in range(10, 21))
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, facets: Dict[str, Tuple[List[str], np.ndarray]], html_lengths: np.ndarray,
+                 num_rows: int):
+        """
+        Args:
+            facets: column -> (values, packed bitmaps with one row per value)
+            html_lengths: HTML byte length per row
+            num_rows: dataset size
+        """
+        self._facets = facets
+        self._lookup = {
+            name: {value: idx for idx, value in enumerate(values)}
+            for name, (values, _) in facets.items()
+        }
+        self.html_lengths = html_lengths
+        self.num_rows = num_rows
+        self._summary: Optional[Dict[str, object]] = None
+
+    @classmethod
+    def build(cls, facet_codes: Dict[str, Tuple[List[str], np.ndarray]],
+              html_lengths: np.ndarray) -> 'FacetIndex':
+        """
+        Build bitmaps from dictionary-encoded columns.
+
+        Args:
+            facet_codes: column -> (distinct values, per-row code into values, -1 for null)
+            html_lengths: HTML byte length per row
+        """
+        num_rows = int(html_lengths.size)
+        facets: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        for name, (values, codes) in facet_codes.items():
+            bitmaps = np.zeros((len(values), (num_rows + 7) // 8), dtype=np.uint8)
+            for idx in range(len(values)):
+                bitmaps[idx] = np.packbits(codes == idx)
+            facets[name] = (list(values), bitmaps)
+        return cls(facets, html_lengths.astype(np.int64, copy=False), num_rows)
+
+    @classmethod
+    def load(cls, path: str, num_rows: int) -> Optional['FacetIndex']:
+        """Load a persisted index, returning None if it is missing or stale."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != cls.FORMAT_VERSION or int(data['num_rows']) != num_rows:
+                    return None
+                facets = {
+                    name: (data[f'values_{name}'].tolist(), data[f'bitmaps_{name}'])
+                    for name in data['columns'].tolist()
+                }
+                return cls(facets, data['html_lengths'], num_rows)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def save(self, path: str):
+        """Persist the index; failures (e.g. read-only dataset dir) are ignored."""
+        arrays = {
+            'version': np.int64(self.FORMAT_VERSION),
+            'num_rows': np.int64(self.num_rows),
+            'columns': np.array(list(self._facets), dtype=str),
+            'html_lengths': self.html_lengths
+        }
+        for name, (values, bitmaps) in self._facets.items():
+            arrays[f'values_{name}'] = np.array(values, dtype=str)
+            arrays[f'bitmaps_{name}'] = bitmaps
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def mask(self, filters: Dict[str, Sequence[str]]) -> np.ndarray:
+        """
+        Packed bitmap of rows matching every column filter (any listed value per column).
+
+        Columns that are not indexed and unknown values match no rows.
+        """
+        result = np.full((self.num_rows + 7) // 8, 0xFF, dtype=np.uint8)
+        for name, values in filters.items():
+            lookup = self._lookup.get(name, {})
+            column_bits = np.zeros_like(result)
+            for value in values:
+                idx = lookup.get(value)
+                if idx is not None:
+                    np.bitwise_or(column_bits, self._facets[name][1][idx], out=column_bits)
+            np.bitwise_and(result, column_bits, out=result)
+        return result
+
+    def rows(self, packed: np.ndarray) -> np.ndarray:
+        """Sorted row ids set in a packed bitmap."""
+        return np.flatnonzero(np.unpackbits(packed, count=self.num_rows))
+
+    def summary(self) -> Dict[str, object]:
+        """
+        Facet value counts and HTML length distributions, computed once.
+
+        Returns:
+            {'facets': {column: [{'value', 'count', 'html_length'}] by descending count},
+             'html_length': distribution over all rows}
+        """
+        if self._summary is None:
+            facets: Dict[str, List[Dict[str, object]]] = {}
+            for name, (values, bitmaps) in self._facets.items():
+                entries = []
+                for value, packed in zip(values, bitmaps):
+                    lengths = self.html_lengths[self.rows(packed)]
+                    entries.append({
+                        'value': value,
+                        'count': int(lengths.size),
+                        'html_length': self._distribution(lengths, histogram=False)
+                    })
+                entries.sort(key=lambda entry: (-entry['count'], entry['value']))
+                facets[name] = entries
+            self._summary = {
+                'facets': facets,
+                'html_length': self._distribution(self.html_lengths, histogram=True)
+            }
+        return self._summary
+
+    @classmethod
+    def _distribution(cls, lengths: np.ndarray, histogram: bool) -> Dict[str, object]:
+        if lengths.size == 0:
+            return {'min': 0, 'max': 0, 'mean': 0.0}
+        result: Dict[str, object] = {
+            'min': int(lengths.min()),
+            'max': int(lengths.max()),
+            'mean': round(float(lengths.mean()), 1)
+        }
+        for pct, value in zip(cls.PERCENTILES, np.percentile(lengths, cls.PERCENTILES)):
+            result[f'p{pct}'] = int(value)
+        if histogram:
+            bucket_ids = np.searchsorted(np.array(cls.LENGTH_BUCKETS), lengths, side='left')
+            counts = np.bincount(bucket_ids, minlength=len(cls.LENGTH_BUCKETS) + 1)
+            result['histogram'] = [
+                {'max_bytes': edge, 'count': int(count)}
+                for edge, count in zip(list(cls.LENGTH_BUCKETS) + [None], counts)
+            ]
+        return result
@@ -1,74 +1,366 @@
 """Dataset loader utilities for prompt-HTML pairs."""
 
+import bisect
+import hashlib
+import json
 import os
-from threading import Lock
-from typing import Dict, List, Optional
+import zipfile
+from collections import OrderedDict
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.ipc as ipc
 
 from config import Config
+from dataset_index import FacetIndex, PromptIndex, SimilarityIndex, lowercase_terms, tokenize_query
+from html_processor import HTMLProcessor
 
 
 class DatasetLoaderError(Exception):
     """Custom exception for dataset loader issues."""
 
 
+def _read_batches(source: pa.NativeFile) -> Tuple[pa.Schema, List[pa.RecordBatch]]:
+    """
+    Open record batches supporting both file and stream formats.
+
+    The file format is read through its footer, one batch at a time; the
+    stream format (used by HuggingFace exports) has no footer, so its
+    messages are walked once. With a memory-mapped source neither reads
+    batch bodies.
+    """
+    try:
+        reader = ipc.RecordBatchFileReader(source)
+        return reader.schema, [reader.get_batch(idx) for idx in range(reader.num_record_batches)]
+    except pa.ArrowInvalid:
+        source.seek(0)
+        stream_reader = ipc.RecordBatchStreamReader(source)
+        return stream_reader.schema, list(stream_reader)
+
+
+def _read_state(directory: str) -> Dict[str, object]:
+    """Parse the HuggingFace state.json in a dataset directory ({} if absent)."""
+    try:
+        with open(os.path.join(directory, 'state.json'), 'r', encoding='utf-8') as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+class DatasetShard:
+    """One Arrow file of the dataset, memory-mapped on first access."""
+
+    def __init__(self, path: str, num_rows: Optional[int] = None):
+        """
+        Args:
+            path: Arrow file path
+            num_rows: row count from the shard manifest, if known (avoids opening the file)
+        """
+        self.path = path
+        self._num_rows = num_rows
+        self._lock = Lock()
+        self._source: Optional[pa.MemoryMappedFile] = None
+        self._batches: List[pa.RecordBatch] = []
+        self._batch_offsets: List[int] = [0]
+        self._table: Optional[pa.Table] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._table is not None
+
+    @property
+    def num_rows(self) -> int:
+        if self._num_rows is None:
+            self.open()
+        return self._num_rows
+
+    def open(self) -> pa.Table:
+        """Map the file and index its record batches (idempotent)."""
+        with self._lock:
+            if self._table is not None:
+                return self._table
+            if not os.path.exists(self.path):
+                raise DatasetLoaderError(f"未找到数据集文件: {self.path}")
+
+            try:
+                # The map stays open for the shard's lifetime: batches reference its
+                # pages directly, so nothing is copied to the heap and only the pages
+                # a request actually touches become resident.
+                source = pa.memory_map(self.path, 'r')
+                schema, batches = _read_batches(source)
+            except Exception as exc:  # pylint: disable=broad-except
+                raise DatasetLoaderError(f"加载数据集失败: {str(exc)}") from exc
+
+            offsets = [0]
+            for batch in batches:
+                offsets.append(offsets[-1] + batch.num_rows)
+            if self._num_rows is not None and offsets[-1] != self._num_rows:
+                raise DatasetLoaderError(f"数据集分片行数与清单不一致: {self.path}")
+
+            self._source = source
+            self._batches = batches
+            self._batch_offsets = offsets
+            self._num_rows = offsets[-1]
+            # Zero-copy view over the batches for column-wide operations
+            self._table = pa.Table.from_batches(batches, schema=schema)
+            return self._table
+
+    def row(self, local_row: int) -> Dict[str, list]:
+        """Columns of a single row, located by binary search over batch offsets."""
+        self.open()
+        batch_idx = bisect.bisect_right(self._batch_offsets, local_row) - 1
+        batch = self._batches[batch_idx]
+        return batch.slice(local_row - self._batch_offsets[batch_idx], 1).to_pydict()
+
+
 class DatasetLoader:
-    """Load and serve dataset samples from Arrow file."""
+    """Load and serve dataset samples from one or more Arrow shards."""
 
     _instance = None
     _lock: Lock = Lock()
 
-    def __init__(self, arrow_path: str):
-        self.arrow_path = arrow_path
+    # Columns returned in listings and search results (everything except html)
+    SUMMARY_COLUMNS = ('prompt', 'prompt_type', 'dataset_source')
+    # Columns that listings may request through `fields` (html is only served by get_sample)
+    LIST_FIELDS = SUMMARY_COLUMNS + ('original_index',)
+    # Columns accepted as exact-match filters
+    FILTER_COLUMNS = ('prompt_type', 'dataset_source')
+
+    def __init__(self, arrow_paths: Union[str, Sequence[str]]):
+        """
+        Args:
+            arrow_paths: shard paths in row order (a single path is accepted too)
+        """
+        if isinstance(arrow_paths, str):
+            arrow_paths = [arrow_paths]
+        if not arrow_paths:
+            raise DatasetLoaderError("数据集未包含任何数据文件")
+        for path in arrow_paths:
+            if not os.path.exists(path):
+                raise DatasetLoaderError(f"未找到数据集文件: {path}")
+
+        self.arrow_paths = list(arrow_paths)
+        self.data_dir = os.path.dirname(os.path.abspath(self.arrow_paths[0]))
+        self.fingerprint = self._read_fingerprint()
+
+        self.shards = self._create_shards()
+        # Global row id -> shard: shard i holds rows [_shard_offsets[i], _shard_offsets[i + 1])
+        self._shard_offsets = [0]
+        for shard in self.shards:
+            self._shard_offsets.append(self._shard_offsets[-1] + shard.num_rows)
+
+        self._table_lock = Lock()
         self._table: Optional[pa.Table] = None
-        self._load_dataset()
+
+        self._index_lock = Lock()
+        self._prompt_index: Optional[PromptIndex] = None
+        self._prompt_lower_lock = Lock()
+        self._prompt_lower_column: Optional[pa.ChunkedArray] = None
+        self._similarity_lock = Lock()
+        self._similarity_index: Optional[SimilarityIndex] = None
+        self._facet_lock = Lock()
+        self._facet_index: Optional[FacetIndex] = None
+
+        # (fingerprint, sample id) -> prepared sample, see get_prepared_sample
+        self._sample_cache: "OrderedDict[Tuple[str, int], Dict[str, object]]" = OrderedDict()
+        self._sample_cache_lock = Lock()
+        self._sample_cache_stats = {'hits': 0, 'misses': 0}
+        # Per-row validity flag and cleaned html length, see sample_validity
+        self._validity_lock = Lock()
+        self._validity: Optional[Tuple[np.ndarray, np.ndarray]] = None
 
     @classmethod
     def get_instance(cls):
         with cls._lock:
             if cls._instance is None:
-                cls._instance = cls(Config.DATASET_ARROW_FILE)
+                cls._instance = cls(cls.resolve_data_files(Config.DATASET_ARROW_FILE))
             return cls._instance
 
-    def _load_dataset(self):
-        if not os.path.exists(self.arrow_path):
-            raise DatasetLoaderError(f"未找到数据集文件: {self.arrow_path}")
-
-        try:
-            with pa.memory_map(self.arrow_path, 'r') as source:
-                self._table = self._read_table(source)
-        except Exception as exc:  # pylint: disable=broad-except
-            raise DatasetLoaderError(f"加载数据集失败: {str(exc)}") from exc
-
     @staticmethod
-    def _read_table(source: pa.NativeFile) -> pa.Table:
-        """Read Arrow data supporting both file and stream formats."""
+    def resolve_data_files(arrow_file: str) -> List[str]:
+        """Shard paths listed in state.json next to `arrow_file`, or `arrow_file` alone."""
+        directory = os.path.dirname(os.path.abspath(arrow_file))
+        data_files = _read_state(directory).get('_data_files') or []
+        filenames = [
+            item['filename'] for item in data_files
+            if isinstance(item, dict) and item.get('filename')
+        ]
+        if not filenames:
+            return [arrow_file]
+        return [os.path.join(directory, filename) for filename in filenames]
+
+    def _read_fingerprint(self) -> str:
+        """Dataset fingerprint from state.json, falling back to shard sizes and mtimes."""
+        fingerprint = _read_state(self.data_dir).get('_fingerprint')
+        if fingerprint:
+            return str(fingerprint)
+        digest = hashlib.sha1()
+        for path in self.arrow_paths:
+            stat = os.stat(path)
+            digest.update(f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)};".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def artifact_path(self, name: str, extension: str = 'npz') -> str:
+        """Path of a derived artifact (index, statistics) stored next to the Arrow files."""
+        return os.path.join(self.data_dir, f"{name}-{self.fingerprint}.{extension}")
+
+    def _create_shards(self) -> List[DatasetShard]:
+        """
+        Create shards with row counts from the persisted manifest.
+
+        Without a valid manifest every shard is opened to count its rows and
+        the manifest is written, so later starts open shards only on demand.
+        """
+        filenames = [os.path.basename(path) for path in self.arrow_paths]
+        path = self.artifact_path('shards', 'json')
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                manifest = json.load(handle)
+            if manifest.get('files') == filenames and len(manifest.get('num_rows', [])) == len(filenames):
+                return [
+                    DatasetShard(shard_path, int(count))
+                    for shard_path, count in zip(self.arrow_paths, manifest['num_rows'])
+                ]
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+
+        shards = [DatasetShard(shard_path) for shard_path in self.arrow_paths]
+        counts = [shard.num_rows for shard in shards]
         try:
-            reader = ipc.RecordBatchFileReader(source)
-            return reader.read_all()
-        except pa.ArrowInvalid:
-            source.seek(0)
-            stream_reader = ipc.RecordBatchStreamReader(source)
-            return stream_reader.read_all()
+            with open(path, 'w', encoding='utf-8') as handle:
+                json.dump({'files': filenames, 'num_rows': counts}, handle)
+        except OSError:
+            pass
+        return shards
 
     @property
     def ready(self) -> bool:
-        return self._table is not None
+        return bool(self.shards)
 
     @property
     def size(self) -> int:
-        if not self._table:
-            return 0
-        return self._table.num_rows
+        return self._shard_offsets[-1]
 
-    def list_samples(self, offset: int = 0, limit: int = 20) -> Dict[str, object]:
+    @property
+    def schema(self) -> pa.Schema:
+        return self.shards[0].open().schema
+
+    def _locate(self, row_id: int) -> Tuple[DatasetShard, int]:
+        """Find the shard holding a global row id and the row's offset inside it."""
+        shard_idx = bisect.bisect_right(self._shard_offsets, row_id) - 1
+        return self.shards[shard_idx], row_id - self._shard_offsets[shard_idx]
+
+    def _full_table(self) -> pa.Table:
+        """Zero-copy concatenation of all shards (opens every shard)."""
+        with self._table_lock:
+            if self._table is None:
+                tables = [shard.open() for shard in self.shards]
+                try:
+                    self._table = tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+                except pa.ArrowInvalid as exc:
+                    raise DatasetLoaderError(f"数据集分片结构不一致: {str(exc)}") from exc
+            return self._table
+
+    def _slice(self, offset: int, length: int) -> pa.Table:
+        """Rows [offset, offset + length) opening only the shards they span."""
+        pieces = []
+        end = offset + length
+        shard_idx = bisect.bisect_right(self._shard_offsets, offset) - 1
+        while offset < end and shard_idx < len(self.shards):
+            shard_start = self._shard_offsets[shard_idx]
+            shard_end = self._shard_offsets[shard_idx + 1]
+            take = min(end, shard_end) - offset
+            if take > 0:
+                pieces.append(self.shards[shard_idx].open().slice(offset - shard_start, take))
+                offset += take
+            shard_idx += 1
+        if len(pieces) == 1:
+            return pieces[0]
+        return pa.concat_tables(pieces)
+
+    def _take(self, row_ids: Sequence[int], columns: Sequence[str]) -> pa.Table:
+        """
+        Gather `columns` for global row ids (in the given order), opening only
+        the shards those rows live in.
+        """
+        ids = np.asarray(row_ids, dtype=np.int64)
+        if ids.size == 0:
+            table = self.shards[0].open()
+            return table.select([name for name in columns if name in table.column_names]).slice(0, 0)
+        shard_ids = np.searchsorted(self._shard_offsets, ids, side='right') - 1
+        order = np.argsort(shard_ids, kind='stable')
+        pieces = []
+        for shard_idx in np.unique(shard_ids):
+            table = self.shards[shard_idx].open()
+            local = ids[shard_ids == shard_idx] - self._shard_offsets[shard_idx]
+            names = [name for name in columns if name in table.column_names]
+            pieces.append(table.select(names).take(pa.array(local, type=pa.int64())))
+        if len(pieces) == 1:
+            return pieces[0]
+        try:
+            grouped = pa.concat_tables(pieces)
+        except pa.ArrowInvalid as exc:
+            raise DatasetLoaderError(f"数据集分片结构不一致: {str(exc)}") from exc
+        # Rows come back grouped by shard; put them back in the requested order
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(order.size)
+        return grouped.take(pa.array(inverse, type=pa.int64()))
+
+    def column_batches(self, name: str, batch_size: int = 10000) -> Iterator[Tuple[int, list]]:
+        """
+        Yield (first row id, values) for one column in row order, batch by batch.
+
+        Only the requested column of each slice is converted to Python objects,
+        so full passes (e.g. routing evaluation) never materialize the html column.
+        """
+        if not self.ready:
+            raise DatasetLoaderError("数据集尚未加载")
+        if name not in self.schema.names:
+            raise DatasetLoaderError(f"数据集中不存在字段: {name}")
+        for offset in range(0, self.size, batch_size):
+            length = min(batch_size, self.size - offset)
+            yield offset, self._slice(offset, length).column(name).to_pylist()
+
+    def list_samples(self, offset: int = 0, limit: int = 20, fields: Optional[Sequence[str]] = None,
+                     prompt_chars: Optional[int] = None, valid_only: bool = False,
+                     filters: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+        """
+        Page through samples without touching the html column.
+
+        Args:
+            offset: first row id
+            limit: page size (1-100)
+            fields: columns to include besides id (default: SUMMARY_COLUMNS)
+            prompt_chars: truncate prompts to this many characters, 0 to disable
+                (default: Config.DATASET_PROMPT_PREVIEW_CHARS)
+            valid_only: skip samples whose HTML fails validation (total counts valid rows only)
+            filters: facet column -> value or list of values, resolved through the
+                facet bitmaps (total counts matching rows only)
+        """
         if not self.ready:
             raise DatasetLoaderError("数据集尚未加载")
 
         offset = max(offset, 0)
         limit = max(min(limit, 100), 1)
+        fields = self._resolve_fields(fields)
+        if prompt_chars is None:
+            prompt_chars = Config.DATASET_PROMPT_PREVIEW_CHARS
+
+        active_filters = self._active_filters(filters)
+        if active_filters or valid_only:
+            selected_ids = self._select_rows(active_filters, valid_only)
+            page_ids = selected_ids[offset:offset + limit].tolist()
+            rows = self._take(page_ids, fields) if page_ids else None
+            return {
+                'samples': self._rows_to_samples(rows, page_ids, fields, prompt_chars) if page_ids else [],
+                'total': int(selected_ids.size),
+                'matched': len(page_ids)
+            }
+
         total = self.size
 
         if offset >= total:
@@ -79,61 +371,446 @@ class DatasetLoader:
             }
 
         slice_size = min(limit, total - offset)
-        sliced = self._table.slice(offset, slice_size)
-
-        samples: List[Dict[str, object]] = []
-        columns = sliced.to_pydict()
-
-        for idx in range(slice_size):
-            samples.append({
-                'id': offset + idx,
-                'prompt': columns.get('prompt', [''])[idx],
-                'prompt_type': columns.get('prompt_type', [''])[idx],
-                'dataset_source': columns.get('dataset_source', [''])[idx]
-            })
+        # Slicing is zero-copy; only the projected columns of this page are converted
+        sliced = self._slice(offset, slice_size)
 
         return {
-            'samples': samples,
+            'samples': self._rows_to_samples(sliced, range(offset, offset + slice_size), fields, prompt_chars),
             'total': total,
             'matched': slice_size
         }
 
-    def search_samples(self, query: str, limit: int = 50) -> Dict[str, object]:
+    def search_samples(self, query: str, limit: int = 50, filters: Optional[Dict[str, object]] = None,
+                       valid_only: bool = False) -> Dict[str, object]:
         if not self.ready:
             raise DatasetLoaderError("数据集尚未加载")
 
-        if not query:
+        terms = tokenize_query(query or '')
+        active_filters = self._active_filters(filters)
+        if active_filters or valid_only or (terms and Config.DATASET_SEARCH_BACKEND == 'compute'):
+            return self.filter_samples(query=query, filters=active_filters, limit=limit, valid_only=valid_only)
+        if not terms:
             return self.list_samples(limit=limit)
 
         limit = max(min(limit, 100), 1)
-        normalized = query.lower()
+        prompt_index = self._ensure_prompt_index()
+        matched_ids = prompt_index.search(terms, self._verify_prompt_terms)
 
-        data = self._table.to_pydict()
-        prompts = data.get('prompt', [])
-        prompt_types = data.get('prompt_type', [])
-        sources = data.get('dataset_source', [])
+        return {
+            'samples': self._summaries(matched_ids[:limit]),
+            'total': self.size,
+            'matched': len(matched_ids)
+        }
 
-        samples: List[Dict[str, object]] = []
-        matched_count = 0
-
-        for idx, prompt in enumerate(prompts):
-            prompt_text = prompt or ''
-            if normalized in prompt_text.lower():
-                matched_count += 1
-                if len(samples) < limit:
-                    samples.append({
-                        'id': idx,
-                        'prompt': prompt_text,
-                        'prompt_type': prompt_types[idx] if idx < len(prompt_types) else '',
-                        'dataset_source': sources[idx] if idx < len(sources) else ''
-                    })
+    def filter_samples(self, query: str = '', filters: Optional[Dict[str, object]] = None,
+                       offset: int = 0, limit: int = 50, valid_only: bool = False) -> Dict[str, object]:
+        """
+        Keyword search combined with exact-match column filters.
+
+        Everything runs as Arrow compute kernels over the prompt and filter
+        columns; no per-row Python objects are created except for the page
+        that is returned.
+
+        Args:
+            query: whitespace-separated terms, all of which must appear in the prompt
+            filters: column -> value or list of values (see FILTER_COLUMNS)
+            offset: index of the first match to return
+            limit: maximum number of samples to return
+            valid_only: skip samples whose HTML fails validation
+        """
+        if not self.ready:
+            raise DatasetLoaderError("数据集尚未加载")
+
+        offset = max(offset, 0)
+        limit = max(min(limit, 100), 1)
+        matched_ids = self._compute_matches(tokenize_query(query or ''), self._active_filters(filters))
+        if valid_only:
+            matched_ids = matched_ids[self._require_validity()[0][matched_ids]]
 
         return {
-            'samples': samples,
+            'samples': self._summaries(matched_ids[offset:offset + limit].tolist()),
             'total': self.size,
-            'matched': matched_count
+            'matched': int(matched_ids.size)
         }
 
+    def _active_filters(self, filters: Optional[Dict[str, object]]) -> Dict[str, List[str]]:
+        """Validate filters and normalize each value to a list, dropping empty ones."""
+        active: Dict[str, List[str]] = {}
+        for name, value in (filters or {}).items():
+            if value is None or value == '' or value == []:
+                continue
+            if name not in self.FILTER_COLUMNS:
+                raise DatasetLoaderError(f"不支持的过滤字段: {name}")
+            active[name] = [str(item) for item in value] if isinstance(value, (list, tuple)) else [str(value)]
+        return active
+
+    def _select_rows(self, filters: Dict[str, List[str]], valid_only: bool) -> np.ndarray:
+        """Row ids passing the facet filters (and validity), by bitmap intersection."""
+        facet_index = self._ensure_facet_index()
+        packed = facet_index.mask(filters)
+        if valid_only:
+            np.bitwise_and(packed, np.packbits(self._require_validity()[0]), out=packed)
+        return facet_index.rows(packed)
+
+    def _compute_matches(self, terms: Sequence[str], filters: Dict[str, List[str]]) -> np.ndarray:
+        """Row ids matching all terms and filters, as a sorted int64 array."""
+        if not terms:
+            if not filters:
+                return np.arange(self.size, dtype=np.int64)
+            return self._select_rows(filters, valid_only=False)
+
+        if 'prompt' not in self.schema.names:
+            return np.empty(0, dtype=np.int64)
+        # Terms must be lowered by the same kernel as the column they are matched against
+        mask = self._match_terms(self._prompt_lower(), lowercase_terms(terms))
+        if filters:
+            facet_index = self._ensure_facet_index()
+            mask &= np.unpackbits(facet_index.mask(filters), count=self.size).astype(bool)
+        return np.flatnonzero(mask)
+
+    @staticmethod
+    def _match_terms(lowered: Union[pa.Array, pa.ChunkedArray], terms: Sequence[str]) -> np.ndarray:
+        """Boolean mask of lowercased prompts containing every term."""
+        mask = None
+        for term in terms:
+            term_mask = pc.match_substring(lowered, term)
+            mask = term_mask if mask is None else pc.and_(mask, term_mask)
+        # Null prompts never match
+        return pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+
+    def _verify_prompt_terms(self, row_ids: np.ndarray, terms: Sequence[str]) -> np.ndarray:
+        """
+        Check prompt index candidates against the real prompts.
+
+        Only the candidate rows are gathered from the memory-mapped column and
+        lowercased, as Arrow arrays; no Python strings are created.
+        """
+        if 'prompt' not in self.schema.names:
+            return np.zeros(len(row_ids), dtype=bool)
+        if len(row_ids) == self.size:
+            lowered = self._prompt_lower()
+        else:
+            lowered = pc.utf8_lower(self._take(row_ids, ['prompt']).column('prompt'))
+        return self._match_terms(lowered, terms)
+
+    def _prompt_lower(self) -> pa.ChunkedArray:
+        """Lowercased prompt column, computed once."""
+        with self._prompt_lower_lock:
+            if self._prompt_lower_column is None:
+                self._prompt_lower_column = pc.utf8_lower(self._full_table().column('prompt'))
+            return self._prompt_lower_column
+
+    def warm_up(self, progress: Optional[Callable[[str, float], None]] = None):
+        """
+        Open every shard and load (or build) the search and facet indexes ahead of the first request.
+
+        Args:
+            progress: optional callback receiving (phase, percent) where phase is
+                'loading', 'indexing' or 'validating'
+        """
+        report = progress or (lambda phase, percent: None)
+        for idx, shard in enumerate(self.shards):
+            shard.open()
+            report('loading', (idx + 1) * 100.0 / len(self.shards))
+        self._full_table()
+
+        report('indexing', 0.0)
+        self._ensure_prompt_index(
+            progress=lambda done, total: report('indexing', done * 50.0 / max(total, 1))
+        )
+        # The similarity index reports the second half of the indexing phase
+        self._ensure_similarity_index(
+            progress=lambda done, total: report('indexing', 50.0 + done * 50.0 / max(total, 1))
+        )
+        self._ensure_facet_index()
+        report('indexing', 100.0)
+
+        if Config.DATASET_PRECOMPUTE_VALIDITY:
+            report('validating', 0.0)
+            self.sample_validity(
+                progress=lambda done, total: report('validating', done * 100.0 / max(total, 1))
+            )
+
+    def _ensure_prompt_index(self, progress: Optional[Callable[[int, int], None]] = None) -> PromptIndex:
+        """Load the persisted prompt index, building it on first use."""
+        with self._index_lock:
+            if self._prompt_index is None:
+                path = self.artifact_path('prompt-index')
+                prompt_index = PromptIndex.load(path, self.size)
+                if prompt_index is None:
+                    # Index the same Arrow-lowercased column that candidates are
+                    # verified against (_verify_prompt_terms); Python's str.lower()
+                    # differs for characters such as 'İ'. Converted slice by slice.
+                    if 'prompt' in self.schema.names:
+                        lowered = self._prompt_lower()
+                        prompts_lower = (
+                            prompt or ''
+                            for offset in range(0, self.size, 10000)
+                            for prompt in lowered.slice(offset, 10000).to_pylist()
+                        )
+                    else:
+                        prompts_lower = ('' for _ in range(self.size))
+                    prompt_index = PromptIndex.build(prompts_lower, self.size, progress=progress)
+                    prompt_index.save(path)
+                self._prompt_index = prompt_index
+            return self._prompt_index
+
+    def similar_samples(self, query: str = '', sample_id: Optional[int] = None,
+                        limit: int = 10) -> Dict[str, object]:
+        """
+        Samples whose prompts are most similar to a text or to another sample's prompt.
+
+        Args:
+            query: free text to match against prompts
+            sample_id: use this sample's prompt as the query instead (the sample itself is excluded)
+            limit: number of results (1-100)
+
+        Returns:
+            {'samples': summaries with a 'score' (cosine similarity), 'total': dataset size}
+        """
+        if not self.ready:
+            raise DatasetLoaderError("数据集尚未加载")
+
+        limit = max(min(limit, 100), 1)
+        if sample_id is not None:
+            if sample_id < 0 or sample_id >= self.size:
+                raise DatasetLoaderError("样本 ID 超出范围")
+            shard, local_row = self._locate(sample_id)
+            query = (shard.row(local_row).get('prompt') or [''])[0] or ''
+        if not query.strip():
+            return {'samples': [], 'total': self.size}
+
+        # Ask for one extra hit so the source sample can be dropped
+        hits = self._ensure_similarity_index().query(query, k=limit + 1)
+        hits = [(row_id, score) for row_id, score in hits if row_id != sample_id][:limit]
+
+        samples = self._summaries([row_id for row_id, _ in hits])
+        for sample, (_, score) in zip(samples, hits):
+            sample['score'] = score
+        return {'samples': samples, 'total': self.size}
+
+    def _ensure_similarity_index(self, progress: Optional[Callable[[int, int], None]] = None
+                                 ) -> SimilarityIndex:
+        """Load the persisted similarity index, building it on first use."""
+        with self._similarity_lock:
+            if self._similarity_index is None:
+                path = self.artifact_path('similarity-index')
+                similarity_index = SimilarityIndex.load(path, self.size)
+                if similarity_index is None:
+                    if 'prompt' in self.schema.names:
+                        prompts = self._full_table().column('prompt').to_pylist()
+                    else:
+                        prompts = [''] * self.size
+                    similarity_index = SimilarityIndex.build(prompts, progress=progress)
+                    similarity_index.save(path)
+                self._similarity_index = similarity_index
+            return self._similarity_index
+
+    def facets(self) -> Dict[str, object]:
+        """
+        Facet value counts and HTML length distributions from the facet index.
+
+        Returns:
+            {'facets': {column: [{'value', 'count', 'html_length'}]},
+             'html_length': overall distribution with a histogram, 'total': dataset size}
+        """
+        if not self.ready:
+            raise DatasetLoaderError("数据集尚未加载")
+        return dict(self._ensure_facet_index().summary(), total=self.size)
+
+    def _ensure_facet_index(self) -> FacetIndex:
+        """
+        Load the persisted facet index, building it with one columnar pass on first use.
+
+        Facet columns are dictionary-encoded and HTML sizes come from the
+        column's offsets (byte lengths), so the HTML bodies are never read.
+        """
+        with self._facet_lock:
+            if self._facet_index is None:
+                path = self.artifact_path('facets')
+                facet_index = FacetIndex.load(path, self.size)
+                if facet_index is None:
+                    table = self._full_table()
+                    facet_codes: Dict[str, Tuple[List[str], np.ndarray]] = {}
+                    for name in self.FILTER_COLUMNS:
+                        if name not in table.column_names:
+                            continue
+                        encoded = table.column(name).combine_chunks().dictionary_encode()
+                        codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False)
+                        facet_codes[name] = ([str(value) for value in encoded.dictionary.to_pylist()], codes)
+                    if 'html' in table.column_names:
+                        html_lengths = pc.fill_null(pc.binary_length(table.column('html')), 0)
+                        html_lengths = html_lengths.to_numpy().astype(np.int64)
+                    else:
+                        html_lengths = np.zeros(self.size, dtype=np.int64)
+                    facet_index = FacetIndex.build(facet_codes, html_lengths)
+                    facet_index.save(path)
+                self._facet_index = facet_index
+            return self._facet_index
+
+    def _summaries(self, row_ids: Sequence[int]) -> List[Dict[str, object]]:
+        """Summary dicts for the given rows, reading only the summary columns."""
+        if not row_ids:
+            return []
+        rows = self._take(row_ids, self.SUMMARY_COLUMNS)
+        return self._rows_to_samples(rows, row_ids, list(self.SUMMARY_COLUMNS), 0)
+
+    def _resolve_fields(self, fields: Optional[Sequence[str]]) -> List[str]:
+        """Validate requested listing fields ('id' is always included)."""
+        if not fields:
+            return list(self.SUMMARY_COLUMNS)
+        resolved: List[str] = []
+        for name in fields:
+            if name == 'id' or name in resolved:
+                continue
+            if name not in self.LIST_FIELDS:
+                raise DatasetLoaderError(f"不支持的字段: {name}")
+            resolved.append(name)
+        return resolved
+
+    def _rows_to_samples(self, table: pa.Table, row_ids: Sequence[int], fields: Sequence[str],
+                         prompt_chars: int) -> List[Dict[str, object]]:
+        """Convert the requested columns of `table` (rows aligned with row_ids) to dicts."""
+        columns: Dict[str, list] = {}
+        for name in fields:
+            if name not in table.column_names:
+                continue
+            column = table.column(name)
+            if name == 'prompt' and prompt_chars > 0:
+                column = pc.utf8_slice_codeunits(column, 0, prompt_chars)
+            columns[name] = column.to_pylist()
+
+        samples: List[Dict[str, object]] = []
+        for idx, row_id in enumerate(row_ids):
+            sample: Dict[str, object] = {'id': row_id}
+            for name in fields:
+                if name in columns:
+                    sample[name] = columns[name][idx]
+                else:
+                    sample[name] = row_id if name == 'original_index' else ''
+            samples.append(sample)
+        return samples
+
+    def get_prepared_sample(self, sample_id: int) -> Dict[str, object]:
+        """
+        Sample with its cleaned HTML and validation result, cached per (fingerprint, id).
+
+        Returns:
+            {'sample': get_sample() result, 'html': cleaned HTML or None,
+             'valid': bool, 'error': validation message or None}
+        """
+        key = (self.fingerprint, sample_id)
+        with self._sample_cache_lock:
+            prepared = self._sample_cache.get(key)
+            if prepared is not None:
+                self._sample_cache.move_to_end(key)
+                self._sample_cache_stats['hits'] += 1
+                return prepared
+            self._sample_cache_stats['misses'] += 1
+
+        sample = self.get_sample(sample_id)
+        cleaned_html = None
+        is_valid, error_msg = False, None
+        if sample.get('html'):
+            cleaned_html = HTMLProcessor.clean_markdown_code_block(sample['html'])
+            is_valid, error_msg = HTMLProcessor.validate_html(cleaned_html)
+        prepared = {'sample': sample, 'html': cleaned_html, 'valid': is_valid, 'error': error_msg}
+
+        with self._sample_cache_lock:
+            self._sample_cache[key] = prepared
+            while len(self._sample_cache) > Config.DATASET_SAMPLE_CACHE_SIZE:
+                self._sample_cache.popitem(last=False)
+        return prepared
+
+    def sample_cache_stats(self) -> Dict[str, int]:
+        with self._sample_cache_lock:
+            return dict(self._sample_cache_stats, entries=len(self._sample_cache))
+
+    def sample_validity(self, progress: Optional[Callable[[int, int], None]] = None
+                        ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per-row (valid, cleaned_length) arrays, loaded from disk or computed once.
+
+        Computing cleans and validates every row's HTML one record batch at a
+        time and persists the result as sample-validity-<fingerprint>.npz.
+        """
+        with self._validity_lock:
+            if self._validity is None:
+                path = self.artifact_path('sample-validity')
+                self._validity = self._load_validity(path)
+                if self._validity is None:
+                    self._validity = self._compute_validity(progress)
+                    # Write-then-rename so other worker processes never load a torn file
+                    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+                    try:
+                        np.savez(tmp_path, valid=self._validity[0], cleaned_length=self._validity[1])
+                        os.replace(tmp_path, path)
+                    except OSError:
+                        pass
+            return self._validity
+
+    def cached_validity(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Validity arrays if already computed (in memory or persisted); never computes or waits.
+
+        Returns None while the arrays are missing or being computed, see
+        DatasetWarmup.ensure_validity.
+        """
+        if self._validity is not None:
+            return self._validity
+        if not self._validity_lock.acquire(blocking=False):
+            return None
+        try:
+            if self._validity is None:
+                self._validity = self._load_validity(self.artifact_path('sample-validity'))
+            return self._validity
+        finally:
+            self._validity_lock.release()
+
+    @property
+    def validity_ready(self) -> bool:
+        return self.cached_validity() is not None
+
+    def _require_validity(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Validity arrays for request paths, which must never compute them."""
+        validity = self.cached_validity()
+        if validity is None:
+            raise DatasetLoaderError("样本有效性尚未计算完成")
+        return validity
+
+    def _load_validity(self, path: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                valid, lengths = data['valid'], data['cleaned_length']
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        if valid.shape != (self.size,) or lengths.shape != (self.size,):
+            return None
+        return valid, lengths
+
+    def _compute_validity(self, progress: Optional[Callable[[int, int], None]]
+                          ) -> Tuple[np.ndarray, np.ndarray]:
+        valid = np.zeros(self.size, dtype=bool)
+        lengths = np.zeros(self.size, dtype=np.int64)
+        row_id = 0
+        for shard in self.shards:
+            table = shard.open()
+            if 'html' not in table.column_names:
+                row_id += table.num_rows
+                continue
+            for chunk in table.column('html').chunks:
+                for html in chunk.to_pylist():
+                    if html:
+                        cleaned = HTMLProcessor.clean_markdown_code_block(html)
+                        valid[row_id] = HTMLProcessor.validate_html(cleaned)[0]
+                        lengths[row_id] = len(cleaned)
+                    row_id += 1
+                if progress:
+                    progress(row_id, self.size)
+        return valid, lengths
+
     def get_sample(self, sample_id: int) -> Dict[str, object]:
         if not self.ready:
             raise DatasetLoaderError("数据集尚未加载")
@@ -141,7 +818,8 @@ class DatasetLoader:
         if sample_id < 0 or sample_id >= self.size:
             raise DatasetLoaderError("样本 ID 超出范围")
 
-        row = self._table.slice(sample_id, 1).to_pydict()
+        shard, local_row = self._locate(sample_id)
+        row = shard.row(local_row)
         return {
             'id': sample_id,
             'prompt': row.get('prompt', [''])[0],
@@ -155,3 +833,137 @@ class DatasetLoader:
 def get_dataset_loader() -> DatasetLoader:
     """Helper to get singleton dataset loader."""
     return DatasetLoader.get_instance()
+
+
+class DatasetWarmup:
+    """
+    Load the dataset in a background thread and report progress.
+
+    States: idle -> loading -> indexing -> [validating] -> ready (or error).
+
+    Per-row sample validity is only computed here: during warm-up when
+    DATASET_PRECOMPUTE_VALIDITY is set, otherwise on the first request that
+    needs it (ensure_validity), in its own thread with its own state.
+    """
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    BUSY_STATES = ('loading', 'indexing', 'validating')
+
+    def __init__(self):
+        self._mutex = Lock()
+        self._thread: Optional[Thread] = None
+        self._state = 'idle'
+        self._progress = 0.0
+        self._error: Optional[str] = None
+        self._validation_thread: Optional[Thread] = None
+        self._validation_state = 'idle'
+        self._validation_progress = 0.0
+        self._validation_error: Optional[str] = None
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def start(self) -> bool:
+        """Start warming up; returns False if already started."""
+        with self._mutex:
+            if self._thread is not None:
+                return False
+            self._state = 'loading'
+            self._thread = Thread(target=self._run, name='dataset-warmup', daemon=True)
+        self._thread.start()
+        return True
+
+    @property
+    def busy(self) -> bool:
+        return self._state in self.BUSY_STATES
+
+    def status(self) -> Dict[str, object]:
+        with self._mutex:
+            return {
+                'state': self._state,
+                'progress': round(self._progress, 1),
+                'error': self._error,
+                'validation': {
+                    'state': self._validation_state,
+                    'progress': round(self._validation_progress, 1),
+                    'error': self._validation_error
+                }
+            }
+
+    def ensure_validity(self) -> bool:
+        """
+        Return True if sample validity is available; otherwise start computing
+        it in a background thread (unless already running) and return False.
+        """
+        if get_dataset_loader().validity_ready:
+            return True
+        with self._mutex:
+            if self._validation_thread is not None and self._validation_thread.is_alive():
+                return False
+            self._validation_state = 'validating'
+            self._validation_progress = 0.0
+            self._validation_error = None
+            self._validation_thread = Thread(target=self._run_validation, name='dataset-validity', daemon=True)
+        self._validation_thread.start()
+        return False
+
+    def _report(self, phase: str, percent: float):
+        with self._mutex:
+            self._state = phase
+            self._progress = min(max(percent, 0.0), 100.0)
+
+    def _run(self):
+        try:
+            get_dataset_loader().warm_up(progress=self._report)
+        except Exception as exc:  # pylint: disable=broad-except
+            with self._mutex:
+                self._state = 'error'
+                self._error = str(exc)
+            return
+        if Config.DATASET_PRECOMPUTE_VALIDITY:
+            with self._mutex:
+                self._validation_state = 'ready'
+                self._validation_progress = 100.0
+        self._report('ready', 100.0)
+
+    def _report_validation(self, done: int, total: int):
+        with self._mutex:
+            self._validation_progress = done * 100.0 / max(total, 1)
+
+    def _run_validation(self):
+        try:
+            get_dataset_loader().sample_validity(progress=self._report_validation)
+        except Exception as exc:  # pylint: disable=broad-except
+            with self._mutex:
+                self._validation_state = 'error'
+                self._validation_error = str(exc)
+            return
+        with self._mutex:
+            self._validation_state = 'ready'
+            self._validation_progress = 100.0
+
+
+def get_dataset_warmup() -> DatasetWarmup:
+    """Helper to get the singleton dataset warm-up tracker."""
+    return DatasetWarmup.get_instance()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Precompute dataset artifacts next to the Arrow files.')
+    parser.add_argument('task', choices=['precompute'], help='build the search and facet indexes and sample validity flags')
+    args = parser.parse_args()
+
+    loader = get_dataset_loader()
+    loader.warm_up(progress=lambda phase, percent: print(f"{phase}: {percent:.0f}%"))
+    valid_flags, _ = loader.sample_validity(
+        progress=lambda done, total: print(f"validating: {done}/{total}")
+    )
+    print(f"{int(valid_flags.sum())}/{loader.size} samples have valid HTML")
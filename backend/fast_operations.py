@@ -0,0 +1,136 @@
+"""
+快速操作执行模块
+在服务端把快速模式的 JSON 操作应用到 HTML 上（语义与前端 DOMPatcher 一致），
+使快速模式的结果也能写入会话历史
+"""
+from typing import Dict, List, Optional, Tuple
+
+from selectolax.lexbor import LexborHTMLParser, SelectolaxError
+
+
+class FastOperationExecutor:
+    """快速操作执行器（基于 Lexbor 解析器与 CSS 选择器）"""
+
+    @classmethod
+    def apply(cls, html_content: str, operations: List[dict]) -> Tuple[str, Dict]:
+        """
+        应用操作列表到 HTML
+
+        单个操作失败（选择器无效、未匹配到元素、字段无法应用或匹配的元素不适用该操作）
+        不会中断其余操作。
+
+        Args:
+            html_content: 原始 HTML
+            operations: 已通过 validate_fast_operations 校验的操作数组
+
+        Returns:
+            (修改后的 HTML, 报告) 元组
+            - 报告: {'applied': 生效的操作数, 'matched_elements': 修改的元素数,
+                    'failed': [{'index', 'selector', 'error'}]}
+        """
+        parser = LexborHTMLParser(html_content)
+        report = {'applied': 0, 'matched_elements': 0, 'failed': []}
+
+        for index, operation in enumerate(operations, start=1):
+            selector = operation['selector']
+            try:
+                elements = parser.css(selector)
+            except (SelectolaxError, TypeError, ValueError):
+                report['failed'].append({'index': index, 'selector': selector, 'error': '选择器无效'})
+                continue
+            if not elements:
+                report['failed'].append({'index': index, 'selector': selector, 'error': '未找到匹配的元素'})
+                continue
+
+            # 操作类型已校验，与处理方法一一对应（如 style_change -> _style_change）；
+            # 可选的 _check_<type> 在修改前检查全部元素，返回错误描述时整个操作视为失败
+            check = getattr(cls, f"_check_{operation['type']}", None)
+            error = check(elements) if check else None
+            if error:
+                report['failed'].append({'index': index, 'selector': selector, 'error': error})
+                continue
+            handler = getattr(cls, f"_{operation['type']}")
+            try:
+                for element in elements:
+                    handler(element, operation)
+            except (TypeError, ValueError) as exc:
+                report['failed'].append({'index': index, 'selector': selector, 'error': f'操作无法应用: {exc}'})
+                continue
+            report['applied'] += 1
+            report['matched_elements'] += len(elements)
+
+        return parser.html or '', report
+
+    @staticmethod
+    def _parse_inline_styles(style: str) -> Dict[str, str]:
+        """解析内联样式字符串为有序字典"""
+        styles: Dict[str, str] = {}
+        for rule in (style or '').split(';'):
+            prop, _, value = rule.partition(':')
+            prop, value = prop.strip(), value.strip()
+            if prop and value:
+                styles[prop] = value
+        return styles
+
+    @staticmethod
+    def _set_styles(element, styles: Dict[str, str]):
+        element.attrs['style'] = '; '.join(f"{prop}: {value}" for prop, value in styles.items())
+
+    @classmethod
+    def _style_change(cls, element, operation: dict):
+        styles = cls._parse_inline_styles(element.attrs.get('style'))
+        styles[operation['property']] = str(operation['value'])
+        cls._set_styles(element, styles)
+
+    @staticmethod
+    def _text_nodes(element) -> list:
+        """元素的非空直接文本节点"""
+        return [
+            node for node in element.iter(include_text=True)
+            if node.is_text_node and (node.text_content or '').strip()
+        ]
+
+    @classmethod
+    def _check_text_replace(cls, elements) -> Optional[str]:
+        # 与 DOMPatcher 一致：没有直接文本节点时不做替换（追加文本会与子元素文本拼接）
+        if any(not cls._text_nodes(element) for element in elements):
+            return '匹配的元素没有可替换的直接文本'
+        return None
+
+    @classmethod
+    def _text_replace(cls, element, operation: dict):
+        """替换直接文本节点，保留子元素"""
+        text_nodes = cls._text_nodes(element)
+        text_nodes[0].replace_with(str(operation['newText']))
+        # 其余直接文本节点清空，避免新旧文本混排
+        for node in text_nodes[1:]:
+            node.replace_with('')
+
+    @staticmethod
+    def _attribute_modify(element, operation: dict):
+        element.attrs[operation['attribute']] = str(operation['value'])
+
+    @staticmethod
+    def _class_toggle(element, operation: dict):
+        class_name, action = operation['className'], operation['action']
+        classes = [name for name in (element.attrs.get('class') or '').split() if name]
+        if action == 'add' and class_name not in classes:
+            classes.append(class_name)
+        elif action == 'remove':
+            classes = [name for name in classes if name != class_name]
+        elif action == 'toggle':
+            if class_name in classes:
+                classes.remove(class_name)
+            else:
+                classes.append(class_name)
+        element.attrs['class'] = ' '.join(classes)
+
+    @classmethod
+    def _visibility_toggle(cls, element, operation: dict):
+        styles = cls._parse_inline_styles(element.attrs.get('style'))
+        if operation['action'] == 'hide':
+            styles['display'] = 'none'
+        elif operation['action'] == 'show':
+            styles.pop('display', None)
+        cls._set_styles(element, styles)
+
@@ -0,0 +1,103 @@
+"""
+HTML 差异模块
+以标签边界切分 HTML，生成和应用紧凑的增量（delta）
+"""
+import re
+from difflib import SequenceMatcher
+from typing import List, Union
+
+# 在每个 '>' 或换行之后切分，压缩过的单行 HTML 也能得到细粒度的 token
+_TOKEN_PATTERN = re.compile(r'[^>\n]*[>\n]|[^>\n]+$')
+
+# delta 由两类操作组成：
+#   [start, end] - 复制源 token 区间
+#   "text"       - 插入新文本
+DeltaOp = Union[List[int], str]
+
+
+def tokenize(html_content: str) -> List[str]:
+    """将 HTML 切分为 token 列表，''.join(tokens) == html_content"""
+    if not html_content:
+        return []
+    return _TOKEN_PATTERN.findall(html_content)
+
+
+def make_delta(source: str, target: str) -> List[DeltaOp]:
+    """
+    计算从 source 到 target 的增量
+
+    Args:
+        source: 原 HTML
+        target: 新 HTML
+
+    Returns:
+        delta 操作列表
+    """
+    source_tokens = tokenize(source)
+    target_tokens = tokenize(target)
+
+    # 先剥离公共前后缀：多数编辑是局部的，可大幅缩小 SequenceMatcher 的输入
+    prefix = 0
+    limit = min(len(source_tokens), len(target_tokens))
+    while prefix < limit and source_tokens[prefix] == target_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < limit - prefix
+           and source_tokens[-1 - suffix] == target_tokens[-1 - suffix]):
+        suffix += 1
+
+    delta: List[DeltaOp] = []
+    if prefix:
+        delta.append([0, prefix])
+
+    source_mid = source_tokens[prefix:len(source_tokens) - suffix]
+    target_mid = target_tokens[prefix:len(target_tokens) - suffix]
+    matcher = SequenceMatcher(None, source_mid, target_mid)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            _append_copy(delta, prefix + i1, prefix + i2)
+        elif tag in ('replace', 'insert'):
+            text = ''.join(target_mid[j1:j2])
+            if delta and isinstance(delta[-1], str):
+                delta[-1] += text
+            else:
+                delta.append(text)
+        # 'delete' 无需记录：未被复制的源 token 自然被丢弃
+
+    if suffix:
+        _append_copy(delta, len(source_tokens) - suffix, len(source_tokens))
+    return delta
+
+
+def _append_copy(delta: List[DeltaOp], start: int, end: int):
+    """追加复制操作，与相邻的复制区间合并"""
+    if delta and isinstance(delta[-1], list) and delta[-1][1] == start:
+        delta[-1][1] = end
+    else:
+        delta.append([start, end])
+
+
+def apply_delta(source: str, delta: List[DeltaOp]) -> str:
+    """
+    将增量应用到 source
+
+    Args:
+        source: 原 HTML
+        delta: make_delta 生成的操作列表
+
+    Returns:
+        重建后的 HTML
+    """
+    source_tokens = tokenize(source)
+    parts = []
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(source_tokens[op[0]:op[1]])
+    return ''.join(parts)
+
+
+def delta_size(delta: List[DeltaOp]) -> int:
+    """估算增量占用的字节数（插入文本按 UTF-8 计，复制操作按固定开销计）"""
+    return sum(len(op.encode('utf-8')) if isinstance(op, str) else 16 for op in delta)
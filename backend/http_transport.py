@@ -0,0 +1,116 @@
+"""
+HTTP 传输模块
+进程级共享的连接池，复用到 LLM 提供商的 TCP/TLS 连接
+"""
+from threading import Lock
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+
+class HTTPTransport:
+    """
+    带连接池的 HTTP 传输层
+
+    所有 OpenAI 格式客户端共享同一个 requests.Session，
+    同一主机的请求复用 keep-alive 连接，避免每次编辑都重新握手。
+    """
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    def __init__(self, pool_connections: int, pool_maxsize: int):
+        """
+        初始化传输层
+
+        Args:
+            pool_connections: 缓存的主机连接池数量
+            pool_maxsize: 每个主机连接池的最大连接数
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._stats_lock = Lock()
+        self._request_counts: Dict[str, int] = {}
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=False
+        )
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    pool_connections=Config.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=Config.HTTP_POOL_MAXSIZE
+                )
+            return cls._instance
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """
+        通过共享连接池发送 POST 请求
+
+        Args:
+            url: 请求地址
+            **kwargs: 透传给 requests 的参数
+
+        Returns:
+            requests.Response 对象
+        """
+        host = requests.utils.urlparse(url).netloc
+        with self._stats_lock:
+            self._request_counts[host] = self._request_counts.get(host, 0) + 1
+        return self.session.post(url, **kwargs)
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        获取连接池统计信息
+
+        Returns:
+            包含每个主机连接数、空闲连接数和请求数的字典
+        """
+        hosts: Dict[str, Dict[str, int]] = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            hosts[host] = {
+                'connections_opened': pool.num_connections,
+                'requests_sent': pool.num_requests,
+                'idle_connections': pool.pool.qsize() if pool.pool else 0
+            }
+
+        with self._stats_lock:
+            request_counts = dict(self._request_counts)
+
+        total_requests = sum(request_counts.values())
+        total_connections = sum(item['connections_opened'] for item in hosts.values())
+
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'total_requests': total_requests,
+            'total_connections_opened': total_connections,
+            'reused_requests': max(total_requests - total_connections, 0),
+            'requests_by_host': request_counts,
+            'pools': hosts
+        }
+
+    def close(self):
+        """关闭所有连接"""
+        self.session.close()
+
+
+def get_http_transport() -> HTTPTransport:
+    """获取进程级共享的 HTTP 传输层"""
+    return HTTPTransport.get_instance()
@@ -3,7 +3,11 @@
 用于判断指令应该使用快速模式还是完整模式
 """
 import re
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Iterable, Set
+
+from keyword_matcher import KeywordAutomaton
+from learned_router import get_learned_router
+
 
 class InstructionClassifier:
     """指令分类器类"""
@@ -52,6 +56,93 @@ class InstructionClassifier:
         'script', 'javascript',
     ]
     
+    # 纯样式修改模式
+    STYLE_PATTERNS = [
+        r'(改|变|修改|设置|调整).*(颜色|背景|字体|大小)',
+        r'(change|modify|set|adjust).*(color|background|font|size)',
+        r'将.*(颜色|背景|字体).*改',
+        r'make.*\s+(bigger|smaller|larger|red|blue|green|bold)',
+    ]
+    
+    # 内容添加模式
+    ADDITION_PATTERNS = [
+        r'(添加|新增|插入|加入).*(元素|组件|部分|section)',
+        r'(add|insert|append|create).*(element|component|section|div)',
+        r'在.*中.*添加',
+    ]
+    
+    # 以下由 _compile() 在模块导入时生成
+    _matcher: KeywordAutomaton = None
+    # 关键词编号 -> (简单权重, 复杂权重)，权重为关键词在列表中出现的次数
+    _weights: List[Tuple[int, int]] = []
+    _style_re = None
+    _addition_re = None
+    _sentence_re = re.compile(r'[。！？.!?；;]')
+    
+    @classmethod
+    def _compile(cls):
+        """
+        将关键词列表编译为单个多模式自动机，并把正则模式合并为预编译的分支表达式
+        
+        关键词去重后累计权重，因此重复出现的关键词（如 '颜色'）仍按出现次数计分。
+        修改关键词列表后需重新调用本方法。
+        """
+        weights: Dict[str, List[int]] = {}
+        for keyword in cls.SIMPLE_KEYWORDS:
+            weights.setdefault(keyword.lower(), [0, 0])[0] += 1
+        for keyword in cls.COMPLEX_KEYWORDS:
+            weights.setdefault(keyword.lower(), [0, 0])[1] += 1
+        
+        cls._matcher = KeywordAutomaton(weights)
+        cls._weights = [tuple(weights[pattern]) for pattern in cls._matcher.patterns]
+        cls._style_re = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in cls.STYLE_PATTERNS), re.IGNORECASE
+        )
+        cls._addition_re = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in cls.ADDITION_PATTERNS), re.IGNORECASE
+        )
+    
+    @classmethod
+    def keyword_weights(cls) -> List[Tuple[str, int, int]]:
+        """
+        返回去重后的关键词及其权重
+        
+        Returns:
+            (关键词, 简单权重, 复杂权重) 列表，顺序与自动机中的关键词编号一致
+        """
+        return [
+            (pattern, simple_weight, complex_weight)
+            for pattern, (simple_weight, complex_weight) in zip(cls._matcher.patterns, cls._weights)
+        ]
+    
+    @classmethod
+    def signature(cls, instruction: str) -> str:
+        """
+        指令签名：长度档位 + 命中的关键词集合，签名相同的指令视为同类（用于路由反馈）
+        
+        Args:
+            instruction: 用户输入的修改指令
+            
+        Returns:
+            签名字符串，如 'short:颜色+标题'
+        """
+        length = len(instruction)
+        bucket = 'short' if length <= 50 else 'medium' if length <= 200 else 'long'
+        return f"{bucket}:{'+'.join(cls.matched_keywords(instruction))}"
+    
+    @classmethod
+    def matched_keywords(cls, instruction: str) -> List[str]:
+        """
+        返回指令中出现的关键词（已转小写、去重）
+        
+        Args:
+            instruction: 用户输入的修改指令
+            
+        Returns:
+            关键词列表
+        """
+        return cls._matcher.find(instruction.lower())
+    
     @classmethod
     def classify(cls, instruction: str) -> Tuple[str, Dict]:
         """
@@ -65,28 +156,83 @@ class InstructionClassifier:
             - mode: 'fast' 或 'full'
             - metadata: 分类相关的元数据
         """
+        mode, metadata, _ = cls._classify(instruction)
+        return cls._route(instruction, mode, metadata), metadata
+    
+    @classmethod
+    def classify_many(cls, instructions: Iterable[str],
+                      include_keywords: bool = False) -> List[Tuple[str, Dict]]:
+        """
+        批量分类指令（重复指令只计算一次）
+        
+        Args:
+            instructions: 指令序列，None 视为空字符串
+            include_keywords: 是否在元数据中附带命中的关键词列表（'keywords'）
+            
+        Returns:
+            与输入顺序一致的 (mode, metadata) 列表
+        """
+        memo: Dict[str, Tuple[str, Dict]] = {}
+        results: List[Tuple[str, Dict]] = []
+        for instruction in instructions:
+            instruction = instruction or ''
+            cached = memo.get(instruction)
+            if cached is None:
+                mode, metadata, pattern_ids = cls._classify(instruction)
+                mode = cls._route(instruction, mode, metadata)
+                if include_keywords:
+                    metadata['keywords'] = [cls._matcher.patterns[idx] for idx in sorted(pattern_ids)]
+                cached = memo[instruction] = (mode, metadata)
+            results.append((cached[0], dict(cached[1])))
+        return results
+    
+    @classmethod
+    def _route(cls, instruction: str, heuristic_mode: str, metadata: Dict) -> str:
+        """
+        有已训练的路由模型时按模型概率决定模式，否则沿用关键词启发式结果
+        
+        Args:
+            instruction: 用户输入的修改指令
+            heuristic_mode: 启发式分类结果
+            metadata: 分类元数据（原地补充路由信息）
+            
+        Returns:
+            最终模式
+        """
+        prediction = get_learned_router().predict(instruction)
+        if prediction is None:
+            metadata['router'] = 'heuristic'
+            return heuristic_mode
+        probability, model = prediction
+        metadata.update({
+            'router': 'learned',
+            'router_version': model.version,
+            'fast_probability': round(probability, 4),
+            'fast_threshold': model.threshold,
+            'heuristic_mode': heuristic_mode
+        })
+        return 'fast' if probability >= model.threshold else 'full'
+    
+    @classmethod
+    def _classify(cls, instruction: str) -> Tuple[str, Dict, Set[int]]:
+        """分类指令，并返回命中的关键词编号"""
         instruction_lower = instruction.lower()
         
-        # 计算匹配分数
+        # 计算匹配分数：一次扫描找出所有出现的关键词，再按权重累加
         simple_score = 0
         complex_score = 0
-        
-        # 检查简单关键词
-        for keyword in cls.SIMPLE_KEYWORDS:
-            if keyword.lower() in instruction_lower:
-                simple_score += 1
-        
-        # 检查复杂关键词
-        for keyword in cls.COMPLEX_KEYWORDS:
-            if keyword.lower() in instruction_lower:
-                complex_score += 1
+        pattern_ids = cls._matcher.find_ids(instruction_lower)
+        for pattern_id in pattern_ids:
+            simple_weight, complex_weight = cls._weights[pattern_id]
+            simple_score += simple_weight
+            complex_score += complex_weight
         
         # 长度检查：过长的指令通常更复杂
         if len(instruction) > 200:
             complex_score += 2
         
         # 多句检查：包含多个句子通常更复杂
-        sentence_count = len(re.split(r'[。！？.!?；;]', instruction))
+        sentence_count = len(cls._sentence_re.split(instruction))
         if sentence_count > 3:
             complex_score += 1
         
@@ -107,43 +253,24 @@ class InstructionClassifier:
         
         # 如果复杂分数明显更高，使用完整模式
         if complex_score > simple_score + 1:
-            return 'full', metadata
+            return 'full', metadata, pattern_ids
         
         # 如果简单分数更高或相等，使用快速模式
         if simple_score > 0 and simple_score >= complex_score:
-            return 'fast', metadata
+            return 'fast', metadata, pattern_ids
         
         # 默认使用完整模式（保守策略）
-        return 'full', metadata
+        return 'full', metadata, pattern_ids
     
-    @staticmethod
-    def _is_pure_style_change(instruction: str) -> bool:
+    @classmethod
+    def _is_pure_style_change(cls, instruction: str) -> bool:
         """判断是否为纯样式修改"""
-        style_patterns = [
-            r'(改|变|修改|设置|调整).*(颜色|背景|字体|大小)',
-            r'(change|modify|set|adjust).*(color|background|font|size)',
-            r'将.*(颜色|背景|字体).*改',
-            r'make.*\s+(bigger|smaller|larger|red|blue|green|bold)',
-        ]
-        
-        for pattern in style_patterns:
-            if re.search(pattern, instruction, re.IGNORECASE):
-                return True
-        return False
+        return cls._style_re.search(instruction) is not None
     
-    @staticmethod
-    def _is_content_addition(instruction: str) -> bool:
+    @classmethod
+    def _is_content_addition(cls, instruction: str) -> bool:
         """判断是否为内容添加"""
-        addition_patterns = [
-            r'(添加|新增|插入|加入).*(元素|组件|部分|section)',
-            r'(add|insert|append|create).*(element|component|section|div)',
-            r'在.*中.*添加',
-        ]
-        
-        for pattern in addition_patterns:
-            if re.search(pattern, instruction, re.IGNORECASE):
-                return True
-        return False
+        return cls._addition_re.search(instruction) is not None
     
     @classmethod
     def should_use_fast_mode(cls, instruction: str) -> bool:
@@ -159,3 +286,5 @@ class InstructionClassifier:
         mode, _ = cls.classify(instruction)
         return mode == 'fast'
 
+
+InstructionClassifier._compile()
@@ -0,0 +1,92 @@
+"""
+多模式关键词匹配模块
+基于 Aho-Corasick 自动机，一次线性扫描即可找出文本中出现的所有关键词
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 多模式匹配自动机
+
+    构建时把所有关键词插入字典树并计算失败链接，匹配时对文本逐字符推进一次，
+    耗时与文本长度成正比，与关键词数量无关。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+        Args:
+            patterns: 关键词列表（调用方负责大小写归一化，重复项只保留一次）
+        """
+        self.patterns: List[str] = []
+        seen: Set[str] = set()
+        for pattern in patterns:
+            if pattern and pattern not in seen:
+                seen.add(pattern)
+                self.patterns.append(pattern)
+
+        # 字典树：_goto[state][char] -> 下一状态；_output[state] 为在该状态结束的关键词编号
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        """按广度优先计算失败链接，并把后缀状态的输出合并到当前状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state].extend(self._output[self._fail[next_state]])
+
+    def find_ids(self, text: str) -> Set[int]:
+        """
+        查找文本中出现的关键词
+
+        Args:
+            text: 待匹配文本
+
+        Returns:
+            出现过的关键词编号集合（对应 self.patterns 的下标）
+        """
+        found: Set[int] = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def find(self, text: str) -> List[str]:
+        """
+        查找文本中出现的关键词
+
+        Args:
+            text: 待匹配文本
+
+        Returns:
+            出现过的关键词（按构建顺序排列）
+        """
+        return [self.patterns[pattern_id] for pattern_id in sorted(self.find_ids(text))]
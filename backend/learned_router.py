@@ -0,0 +1,419 @@
+"""
+学习型路由模块
+基于字符 n-gram 的逻辑回归模型判断指令是否适合快速模式（纯 NumPy，CPU 推理）
+
+训练标签来自线上记录的快速模式结果（配置 ROUTER_OUTCOME_LOG 后才记录）：
+返回非空操作数组且在服务端全部干净应用记为成功；空数组、JSON 无效、结构无效、
+任一操作未命中元素或应用失败，以及调用失败都记为失败。
+缓存命中的结果不是新的观测，不记录；分类为完整模式的指令可按
+ROUTER_EXPLORATION_RATE 的比例改试快速模式，使其也能产生标签。
+模型按版本号保存在磁盘上，启动时加载；
+没有可用模型时由 InstructionClassifier 的关键词启发式兜底。
+"""
+import glob
+import json
+import os
+import random
+import re
+import time
+import zipfile
+import zlib
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import Config
+
+
+class RouterModel:
+    """哈希字符 n-gram 特征上的二分类逻辑回归模型"""
+
+    FORMAT_VERSION = 1
+    NGRAM_RANGE = (1, 3)
+    N_FEATURES = 1 << 18
+    # 仅取指令前若干字符提取特征，保证推理耗时有上界
+    MAX_CHARS = 512
+    FILE_PATTERN = re.compile(r'^router-v(\d+)\.npz$')
+
+    def __init__(self, weights: np.ndarray, bias: float, threshold: float = 0.5,
+                 version: int = 0, info: Optional[Dict[str, object]] = None):
+        """
+        Args:
+            weights: 特征权重（长度 N_FEATURES）
+            bias: 偏置
+            threshold: 快速模式概率阈值
+            version: 模型版本号
+            info: 训练信息（样本数、验证集准确率等）
+        """
+        self.weights = weights
+        self.bias = float(bias)
+        self.threshold = float(threshold)
+        self.version = version
+        self.info = info or {}
+
+    @classmethod
+    def features(cls, text: str) -> np.ndarray:
+        """
+        提取去重后的哈希特征编号
+
+        Args:
+            text: 指令文本
+
+        Returns:
+            int64 特征编号数组
+        """
+        padded = f" {(text or '').lower()[:cls.MAX_CHARS]} "
+        ids = set()
+        low, high = cls.NGRAM_RANGE
+        mask = cls.N_FEATURES - 1
+        for n in range(low, high + 1):
+            for pos in range(len(padded) - n + 1):
+                ids.add(zlib.crc32(padded[pos:pos + n].encode('utf-8')) & mask)
+        return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+    def predict_proba(self, text: str) -> float:
+        """
+        返回指令适合快速模式的概率
+
+        Args:
+            text: 指令文本
+
+        Returns:
+            0~1 之间的概率
+        """
+        ids = self.features(text)
+        if ids.size == 0:
+            logit = self.bias
+        else:
+            # 特征按 1/sqrt(特征数) 归一化，与训练时一致
+            logit = float(self.weights[ids].sum()) / np.sqrt(ids.size) + self.bias
+        return float(1.0 / (1.0 + np.exp(-logit)))
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[int], epochs: int = 300,
+              learning_rate: float = 0.05, l2: float = 1e-4,
+              holdout: float = 0.2, seed: int = 0) -> 'RouterModel':
+        """
+        全批量 Adam 训练逻辑回归（按类别频率加权，缓解快速/完整样本不均衡）
+
+        Args:
+            texts: 指令文本
+            labels: 1 表示快速模式成功，0 表示失败
+            epochs: 迭代轮数
+            learning_rate: 学习率
+            l2: L2 正则系数
+            holdout: 留出验证集比例（0 表示不留出）
+            seed: 划分验证集的随机种子
+
+        Returns:
+            训练好的模型（info 中包含样本数与验证集准确率）
+        """
+        labels_arr = np.asarray(labels, dtype=np.float64)
+        order = np.random.default_rng(seed).permutation(len(texts))
+        holdout_size = int(len(texts) * holdout)
+        valid_idx, train_idx = order[:holdout_size], order[holdout_size:]
+
+        rows, cols, values = cls._design_matrix([texts[idx] for idx in train_idx])
+        y = labels_arr[train_idx]
+        num_samples = y.size
+        positives = max(y.sum(), 1.0)
+        negatives = max(num_samples - y.sum(), 1.0)
+        sample_weight = np.where(y > 0, num_samples / (2 * positives), num_samples / (2 * negatives))
+
+        weights = np.zeros(cls.N_FEATURES, dtype=np.float64)
+        bias = 0.0
+        moment = np.zeros_like(weights)
+        velocity = np.zeros_like(weights)
+        bias_moment = bias_velocity = 0.0
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for step in range(1, epochs + 1):
+            logits = np.bincount(rows, weights=weights[cols] * values, minlength=num_samples) + bias
+            error = (1.0 / (1.0 + np.exp(-logits)) - y) * sample_weight / num_samples
+            grad = np.bincount(cols, weights=error[rows] * values, minlength=cls.N_FEATURES) + l2 * weights
+            grad_bias = error.sum()
+
+            moment = beta1 * moment + (1 - beta1) * grad
+            velocity = beta2 * velocity + (1 - beta2) * grad * grad
+            weights -= learning_rate * (moment / (1 - beta1 ** step)) / (
+                np.sqrt(velocity / (1 - beta2 ** step)) + eps)
+            bias_moment = beta1 * bias_moment + (1 - beta1) * grad_bias
+            bias_velocity = beta2 * bias_velocity + (1 - beta2) * grad_bias * grad_bias
+            bias -= learning_rate * (bias_moment / (1 - beta1 ** step)) / (
+                np.sqrt(bias_velocity / (1 - beta2 ** step)) + eps)
+
+        model = cls(weights.astype(np.float32), bias)
+        info: Dict[str, object] = {
+            'train_samples': int(num_samples),
+            'train_positive_rate': round(float(y.mean()), 4) if num_samples else 0.0,
+            'trained_at': int(time.time())
+        }
+        if holdout_size:
+            predictions = np.array([model.predict_proba(texts[idx]) >= model.threshold for idx in valid_idx])
+            info['holdout_samples'] = int(holdout_size)
+            info['holdout_accuracy'] = round(float((predictions == (labels_arr[valid_idx] > 0)).mean()), 4)
+        model.info = info
+        return model
+
+    @classmethod
+    def _design_matrix(cls, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """构建稀疏特征矩阵的 (行号, 列号, 值) 三元组"""
+        row_parts, col_parts, value_parts = [], [], []
+        for row, text in enumerate(texts):
+            ids = cls.features(text)
+            if ids.size == 0:
+                continue
+            row_parts.append(np.full(ids.size, row, dtype=np.int64))
+            col_parts.append(ids)
+            value_parts.append(np.full(ids.size, 1.0 / np.sqrt(ids.size)))
+        if not row_parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.float64)
+        return np.concatenate(row_parts), np.concatenate(col_parts), np.concatenate(value_parts)
+
+    def save(self, directory: str) -> str:
+        """
+        以下一个版本号保存模型（router-vNNNN.npz），已有版本不会被覆盖
+
+        Args:
+            directory: 模型目录
+
+        Returns:
+            保存路径
+        """
+        os.makedirs(directory, exist_ok=True)
+        versions = [version for version, _ in self.list_versions(directory)]
+        self.version = (max(versions) if versions else 0) + 1
+        path = os.path.join(directory, f"router-v{self.version:04d}.npz")
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            format_version=np.int64(self.FORMAT_VERSION),
+            n_features=np.int64(self.N_FEATURES),
+            weights=self.weights,
+            bias=np.float64(self.bias),
+            threshold=np.float64(self.threshold),
+            info=np.array(json.dumps(self.info))
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def list_versions(cls, directory: str) -> List[Tuple[int, str]]:
+        """列出目录中的 (版本号, 路径)，按版本号升序"""
+        versions = []
+        for path in glob.glob(os.path.join(directory, 'router-v*.npz')):
+            match = cls.FILE_PATTERN.match(os.path.basename(path))
+            if match:
+                versions.append((int(match.group(1)), path))
+        return sorted(versions)
+
+    @classmethod
+    def load(cls, path: str, version: int = 0) -> Optional['RouterModel']:
+        """加载模型文件，格式不兼容或损坏时返回 None"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if (int(data['format_version']) != cls.FORMAT_VERSION
+                        or int(data['n_features']) != cls.N_FEATURES):
+                    return None
+                return cls(
+                    data['weights'],
+                    float(data['bias']),
+                    threshold=float(data['threshold']),
+                    version=version,
+                    info=json.loads(str(data['info']))
+                )
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    @classmethod
+    def load_version(cls, directory: str, version: Optional[int] = None) -> Optional['RouterModel']:
+        """
+        加载指定版本，未指定时加载最新的可用版本
+
+        Args:
+            directory: 模型目录
+            version: 版本号，None 表示最新
+        """
+        for found_version, path in reversed(cls.list_versions(directory)):
+            if version is not None and found_version != version:
+                continue
+            model = cls.load(path, found_version)
+            if model is not None:
+                return model
+        return None
+
+
+class LearnedRouter:
+    """学习型路由器：持有当前模型，并记录快速模式结果作为训练标签"""
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    def __init__(self, model_dir: str, outcome_log: str, enabled: bool = True,
+                 version: Optional[int] = None, exploration_rate: float = 0.0):
+        """
+        Args:
+            model_dir: 模型目录
+            outcome_log: 快速模式结果日志（JSON Lines），为空则不记录
+            enabled: 是否启用模型推理
+            version: 固定加载的模型版本，None 表示最新
+            exploration_rate: 分类为完整模式的请求中改试快速模式的比例
+        """
+        self.model_dir = model_dir
+        self.outcome_log = outcome_log or None
+        self.enabled = enabled
+        self.pinned_version = version
+        self.exploration_rate = exploration_rate
+        self.model: Optional[RouterModel] = None
+        self._log_lock = Lock()
+        self._explorations = 0
+        self.reload()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    model_dir=Config.ROUTER_MODEL_DIR,
+                    outcome_log=Config.ROUTER_OUTCOME_LOG,
+                    enabled=Config.ROUTER_ENABLED,
+                    version=Config.ROUTER_MODEL_VERSION or None,
+                    exploration_rate=Config.ROUTER_EXPLORATION_RATE
+                )
+            return cls._instance
+
+    def reload(self) -> Optional[RouterModel]:
+        """重新从磁盘加载模型（训练出新版本后调用）"""
+        self.model = RouterModel.load_version(self.model_dir, self.pinned_version) if self.enabled else None
+        return self.model
+
+    def predict(self, instruction: str) -> Optional[Tuple[float, RouterModel]]:
+        """
+        预测指令适合快速模式的概率
+
+        Returns:
+            (概率, 使用的模型)，没有可用模型时返回 None
+        """
+        model = self.model
+        if model is None:
+            return None
+        return model.predict_proba(instruction), model
+
+    def explore(self, mode: str, metadata: Dict) -> str:
+        """
+        以 exploration_rate 的概率把完整模式改为快速模式
+
+        只走完整模式的指令不会产生快速模式结果，模型也就学不到它们其实能用快速模式处理；
+        探索请求失败时照常降级到完整模式，代价是一次额外的快速调用。
+
+        Args:
+            mode: 分类器给出的模式
+            metadata: 分类元数据（探索时原地补充 'explore'）
+
+        Returns:
+            最终模式
+        """
+        if mode != 'full' or not self.outcome_log or random.random() >= self.exploration_rate:
+            return mode
+        self._explorations += 1
+        metadata['explore'] = True
+        return 'fast'
+
+    def record_outcome(self, instruction: str, fast_success: bool, latency_ms: Optional[int] = None):
+        """
+        追加一条快速模式结果，供离线训练使用（写入失败时忽略）
+
+        Args:
+            instruction: 指令文本
+            fast_success: 快速模式是否返回了非空操作且全部干净应用（无未命中或失败的操作）
+            latency_ms: 快速模式调用耗时（毫秒）
+        """
+        if not self.outcome_log:
+            return
+        record = {
+            'instruction': instruction,
+            'fast_success': bool(fast_success),
+            'latency_ms': latency_ms,
+            'timestamp': int(time.time())
+        }
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._log_lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.outcome_log)), exist_ok=True)
+                with open(self.outcome_log, 'a', encoding='utf-8') as handle:
+                    handle.write(line)
+            except OSError:
+                pass
+
+    def status(self) -> Dict[str, object]:
+        """当前模型状态"""
+        model = self.model
+        return {
+            'enabled': self.enabled,
+            'model_version': model.version if model else None,
+            'threshold': model.threshold if model else None,
+            'info': model.info if model else None,
+            'exploration_rate': self.exploration_rate,
+            'explorations': self._explorations
+        }
+
+
+def get_learned_router() -> LearnedRouter:
+    """获取学习型路由器单例"""
+    return LearnedRouter.get_instance()
+
+
+def load_outcomes(path: str) -> Tuple[List[str], List[int]]:
+    """
+    读取快速模式结果日志
+
+    同一指令多次出现时每条记录都作为一个样本，损坏的行会被跳过。
+
+    Returns:
+        (指令列表, 标签列表)
+    """
+    texts: List[str] = []
+    labels: List[int] = []
+    with open(path, 'r', encoding='utf-8') as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and record.get('instruction'):
+                texts.append(str(record['instruction']))
+                labels.append(1 if record.get('fast_success') else 0)
+    return texts, labels
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Train the fast/full router from logged fast-mode outcomes.')
+    parser.add_argument('task', choices=['train', 'status'])
+    parser.add_argument('--log', default=Config.ROUTER_OUTCOME_LOG, help='outcome log (JSON Lines)')
+    parser.add_argument('--model-dir', default=Config.ROUTER_MODEL_DIR)
+    parser.add_argument('--epochs', type=int, default=300)
+    parser.add_argument('--min-samples', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.task == 'status':
+        for found_version, found_path in RouterModel.list_versions(args.model_dir):
+            loaded = RouterModel.load(found_path, found_version)
+            print(f"v{found_version}: {found_path} {json.dumps(loaded.info) if loaded else '(unreadable)'}")
+        raise SystemExit(0)
+
+    if not args.log:
+        raise SystemExit("no outcome log configured: set ROUTER_OUTCOME_LOG or pass --log")
+    if not os.path.exists(args.log):
+        raise SystemExit(f"outcome log not found: {args.log}")
+    train_texts, train_labels = load_outcomes(args.log)
+    if len(train_texts) < args.min_samples:
+        raise SystemExit(f"only {len(train_texts)} outcomes logged, need at least {args.min_samples}")
+    if len(set(train_labels)) < 2:
+        raise SystemExit("outcomes contain a single label; both successes and failures are needed")
+
+    trained = RouterModel.train(train_texts, train_labels, epochs=args.epochs)
+    saved_path = trained.save(args.model_dir)
+    print(f"saved {saved_path}: {json.dumps(trained.info)}")
@@ -0,0 +1,322 @@
+"""
+响应缓存模块
+按提示输入的哈希缓存 LLM 响应：内存 LRU 层（字节预算）+ 可选磁盘层，均支持 TTL
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterator, Optional, Tuple
+
+from api_clients import APIResponse, OpenAIFormatBase
+from config import Config
+from html_processor import HTMLProcessor
+from speculative_executor import parse_fast_operations, validate_fast_operations
+
+
+class ResponseCache:
+    """两级响应缓存"""
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    def __init__(self, max_bytes: int, ttl: int, disk_dir: Optional[str] = None):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 内存层字节预算
+            ttl: 条目有效期（秒）
+            disk_dir: 磁盘层目录，为空则不启用
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir or None
+        self._entries: "OrderedDict[str, Tuple[float, int, dict]]" = OrderedDict()
+        self._bytes = 0
+        self._mutex = Lock()
+        self._stats = {
+            'hits': 0,
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expired': 0
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    max_bytes=Config.RESPONSE_CACHE_MAX_BYTES,
+                    ttl=Config.RESPONSE_CACHE_TTL,
+                    disk_dir=Config.RESPONSE_CACHE_DIR
+                )
+            return cls._instance
+
+    @staticmethod
+    def make_key(kind: str, provider: str, model: str, temperature: float,
+                 instruction: str, html_code: str) -> str:
+        """
+        计算缓存键
+
+        Args:
+            kind: 调用类型（fast / full）
+            provider: 提供商名称
+            model: 模型名称
+            temperature: 采样温度
+            instruction: 修改指令
+            html_code: 原始 HTML
+
+        Returns:
+            SHA-256 十六进制摘要
+        """
+        digest = hashlib.sha256()
+        for part in (kind, provider, model, repr(temperature), instruction, html_code):
+            encoded = (part or '').encode('utf-8')
+            # 长度前缀避免字段拼接产生歧义
+            digest.update(len(encoded).to_bytes(8, 'big'))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[APIResponse]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            命中时返回 APIResponse，否则 None
+        """
+        now = time.time()
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return self._to_response(payload)
+                self._remove(key)
+                self._stats['expired'] += 1
+
+        payload = self._disk_get(key, now)
+        with self._mutex:
+            if payload is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            self._store_memory(key, payload, payload['expires_at'])
+        return self._to_response(payload)
+
+    def set(self, key: str, response: APIResponse):
+        """
+        写入缓存（仅缓存成功的响应）
+
+        Args:
+            key: 缓存键
+            response: APIResponse 对象
+        """
+        if not response.success:
+            return
+
+        expires_at = time.time() + self.ttl
+        payload = {
+            'content': response.content,
+            'metadata': response.metadata,
+            'expires_at': expires_at
+        }
+        with self._mutex:
+            self._store_memory(key, payload, expires_at)
+            self._stats['stores'] += 1
+        self._disk_set(key, payload)
+
+    def clear(self):
+        """清空内存层"""
+        with self._mutex:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, object]:
+        """获取命中率等统计信息"""
+        with self._mutex:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_bytes'] = self.max_bytes
+        stats['ttl'] = self.ttl
+        stats['disk_enabled'] = bool(self.disk_dir)
+        return stats
+
+    @staticmethod
+    def _to_response(payload: dict) -> APIResponse:
+        metadata = dict(payload.get('metadata') or {})
+        metadata['cached'] = True
+        return APIResponse(success=True, content=payload['content'], metadata=metadata)
+
+    def _store_memory(self, key: str, payload: dict, expires_at: float):
+        """写入内存层并按字节预算淘汰（调用方持有 _mutex）"""
+        size = len(payload['content'].encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, size, payload)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats['evictions'] += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> Optional[dict]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                payload = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if payload.get('expires_at', 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return payload
+
+    def _disk_set(self, key: str, payload: dict):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as handle:
+                json.dump(payload, handle, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 磁盘层写入失败不影响主流程
+            pass
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程级共享的响应缓存"""
+    return ResponseCache.get_instance()
+
+
+class CachedContent(str):
+    """stream_modify_html 命中缓存时输出的完整内容（普通字符串的子类，仅用于标记来源）"""
+
+
+class CachedAPIClient:
+    """
+    带响应缓存的客户端包装器
+    拦截 generate_fast_operations / modify_html / stream_modify_html，其余属性透传给被包装的客户端。
+    只缓存调用方能直接使用的结果：快速模式须解析出结构有效的操作数组，完整模式须清理后通过 HTML 校验，
+    否则一次失败的输出会在 TTL 内被反复重放。
+    """
+
+    # 与客户端请求体中的采样温度保持一致
+    FAST_TEMPERATURE = OpenAIFormatBase.FAST_TEMPERATURE
+    FULL_TEMPERATURE = OpenAIFormatBase.FULL_TEMPERATURE
+
+    def __init__(self, client, provider: str, model: str, cache: Optional[ResponseCache] = None):
+        """
+        初始化包装器
+
+        Args:
+            client: 被包装的 API 客户端
+            provider: 提供商名称
+            model: 模型名称
+            cache: 响应缓存，默认使用进程级共享实例
+        """
+        self.uncached = client
+        self.provider = provider
+        self.model = model
+        self.cache = cache or get_response_cache()
+
+    def __getattr__(self, name):
+        return getattr(self.uncached, name)
+
+    def _key(self, kind: str, temperature: float, instruction: str, html_code: str) -> str:
+        return self.cache.make_key(kind, self.provider, self.model, temperature, instruction, html_code)
+
+    @staticmethod
+    def _usable_fast(response: APIResponse) -> bool:
+        operations = parse_fast_operations(response)
+        return operations is not None and validate_fast_operations(operations) is None
+
+    @staticmethod
+    def _usable_full(response: APIResponse) -> bool:
+        if not response.success:
+            return False
+        is_valid, _ = HTMLProcessor.validate_html(HTMLProcessor.clean_markdown_code_block(response.content))
+        return is_valid
+
+    def generate_fast_operations(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """带缓存的快速模式调用"""
+        key = self._key('fast', self.FAST_TEMPERATURE, instruction, html_code)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.uncached.generate_fast_operations(instruction, html_code, max_retries=max_retries)
+        if self._usable_fast(response):
+            self.cache.set(key, response)
+        return response
+
+    def modify_html(self, instruction: str, html_code: str, max_retries: int = 3) -> APIResponse:
+        """带缓存的完整模式调用"""
+        key = self._key('full', self.FULL_TEMPERATURE, instruction, html_code)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.uncached.modify_html(instruction, html_code, max_retries=max_retries)
+        if self._usable_full(response):
+            self.cache.set(key, response)
+        return response
+
+    def stream_modify_html(self, instruction: str, html_code: str, max_retries: int = 3) -> Iterator[str]:
+        """
+        带缓存的流式完整模式调用，命中时一次性输出完整内容
+
+        命中时输出的分片为 CachedContent，调用方据此判断本次是否由缓存提供（客户端实例在请求间共享，
+        不能用实例属性传递）
+        """
+        key = self._key('full', self.FULL_TEMPERATURE, instruction, html_code)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield CachedContent(cached.content)
+            return
+
+        chunks = []
+        for delta in self.uncached.stream_modify_html(instruction, html_code, max_retries=max_retries):
+            chunks.append(delta)
+            yield delta
+
+        response = APIResponse(
+            success=True,
+            content=''.join(chunks).strip(),
+            metadata={'model': self.model, 'provider': self.provider}
+        )
+        if self._usable_full(response):
+            self.cache.set(key, response)
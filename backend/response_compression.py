@@ -0,0 +1,72 @@
+"""
+响应压缩模块
+按 Accept-Encoding 对较大的 JSON 响应进行 brotli（可选依赖）或 gzip 压缩
+"""
+import gzip
+from typing import Optional
+
+try:
+    import brotli  # 可选依赖：未安装时仅使用 gzip
+except ImportError:
+    brotli = None
+
+
+def choose_encoding(accept_encodings) -> Optional[str]:
+    """
+    根据客户端支持的编码选择压缩算法
+
+    Args:
+        accept_encodings: werkzeug 解析后的 Accept-Encoding（request.accept_encodings）
+
+    Returns:
+        'br'、'gzip' 或 None
+    """
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, accept_encodings, min_bytes: int, level: int = 6):
+    """
+    原地压缩 JSON 响应
+
+    流式响应、非 JSON 响应、已编码或小于 min_bytes 的响应保持不变。
+    带 ETag 的响应会为压缩后的表示追加编码后缀，保证强 ETag 与字节内容一一对应。
+
+    Args:
+        response: Flask 响应对象
+        accept_encodings: request.accept_encodings
+        min_bytes: 触发压缩的最小响应体字节数
+        level: 压缩级别（gzip 1-9，brotli 取相同数值作为 quality）
+
+    Returns:
+        响应对象
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < min_bytes:
+        return response
+
+    encoding = choose_encoding(accept_encodings)
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=level)
+    else:
+        compressed = gzip.compress(data, compresslevel=level)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
@@ -0,0 +1,237 @@
+"""
+路由评估模块
+在数据集的全部 prompt 上批量运行 InstructionClassifier，统计快速/完整模式分布、
+分数直方图与关键词命中次数，并写出列式（Arrow）报告，用于上线前调整路由阈值
+"""
+import os
+import time
+from collections import Counter
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from dataset_loader import DatasetLoader, DatasetLoaderError, get_dataset_loader
+from instruction_classifier import InstructionClassifier
+
+# 每批分类的行数
+BATCH_SIZE = 10000
+# 摘要中返回的高频关键词数量（完整统计见关键词报告文件）
+TOP_KEYWORDS = 50
+
+
+def _histogram(values: np.ndarray) -> List[Dict[str, int]]:
+    """整数分数直方图，按分数升序"""
+    scores, counts = np.unique(values, return_counts=True)
+    return [{'score': int(score), 'count': int(count)} for score, count in zip(scores, counts)]
+
+
+def _write_table(table: pa.Table, path: str):
+    """原子写入 Arrow 文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def evaluate_routing(loader: DatasetLoader, write_report: bool = True,
+                     progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, object]:
+    """
+    对数据集中每条 prompt 进行路由分类并汇总
+
+    Args:
+        loader: 数据集加载器
+        write_report: 是否写出逐行报告（routing-report-<指纹>.arrow）与
+            关键词报告（routing-keywords-<指纹>.arrow）
+        progress: 可选回调，参数为 (已处理行数, 总行数)
+
+    Returns:
+        汇总字典：快速/完整模式计数、分数直方图、按 prompt_type 的分布、高频关键词与报告路径
+    """
+    total = loader.size
+    modes = np.zeros(total, dtype=bool)  # True 表示快速模式
+    simple_scores = np.zeros(total, dtype=np.int32)
+    complex_scores = np.zeros(total, dtype=np.int32)
+    lengths = np.zeros(total, dtype=np.int32)
+    sentence_counts = np.zeros(total, dtype=np.int32)
+    keyword_hits: Counter = Counter()
+    fast_keyword_hits: Counter = Counter()
+
+    started = time.time()
+    for offset, prompts in loader.column_batches('prompt', BATCH_SIZE):
+        results = InstructionClassifier.classify_many(prompts, include_keywords=True)
+        for row, (mode, metadata) in enumerate(results, start=offset):
+            is_fast = mode == 'fast'
+            modes[row] = is_fast
+            simple_scores[row] = metadata['simple_score']
+            complex_scores[row] = metadata['complex_score']
+            lengths[row] = metadata['instruction_length']
+            sentence_counts[row] = metadata['sentence_count']
+            keyword_hits.update(metadata['keywords'])
+            if is_fast:
+                fast_keyword_hits.update(metadata['keywords'])
+        if progress:
+            progress(offset + len(prompts), total)
+
+    fast_count = int(modes.sum())
+    summary: Dict[str, object] = {
+        'total': total,
+        'fast': fast_count,
+        'full': total - fast_count,
+        'fast_ratio': round(fast_count / total, 4) if total else 0.0,
+        'histograms': {
+            'simple_score': _histogram(simple_scores),
+            'complex_score': _histogram(complex_scores),
+            # 简单分数 - 复杂分数，决策阈值附近的分布最值得关注
+            'margin': _histogram(simple_scores - complex_scores)
+        },
+        'keywords': [
+            {'keyword': keyword, 'hits': hits, 'fast_hits': fast_keyword_hits.get(keyword, 0)}
+            for keyword, hits in keyword_hits.most_common(TOP_KEYWORDS)
+        ]
+    }
+
+    prompt_types = None
+    if 'prompt_type' in loader.schema.names:
+        prompt_types = [
+            value for _, batch in loader.column_batches('prompt_type', BATCH_SIZE) for value in batch
+        ]
+        by_type: Dict[str, Dict[str, int]] = {}
+        for value, is_fast in zip(prompt_types, modes.tolist()):
+            counts = by_type.setdefault(str(value), {'fast': 0, 'full': 0})
+            counts['fast' if is_fast else 'full'] += 1
+        summary['by_prompt_type'] = by_type
+
+    if write_report:
+        columns = {
+            'id': pa.array(np.arange(total, dtype=np.int64)),
+            'mode': pa.array(np.where(modes, 'fast', 'full')).dictionary_encode(),
+            'simple_score': pa.array(simple_scores),
+            'complex_score': pa.array(complex_scores),
+            'instruction_length': pa.array(lengths),
+            'sentence_count': pa.array(sentence_counts)
+        }
+        if prompt_types is not None:
+            columns['prompt_type'] = pa.array(prompt_types, type=pa.string())
+        report_path = loader.artifact_path('routing-report', 'arrow')
+        _write_table(pa.table(columns), report_path)
+
+        weights = InstructionClassifier.keyword_weights()
+        keywords_path = loader.artifact_path('routing-keywords', 'arrow')
+        _write_table(pa.table({
+            'keyword': pa.array([keyword for keyword, _, _ in weights], type=pa.string()),
+            'simple_weight': pa.array([simple for _, simple, _ in weights], type=pa.int32()),
+            'complex_weight': pa.array([complex_ for _, _, complex_ in weights], type=pa.int32()),
+            'hits': pa.array([keyword_hits.get(keyword, 0) for keyword, _, _ in weights], type=pa.int64()),
+            'fast_hits': pa.array([fast_keyword_hits.get(keyword, 0) for keyword, _, _ in weights], type=pa.int64())
+        }), keywords_path)
+        summary['report_path'] = report_path
+        summary['keywords_path'] = keywords_path
+
+    summary['elapsed_ms'] = int((time.time() - started) * 1000)
+    return summary
+
+
+class RoutingReportJob:
+    """
+    在后台线程中运行 evaluate_routing 并保存最近一次结果
+
+    状态：idle -> running -> done（或 error）；同一时间只运行一个评估。
+    """
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    def __init__(self):
+        self._mutex = Lock()
+        self._thread: Optional[Thread] = None
+        self._state = 'idle'
+        self._progress = 0.0
+        self._error: Optional[str] = None
+        self._result: Optional[Dict[str, object]] = None
+        self._started_at: Optional[float] = None
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def start(self, write_report: bool = True) -> bool:
+        """
+        开始一次评估
+
+        Args:
+            write_report: 是否写出 Arrow 报告
+
+        Returns:
+            False 表示已有评估在运行
+        """
+        with self._mutex:
+            if self._state == 'running':
+                return False
+            self._state = 'running'
+            self._progress = 0.0
+            self._error = None
+            self._started_at = time.time()
+            self._thread = Thread(
+                target=self._run, args=(write_report,), name='routing-report', daemon=True
+            )
+        self._thread.start()
+        return True
+
+    def status(self) -> Dict[str, object]:
+        """当前状态；完成后包含最近一次评估的汇总结果"""
+        with self._mutex:
+            return {
+                'state': self._state,
+                'progress': round(self._progress, 1),
+                'error': self._error,
+                'started_at': self._started_at,
+                'result': self._result
+            }
+
+    def _report(self, done: int, total: int):
+        with self._mutex:
+            self._progress = done * 100.0 / max(total, 1)
+
+    def _run(self, write_report: bool):
+        try:
+            result = evaluate_routing(get_dataset_loader(), write_report=write_report, progress=self._report)
+        except Exception as exc:  # pylint: disable=broad-except
+            with self._mutex:
+                self._state = 'error'
+                self._error = str(exc)
+            return
+        with self._mutex:
+            self._state = 'done'
+            self._progress = 100.0
+            self._result = result
+
+
+def get_routing_report_job() -> RoutingReportJob:
+    """获取路由评估任务单例"""
+    return RoutingReportJob.get_instance()
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Evaluate instruction routing over every dataset prompt.')
+    parser.add_argument('--no-write', action='store_true', help='print the summary without writing Arrow reports')
+    args = parser.parse_args()
+
+    try:
+        result = evaluate_routing(
+            get_dataset_loader(),
+            write_report=not args.no_write,
+            progress=lambda done, total: print(f"classified {done}/{total}")
+        )
+    except DatasetLoaderError as exc:
+        raise SystemExit(str(exc))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
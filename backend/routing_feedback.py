@@ -0,0 +1,172 @@
+"""
+路由反馈模块
+按指令签名记录快速/完整模式的实际结果与耗时（有界 LRU），
+近期快速模式失败率高的同类指令直接走完整模式，避免"快速失败 + 完整重试"的双重调用
+"""
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import Config
+
+
+class _SignatureStats:
+    """单个签名的近期结果窗口"""
+
+    __slots__ = ('fast', 'full_latencies', 'skipped')
+
+    def __init__(self, window: int):
+        # (是否成功, 耗时毫秒)
+        self.fast: Deque[Tuple[bool, int]] = deque(maxlen=window)
+        self.full_latencies: Deque[int] = deque(maxlen=window)
+        # 连续跳过快速模式的次数，用于定期探测
+        self.skipped = 0
+
+    def fast_failure_rate(self) -> Optional[float]:
+        if not self.fast:
+            return None
+        return sum(1 for success, _ in self.fast if not success) / len(self.fast)
+
+
+class RoutingFeedback:
+    """有界的路由结果存储"""
+
+    _instance = None
+    _lock: Lock = Lock()
+
+    def __init__(self, max_signatures: int, window: int, min_samples: int,
+                 failure_rate: float, probe_interval: int, enabled: bool = True):
+        """
+        Args:
+            max_signatures: 最多保留的签名数（LRU 淘汰）
+            window: 每个签名保留的最近结果数
+            min_samples: 至少有多少次快速模式结果才参与决策
+            failure_rate: 快速模式失败率达到该值时改走完整模式
+            probe_interval: 每跳过该次数后仍尝试一次快速模式，以便失败率回落后恢复，0 表示不探测
+            enabled: 是否启用
+        """
+        self.max_signatures = max_signatures
+        self.window = window
+        self.min_samples = min_samples
+        self.failure_rate = failure_rate
+        self.probe_interval = probe_interval
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, _SignatureStats]" = OrderedDict()
+        self._mutex = Lock()
+        self._stats = {'fast_skipped': 0, 'probes': 0, 'evictions': 0}
+
+    @classmethod
+    def get_instance(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    max_signatures=Config.ROUTING_FEEDBACK_MAX_SIGNATURES,
+                    window=Config.ROUTING_FEEDBACK_WINDOW,
+                    min_samples=Config.ROUTING_FEEDBACK_MIN_SAMPLES,
+                    failure_rate=Config.ROUTING_FEEDBACK_FAILURE_RATE,
+                    probe_interval=Config.ROUTING_FEEDBACK_PROBE_INTERVAL,
+                    enabled=Config.ROUTING_FEEDBACK_ENABLED
+                )
+            return cls._instance
+
+    def _entry(self, signature: str) -> _SignatureStats:
+        """获取或创建签名条目（调用方需持有 _mutex）"""
+        entry = self._entries.get(signature)
+        if entry is None:
+            entry = self._entries[signature] = _SignatureStats(self.window)
+            while len(self._entries) > self.max_signatures:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        else:
+            self._entries.move_to_end(signature)
+        return entry
+
+    def adjust(self, signature: str, mode: str, metadata: Dict) -> str:
+        """
+        根据历史结果调整分类器给出的模式
+
+        Args:
+            signature: 指令签名
+            mode: 分类器给出的模式
+            metadata: 分类元数据（改走完整模式时原地补充 'adaptive' 信息）
+
+        Returns:
+            最终模式
+        """
+        if not self.enabled or mode != 'fast':
+            return mode
+        with self._mutex:
+            entry = self._entries.get(signature)
+            if entry is None or len(entry.fast) < self.min_samples:
+                return mode
+            rate = entry.fast_failure_rate()
+            if rate < self.failure_rate:
+                entry.skipped = 0
+                return mode
+            self._entries.move_to_end(signature)
+            entry.skipped += 1
+            if self.probe_interval and entry.skipped >= self.probe_interval:
+                entry.skipped = 0
+                self._stats['probes'] += 1
+                metadata['adaptive'] = {'probe': True, 'fast_failure_rate': round(rate, 3)}
+                return mode
+            self._stats['fast_skipped'] += 1
+            metadata['adaptive'] = {
+                'fast_skipped': True,
+                'fast_failure_rate': round(rate, 3),
+                'samples': len(entry.fast)
+            }
+        return 'full'
+
+    def record(self, signature: str, mode: str, success: bool, latency_ms: int):
+        """
+        记录一次调用结果
+
+        Args:
+            signature: 指令签名
+            mode: 'fast' 或 'full'
+            success: 快速模式的操作是否全部干净应用（完整模式为调用是否成功）
+            latency_ms: 调用耗时（毫秒）
+        """
+        if not self.enabled:
+            return
+        with self._mutex:
+            entry = self._entry(signature)
+            if mode == 'fast':
+                entry.fast.append((bool(success), int(latency_ms)))
+            elif success:
+                entry.full_latencies.append(int(latency_ms))
+
+    def get_stats(self, top: int = 10) -> Dict[str, object]:
+        """
+        返回统计信息及快速模式失败率最高的签名
+
+        Args:
+            top: 返回的签名数量
+        """
+        with self._mutex:
+            signatures: List[Dict[str, object]] = []
+            for signature, entry in self._entries.items():
+                rate = entry.fast_failure_rate()
+                if rate is None:
+                    continue
+                fast_latencies = [latency for _, latency in entry.fast]
+                signatures.append({
+                    'signature': signature,
+                    'fast_samples': len(entry.fast),
+                    'fast_failure_rate': round(rate, 3),
+                    'fast_latency_ms': int(sum(fast_latencies) / len(fast_latencies)),
+                    'full_latency_ms': (
+                        int(sum(entry.full_latencies) / len(entry.full_latencies))
+                        if entry.full_latencies else None
+                    )
+                })
+            stats = dict(self._stats, enabled=self.enabled, signatures=len(self._entries))
+        signatures.sort(key=lambda item: (-item['fast_failure_rate'], -item['fast_samples']))
+        stats['top_failing'] = signatures[:top]
+        return stats
+
+
+def get_routing_feedback() -> RoutingFeedback:
+    """获取路由反馈存储单例"""
+    return RoutingFeedback.get_instance()
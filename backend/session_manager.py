@@ -2,16 +2,90 @@
 会话管理模块
 管理用户会话和修改历史
 """
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional
+from threading import Event, Lock, RLock, Thread
+from typing import Dict, List, Optional, Tuple
+import time
 import uuid
 
+from config import Config
+from html_diff import apply_delta, delta_size, make_delta
+from session_store import SessionConflictError, SessionStore, create_session_store
+
+
+def _text_bytes(text: Optional[str]) -> int:
+    """字符串的 UTF-8 字节数"""
+    return len(text.encode('utf-8')) if text else 0
+
+
 class SessionManager:
-    """会话管理器类"""
+    """
+    会话管理器类
+    
+    历史记录以增量形式存储：每条记录保存相对其父版本的 delta，
+    链首记录保存基准 HTML，每隔 HISTORY_KEYFRAME_INTERVAL 层保存一次完整快照，
+    需要某个版本时沿父链回溯到最近的快照/基准再逐层应用 delta。
+    
+    会话数据保存在可插拔的 SessionStore 中（进程内字典或 SQLite）。
+    存储不直接保存历史对象时（SQLite），本进程按 revision 缓存最近使用会话的
+    历史列表、索引与摘要，revision 未变的读取无需解压历史行。
+    后台清理线程依据空闲超时、会话数上限和总字节预算淘汰会话，保证长时间运行时内存有界。
+    
+    并发控制：同一会话的读改写在会话锁（按会话 ID 分段的 RLock）与存储事务内完成，
+    SQLite 存储下多个 worker 进程的写入同样互斥；全局锁只用于创建与淘汰。
+    每次修改递增会话的 revision，调用方可在长时间的
+    LLM 调用前记下 revision，写入时通过 expected_revision 拒绝基于过期版本的修改。
+    """
+    
+    # 会话锁分段数：固定数量的锁，无需随会话创建/淘汰维护
+    _LOCK_STRIPES = 64
     
-    def __init__(self):
-        """初始化会话管理器"""
-        self.sessions: Dict[str, dict] = {}
+    # 历史记录中仅供内部使用的字段
+    _INTERNAL_FIELDS = ('parent_id', 'depth', 'base_html', 'base_is_original', 'delta', 'snapshot', 'size_bytes')
+    
+    def __init__(self, store: Optional[SessionStore] = None,
+                 max_history_size: Optional[int] = None, keyframe_interval: Optional[int] = None,
+                 idle_ttl: Optional[int] = None, max_sessions: Optional[int] = None,
+                 max_total_bytes: Optional[int] = None, history_cache_size: Optional[int] = None):
+        """
+        初始化会话管理器
+        
+        Args:
+            store: 会话存储，默认按 Config.SESSION_STORE 创建
+            max_history_size: 每个会话保留的最大历史记录数
+            keyframe_interval: 完整快照的间隔层数
+            idle_ttl: 会话空闲超时（秒），0 表示不限制
+            max_sessions: 最大会话数，0 表示不限制
+            max_total_bytes: 所有会话 HTML 的总字节预算，0 表示不限制
+            history_cache_size: 进程内缓存历史记录的会话数，0 表示不缓存
+        """
+        self.store = store or create_session_store()
+        self.max_history_size = max_history_size or Config.MAX_HISTORY_SIZE
+        self.keyframe_interval = keyframe_interval or Config.HISTORY_KEYFRAME_INTERVAL
+        self.idle_ttl = Config.SESSION_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_sessions = Config.SESSION_MAX_COUNT if max_sessions is None else max_sessions
+        self.max_total_bytes = Config.SESSION_MAX_TOTAL_BYTES if max_total_bytes is None else max_total_bytes
+        self.history_cache_size = (
+            Config.SESSION_HISTORY_CACHE_SIZE if history_cache_size is None else history_cache_size
+        )
+        
+        self._lock = Lock()
+        self._session_locks = [RLock() for _ in range(self._LOCK_STRIPES)]
+        # session_id -> (revision, history, history_index, history_summary)
+        self._history_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._cache_lock = Lock()
+        self._eviction_stats = {
+            'evicted_sessions': 0,
+            'bytes_freed': 0,
+            'evicted_idle': 0,
+            'evicted_capacity': 0,
+            'evicted_memory': 0,
+            'sweeps': 0
+        }
+        self._sweeper: Optional[Thread] = None
+        self._stop_sweeper = Event()
     
     def create_session(self) -> str:
         """
@@ -21,42 +95,150 @@ class SessionManager:
             会话 ID
         """
         session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            'current_html': None,
-            'original_html': None,
-            'history': [],
-            'created_at': datetime.now().isoformat()
-        }
+        with self._lock:
+            self.store.create(session_id, {
+                'current_html': None,
+                'original_html': None,
+                'history': [],
+                'current_version_id': None,  # current_html 对应的历史记录 ID，None 表示不对应任何记录
+                'created_at': datetime.now().isoformat(),
+                'last_accessed': time.time(),
+                'size_bytes': 0,
+                'history_bytes': 0,
+                'revision': 0  # 每次修改递增，用于乐观并发检查
+            })
         return session_id
     
     def get_session(self, session_id: str) -> Optional[dict]:
         """
-        获取会话信息
+        获取会话信息（同时刷新最近访问时间）
         
         Args:
             session_id: 会话 ID
-            
+        
+        Returns:
+            会话数据或 None（不保证包含 'history'）
+        """
+        return self._load(session_id, with_history=False)
+    
+    def get_current_version(self, session_id: str) -> Optional[Tuple[Optional[str], int]]:
+        """
+        原子地读取当前 HTML 及其 revision
+        
+        Args:
+            session_id: 会话 ID
+        
         Returns:
-            会话数据或 None
+            (current_html, revision) 或 None
         """
-        return self.sessions.get(session_id)
+        with self._session_lock(session_id):
+            session = self._load(session_id, with_history=False)
+            if not session:
+                return None
+            return session['current_html'], session['revision']
+    
+    def _session_lock(self, session_id: str) -> RLock:
+        """获取会话对应的锁"""
+        return self._session_locks[hash(session_id) % self._LOCK_STRIPES]
+    
+    @contextmanager
+    def _write_lock(self, session_id: str):
+        """会话锁 + 存储事务：读-改-写序列在进程内与跨进程均为原子操作"""
+        try:
+            with self._session_lock(session_id), self.store.transaction():
+                yield
+        except BaseException:
+            # 事务已回滚，缓存中可能留有未提交的原地修改
+            self._drop_cached_history(session_id)
+            raise
+    
+    def _load(self, session_id: str, with_history: bool = True) -> Optional[dict]:
+        """从存储读取会话并刷新访问时间"""
+        session = self.store.get(session_id, with_history=False)
+        if session is None:
+            return None
+        now = time.time()
+        if now - session['last_accessed'] >= self.store.touch_interval:
+            if not self.store.touch(session_id, now):
+                # 会话恰好在此期间被淘汰
+                return None
+            session['last_accessed'] = now
+        if with_history and 'history' not in session:
+            self._attach_history(session_id, session)
+        return session
+    
+    def _attach_history(self, session_id: str, session: dict):
+        """附加历史记录，revision 与缓存一致时直接复用缓存的列表、索引与摘要"""
+        with self._cache_lock:
+            cached = self._history_cache.get(session_id)
+            if cached is not None and cached[0] == session['revision']:
+                self._history_cache.move_to_end(session_id)
+            else:
+                cached = None
+        if cached is not None:
+            _, session['history'], session['history_index'], session['history_summary'] = cached
+            return
+        session['history'] = self.store.get_history(session_id, session)
+        self._cache_history(session_id, session)
+    
+    def _cache_history(self, session_id: str, session: dict):
+        """以当前 revision 缓存会话的历史列表、索引与摘要"""
+        if not self.history_cache_size:
+            return
+        entry = (
+            session['revision'], session['history'],
+            self._history_index(session), self._history_summary(session)
+        )
+        with self._cache_lock:
+            self._history_cache[session_id] = entry
+            self._history_cache.move_to_end(session_id)
+            while len(self._history_cache) > self.history_cache_size:
+                self._history_cache.popitem(last=False)
+    
+    def _drop_cached_history(self, session_id: str):
+        with self._cache_lock:
+            self._history_cache.pop(session_id, None)
     
     def set_original_html(self, session_id: str, html_content: str):
         """
-        设置原始 HTML
+        设置原始 HTML（新文档，同时清空历史记录）
         
         Args:
             session_id: 会话 ID
             html_content: HTML 内容
         """
-        session = self.get_session(session_id)
-        if session:
-            session['original_html'] = html_content
-            session['current_html'] = html_content
+        with self._write_lock(session_id):
+            session = self._load(session_id)
+            if session:
+                session['original_html'] = html_content
+                session['current_html'] = html_content
+                self._reset_history(session_id, session)
+    
+    def clear_history(self, session_id: str):
+        """
+        清空修改历史
+        
+        Args:
+            session_id: 会话 ID
+        """
+        with self._write_lock(session_id):
+            session = self._load(session_id)
+            if session:
+                self._reset_history(session_id, session)
     
-    def add_history(self, session_id: str, instruction: str, 
+    def _reset_history(self, session_id: str, session: dict):
+        session['history'] = []
+        session['history_index'] = {}
+        session['history_summary'] = []
+        session['current_version_id'] = None
+        session['history_bytes'] = 0
+        self.store.clear_history(session_id)
+        self._save(session_id, session)
+    
+    def add_history(self, session_id: str, instruction: str,
                    modified_html: str, api_provider: str, model: str,
-                   change_description: Optional[dict] = None, mode: str = 'full'):
+                   change_description: Optional[dict] = None, mode: str = 'full',
+                   expected_revision: Optional[int] = None):
         """
         添加修改历史
         
@@ -68,28 +250,63 @@ class SessionManager:
             model: 使用的模型
             change_description: 变更描述（预留字段）
             mode: 使用的模式 ('fast' 或 'full')
-        """
-        session = self.get_session(session_id)
-        if not session:
-            return
+            expected_revision: 生成 modified_html 时读取到的 revision，
+                与当前 revision 不一致时拒绝写入（为 None 时不检查）
         
-        # 获取当前 HTML 作为这次修改的 "before"
-        before_html = session['current_html']
+        Raises:
+            SessionConflictError: 会话已被其他请求修改
+        """
+        with self._write_lock(session_id):
+            session = self._load(session_id)
+            if not session:
+                return
+            if expected_revision is not None and session['revision'] != expected_revision:
+                raise SessionConflictError("会话已被其他请求修改")
+            self._append_history(session_id, session, instruction, modified_html,
+                                 api_provider, model, change_description, mode)
+    
+    def _append_history(self, session_id: str, session: dict, instruction: str,
+                        modified_html: str, api_provider: str, model: str,
+                        change_description: Optional[dict], mode: str):
+        """追加历史记录（调用方持有会话锁）"""
+        # 当前 HTML 作为这次修改的 "before"，仅存储相对它的增量
+        before_html = session['current_html'] or ''
+        parent = self._find_entry(session, session['current_version_id'])
+        depth = parent['depth'] + 1 if parent else 1
         
         history_entry = {
             'id': str(uuid.uuid4()),
             'timestamp': datetime.now().isoformat(),
             'instruction': instruction,
-            'before_html': before_html,
-            'after_html': modified_html,
             'api_provider': api_provider,
             'model': model,
             'change_description': change_description,  # 预留字段
-            'mode': mode  # 新增：记录使用的模式
+            'mode': mode,  # 新增：记录使用的模式
+            'parent_id': parent['id'] if parent else None,
+            'depth': depth,
+            'delta': make_delta(before_html, modified_html)
         }
         
+        if parent is None:
+            # 链首：保存基准 HTML；基准即原始 HTML 时共享同一对象，不额外占用内存
+            history_entry['base_html'] = before_html
+            history_entry['base_is_original'] = before_html == (session['original_html'] or '')
+        if depth % self.keyframe_interval == 0:
+            history_entry['snapshot'] = modified_html
+        self._set_entry_size(session, history_entry)
+        
+        # 先确保索引与摘要已建立，再与历史列表同步追加
+        index = self._history_index(session)
+        summary = self._history_summary(session)
         session['history'].append(history_entry)
+        index[history_entry['id']] = history_entry
+        summary.append(self._summarize(history_entry))
         session['current_html'] = modified_html
+        session['current_version_id'] = history_entry['id']
+        self.store.append_history(session_id, history_entry)
+        
+        self._trim_history(session_id, session)
+        self._save(session_id, session)
     
     def get_history(self, session_id: str) -> List[dict]:
         """
@@ -97,50 +314,52 @@ class SessionManager:
         
         Args:
             session_id: 会话 ID
-            
+        
         Returns:
             历史记录列表
         """
-        session = self.get_session(session_id)
-        if not session:
-            return []
-        
-        # 返回简化的历史信息（不包含完整 HTML）
-        return [
-            {
-                'id': entry['id'],
-                'timestamp': entry['timestamp'],
-                'instruction': entry['instruction'],
-                'api_provider': entry['api_provider'],
-                'model': entry['model'],
-                'mode': entry.get('mode', 'full')  # 兼容旧数据
-            }
-            for entry in session['history']
-        ]
+        with self._session_lock(session_id):
+            session = self._load(session_id)
+            if not session:
+                return []
+            
+            # 返回简化的历史信息（不包含完整 HTML），摘要随追加/截断增量维护
+            return list(self._history_summary(session))
     
-    def revert_to_history(self, session_id: str, history_id: str) -> Optional[str]:
+    def revert_to_history(self, session_id: str, history_id: str,
+                          expected_revision: Optional[int] = None) -> Optional[str]:
         """
         回退到指定历史版本
         
         Args:
             session_id: 会话 ID
             history_id: 历史记录 ID
-            
+            expected_revision: 发起回退时读取到的 revision，
+                与当前 revision 不一致时拒绝写入（为 None 时不检查）
+        
         Returns:
             回退后的 HTML 或 None
-        """
-        session = self.get_session(session_id)
-        if not session:
-            return None
         
-        # 查找历史记录
-        for entry in session['history']:
-            if entry['id'] == history_id:
-                # 更新当前 HTML
-                session['current_html'] = entry['after_html']
-                return entry['after_html']
-        
-        return None
+        Raises:
+            SessionConflictError: 会话已被其他请求修改
+        """
+        with self._write_lock(session_id):
+            session = self._load(session_id)
+            if not session:
+                return None
+            if expected_revision is not None and session['revision'] != expected_revision:
+                raise SessionConflictError("会话已被其他请求修改")
+            
+            entry = self._find_entry(session, history_id)
+            if entry is None:
+                return None
+            
+            # 更新当前 HTML
+            html_content = self._materialize(session, entry)
+            session['current_html'] = html_content
+            session['current_version_id'] = entry['id']
+            self._save(session_id, session)
+            return html_content
     
     def get_current_html(self, session_id: str) -> Optional[str]:
         """
@@ -148,7 +367,7 @@ class SessionManager:
         
         Args:
             session_id: 会话 ID
-            
+        
         Returns:
             当前 HTML 或 None
         """
@@ -163,7 +382,7 @@ class SessionManager:
         
         Args:
             session_id: 会话 ID
-            
+        
         Returns:
             原始 HTML 或 None
         """
@@ -179,17 +398,240 @@ class SessionManager:
         Args:
             session_id: 会话 ID
             history_id: 历史记录 ID
-            
+        
         Returns:
             历史记录条目或 None
         """
-        session = self.get_session(session_id)
-        if not session:
+        with self._session_lock(session_id):
+            session = self._load(session_id)
+            if not session:
+                return None
+            
+            entry = self._find_entry(session, history_id)
+            if entry is None:
+                return None
+            
+            result = {
+                key: value for key, value in entry.items()
+                if key not in self._INTERNAL_FIELDS
+            }
+            result['after_html'] = self._materialize(session, entry)
+            parent = self._find_entry(session, entry['parent_id'])
+            result['before_html'] = self._materialize(session, parent) if parent else entry.get('base_html', '')
+            return result
+    
+    def _history_index(self, session: dict) -> Dict[str, dict]:
+        """获取（必要时构建）会话的 ID → 历史记录索引"""
+        index = session.get('history_index')
+        if index is None:
+            index = {entry['id']: entry for entry in session['history']}
+            session['history_index'] = index
+        return index
+    
+    def _history_summary(self, session: dict) -> List[dict]:
+        """获取（必要时构建）会话的历史摘要列表"""
+        summary = session.get('history_summary')
+        if summary is None:
+            summary = [self._summarize(entry) for entry in session['history']]
+            session['history_summary'] = summary
+        return summary
+    
+    @staticmethod
+    def _summarize(entry: dict) -> dict:
+        """历史记录的轻量摘要（不包含 HTML）"""
+        return {
+            'id': entry['id'],
+            'timestamp': entry['timestamp'],
+            'instruction': entry['instruction'],
+            'api_provider': entry['api_provider'],
+            'model': entry['model'],
+            'mode': entry.get('mode', 'full')  # 兼容旧数据
+        }
+    
+    def _find_entry(self, session: dict, history_id: Optional[str]) -> Optional[dict]:
+        """按 ID 查找历史记录"""
+        if history_id is None:
             return None
+        return self._history_index(session).get(history_id)
+    
+    def _materialize(self, session: dict, entry: dict) -> str:
+        """
+        重建历史记录对应的 HTML
         
-        for entry in session['history']:
-            if entry['id'] == history_id:
-                return entry
+        沿父链回溯到最近的快照或基准，再按顺序应用各层 delta。
+        """
+        chain = []
+        node = entry
+        while 'snapshot' not in node:
+            chain.append(node)
+            if node['parent_id'] is None:
+                html_content = node['base_html']
+                break
+            node = self._find_entry(session, node['parent_id'])
+        else:
+            html_content = node['snapshot']
         
-        return None
-
+        for node in reversed(chain):
+            html_content = apply_delta(html_content, node['delta'])
+        return html_content
+    
+    def _trim_history(self, session_id: str, session: dict):
+        """
+        执行 MAX_HISTORY_SIZE 限制，丢弃最旧的记录
+        
+        被丢弃记录的直接子记录改为以其版本为基准，保证剩余记录仍可重建。
+        """
+        history = session['history']
+        if len(history) <= self.max_history_size:
+            return
+        
+        index = self._history_index(session)
+        summary = self._history_summary(session)
+        dropped_ids = []
+        while len(history) > self.max_history_size:
+            dropped = history[0]
+            dropped_html = None
+            for entry in history[1:]:
+                if entry['parent_id'] == dropped['id']:
+                    if dropped_html is None:
+                        dropped_html = self._materialize(session, dropped)
+                    entry['parent_id'] = None
+                    entry['base_html'] = dropped_html
+                    entry['base_is_original'] = False
+                    self._set_entry_size(session, entry)
+                    self.store.update_history(session_id, entry)
+            history.pop(0)
+            summary.pop(0)
+            del index[dropped['id']]
+            session['history_bytes'] -= dropped['size_bytes']
+            dropped_ids.append(dropped['id'])
+            if session['current_version_id'] == dropped['id']:
+                session['current_version_id'] = None
+        
+        if dropped_ids:
+            self.store.delete_history(session_id, dropped_ids)
+    
+    @staticmethod
+    def _set_entry_size(session: dict, entry: dict):
+        """计算历史记录占用的字节数并同步到会话的 history_bytes"""
+        size = delta_size(entry['delta'])
+        size += _text_bytes(entry.get('snapshot'))
+        if entry.get('base_html') is not None and not entry.get('base_is_original'):
+            size += _text_bytes(entry['base_html'])
+        session['history_bytes'] += size - entry.get('size_bytes', 0)
+        entry['size_bytes'] = size
+    
+    def _save(self, session_id: str, session: dict):
+        """
+        递增 revision、更新会话总大小并写回存储
+        
+        存储以读取时的 revision 做比较并交换，读取之后已有其他写入提交时
+        抛出 SessionConflictError，整个事务（含本次历史记录写入）随之回滚。
+        """
+        loaded_revision = session.get('revision', 0)
+        session['revision'] = loaded_revision + 1
+        size = _text_bytes(session['original_html']) + session['history_bytes']
+        if session['current_html'] != session['original_html']:
+            size += _text_bytes(session['current_html'])
+        session['size_bytes'] = size
+        self.store.save(session_id, session, expected_revision=loaded_revision)
+        if session_id in self._history_cache:
+            # 历史列表已在缓存对象上原地修改（或被整体替换），随新 revision 一并更新
+            self._cache_history(session_id, session)
+    
+    def _evict(self, session_id: str, reason: str):
+        """移除会话并记录统计（调用方持有 _lock）"""
+        with self._session_lock(session_id):
+            size = self.store.delete(session_id)
+            self._drop_cached_history(session_id)
+        if size is None:
+            return
+        self._eviction_stats['evicted_sessions'] += 1
+        self._eviction_stats['bytes_freed'] += size
+        self._eviction_stats[f'evicted_{reason}'] += 1
+    
+    def evict_expired(self) -> Dict[str, int]:
+        """
+        执行一次淘汰
+        
+        依次处理：空闲超时的会话、超出会话数上限的最久未访问会话、
+        超出总字节预算的最久未访问会话。
+        
+        Returns:
+            本次淘汰的会话数和释放的字节数
+        """
+        now = time.time()
+        with self._lock:
+            before_count = self._eviction_stats['evicted_sessions']
+            before_bytes = self._eviction_stats['bytes_freed']
+            
+            sessions = self.store.list_by_access()
+            if self.idle_ttl:
+                remaining = []
+                for session_id, last_accessed, size in sessions:
+                    if now - last_accessed > self.idle_ttl:
+                        self._evict(session_id, 'idle')
+                    else:
+                        remaining.append((session_id, last_accessed, size))
+                sessions = remaining
+            
+            total_bytes = sum(size for _, _, size in sessions)
+            count = len(sessions)
+            for session_id, _, size in sessions:
+                if self.max_sessions and count > self.max_sessions:
+                    reason = 'capacity'
+                elif self.max_total_bytes and total_bytes > self.max_total_bytes:
+                    reason = 'memory'
+                else:
+                    break
+                self._evict(session_id, reason)
+                count -= 1
+                total_bytes -= size
+            
+            self._eviction_stats['sweeps'] += 1
+            return {
+                'evicted_sessions': self._eviction_stats['evicted_sessions'] - before_count,
+                'bytes_freed': self._eviction_stats['bytes_freed'] - before_bytes
+            }
+    
+    def start_sweeper(self, interval: Optional[int] = None):
+        """
+        启动后台清理线程
+        
+        Args:
+            interval: 清理间隔（秒）
+        """
+        interval = interval or Config.SESSION_SWEEP_INTERVAL
+        if self._sweeper is not None or interval <= 0:
+            return
+        
+        def run():
+            while not self._stop_sweeper.wait(interval):
+                self.evict_expired()
+        
+        self._sweeper = Thread(target=run, name='session-sweeper', daemon=True)
+        self._sweeper.start()
+    
+    def stop_sweeper(self):
+        """停止后台清理线程"""
+        self._stop_sweeper.set()
+        self._sweeper = None
+    
+    def get_stats(self) -> Dict[str, object]:
+        """
+        获取会话与淘汰统计
+        
+        Returns:
+            统计信息字典
+        """
+        with self._lock:
+            stats = dict(self._eviction_stats)
+        stats['active_sessions'] = self.store.count()
+        stats['total_bytes'] = self.store.total_bytes()
+        stats['store'] = type(self.store).__name__
+        stats['limits'] = {
+            'idle_ttl': self.idle_ttl,
+            'max_sessions': self.max_sessions,
+            'max_total_bytes': self.max_total_bytes
+        }
+        return stats
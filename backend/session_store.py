@@ -0,0 +1,435 @@
+"""
+会话存储模块
+SessionManager 的可插拔存储后端：进程内字典（默认）与 SQLite（WAL 模式，支持多进程共享）
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from config import Config
+
+
+class SessionConflictError(Exception):
+    """会话在读取后已被其他请求修改（乐观并发检查失败）"""
+    pass
+
+
+class SessionStore(ABC):
+    """
+    会话存储接口
+
+    会话数据为字典：created_at、last_accessed、current_version_id、original_html、
+    current_html、size_bytes、history_bytes、revision 等标量字段 + 'history' 列表。
+    get(with_history=False) 时实现可以省略 'history' 键。
+    SessionManager 总是先修改手中的会话字典，再调用 save/*_history 持久化同一变更。
+    """
+
+    # 读取会话时，距上次记录的访问时间不足该秒数则不调用 touch
+    touch_interval: float = 0
+
+    @contextmanager
+    def transaction(self):
+        """
+        将其中的读写作为一个原子操作执行
+
+        SessionManager 在会话锁内用它包裹完整的 读取 → 检查 revision → 写入 序列；
+        进程内存储已由会话锁保证原子性，默认实现不做任何事。
+        """
+        yield
+
+    @abstractmethod
+    def create(self, session_id: str, session: dict):
+        """写入新会话"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, session_id: str, with_history: bool = True) -> Optional[dict]:
+        """读取会话，不存在时返回 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_history(self, session_id: str, session: dict) -> List[dict]:
+        """
+        读取会话的历史记录列表
+
+        Args:
+            session_id: 会话 ID
+            session: get(with_history=False) 返回的会话数据（用于恢复共享的基准 HTML）
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, session_id: str, session: dict, expected_revision: Optional[int] = None):
+        """
+        保存会话标量字段（会话已被删除时忽略）
+
+        Args:
+            session_id: 会话 ID
+            session: 会话数据
+            expected_revision: 不为 None 时仅在存储中的 revision 仍等于该值时写入
+
+        Raises:
+            SessionConflictError: 存储中的 revision 已被其他写入者修改
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def touch(self, session_id: str, timestamp: float) -> bool:
+        """刷新最近访问时间，返回会话是否存在"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_history(self, session_id: str, entry: dict):
+        """追加一条历史记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_history(self, session_id: str, entry: dict):
+        """更新一条已有的历史记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_history(self, session_id: str, history_ids: List[str]):
+        """删除指定的历史记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear_history(self, session_id: str):
+        """清空会话的历史记录"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str) -> Optional[int]:
+        """删除会话，返回其 size_bytes；会话不存在时返回 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_by_access(self) -> List[Tuple[str, float, int]]:
+        """按最近访问时间升序列出 (session_id, last_accessed, size_bytes)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self) -> int:
+        """会话总数"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def total_bytes(self) -> int:
+        """所有会话 size_bytes 之和"""
+        raise NotImplementedError
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    进程内存储
+    get 返回的是存储中的同一个字典对象，SessionManager 的原地修改即已生效，
+    因此 save 与历史记录相关的写方法均为空操作。
+    """
+
+    def __init__(self):
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str, session: dict):
+        session.setdefault('history', [])
+        with self._lock:
+            self.sessions[session_id] = session
+
+    def get(self, session_id: str, with_history: bool = True) -> Optional[dict]:
+        return self.sessions.get(session_id)
+
+    def get_history(self, session_id: str, session: dict) -> List[dict]:
+        return session['history']
+
+    def save(self, session_id: str, session: dict, expected_revision: Optional[int] = None):
+        # 数据已原地修改，无需写回；同一会话的写入已由会话锁串行化
+        pass
+
+    def touch(self, session_id: str, timestamp: float) -> bool:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return False
+            session['last_accessed'] = timestamp
+            self.sessions.move_to_end(session_id)
+            return True
+
+    def append_history(self, session_id: str, entry: dict):
+        pass
+
+    def update_history(self, session_id: str, entry: dict):
+        pass
+
+    def delete_history(self, session_id: str, history_ids: List[str]):
+        pass
+
+    def clear_history(self, session_id: str):
+        pass
+
+    def delete(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return None
+        return session['size_bytes']
+
+    def list_by_access(self) -> List[Tuple[str, float, int]]:
+        with self._lock:
+            return [
+                (session_id, session['last_accessed'], session['size_bytes'])
+                for session_id, session in self.sessions.items()
+            ]
+
+    def count(self) -> int:
+        return len(self.sessions)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(session['size_bytes'] for session in self.sessions.values())
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite 存储（WAL 模式）
+    HTML 与历史记录以 zlib 压缩后存储，同一主机上的多个 worker 进程可共享会话。
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        last_accessed REAL NOT NULL,
+        current_version_id TEXT,
+        original_html BLOB,
+        current_html BLOB,
+        size_bytes INTEGER NOT NULL DEFAULT 0,
+        history_bytes INTEGER NOT NULL DEFAULT 0,
+        revision INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed ON sessions (last_accessed);
+    CREATE TABLE IF NOT EXISTS history (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        id TEXT NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (session_id, seq)
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_history_session_id ON history (session_id, id);
+    """
+
+    def __init__(self, db_path: str, compress_level: int = 6, touch_interval: float = 0):
+        """
+        初始化存储
+
+        Args:
+            db_path: 数据库文件路径
+            compress_level: zlib 压缩级别
+            touch_interval: 刷新访问时间的最小间隔（秒）；每次 touch 都是一次写事务，
+                节流后只读请求（如轮询 /api/history）通常不会取得写锁
+        """
+        self.db_path = db_path
+        self.compress_level = compress_level
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(self._SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}
+        if 'revision' not in columns:
+            # 兼容旧版本创建的数据库
+            conn.execute('ALTER TABLE sessions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        BEGIN IMMEDIATE 事务：开始时即取得数据库写锁，其他进程的写事务需等待提交，
+        使跨进程的读-改-写序列不会交错；已处于事务中时复用外层事务
+        """
+        conn = self._conn()
+        if conn.in_transaction:
+            yield
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _pack_text(self, text: Optional[str]) -> Optional[bytes]:
+        if text is None:
+            return None
+        return zlib.compress(text.encode('utf-8'), self.compress_level)
+
+    @staticmethod
+    def _unpack_text(blob: Optional[bytes]) -> Optional[str]:
+        if blob is None:
+            return None
+        return zlib.decompress(blob).decode('utf-8')
+
+    def _pack_entry(self, entry: dict) -> bytes:
+        if entry.get('base_is_original'):
+            # 基准即原始 HTML 时不重复存储，读取时从会话行恢复
+            entry = {key: value for key, value in entry.items() if key != 'base_html'}
+        return zlib.compress(json.dumps(entry, ensure_ascii=False).encode('utf-8'), self.compress_level)
+
+    @staticmethod
+    def _unpack_entry(blob: bytes) -> dict:
+        return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+    def create(self, session_id: str, session: dict):
+        self._conn().execute(
+            'INSERT INTO sessions (id, created_at, last_accessed, current_version_id, '
+            'original_html, current_html, size_bytes, history_bytes, revision) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                session_id, session['created_at'], session['last_accessed'], session['current_version_id'],
+                self._pack_text(session['original_html']), self._pack_text(session['current_html']),
+                session['size_bytes'], session['history_bytes'], session['revision']
+            )
+        )
+
+    def get(self, session_id: str, with_history: bool = True) -> Optional[dict]:
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT created_at, last_accessed, current_version_id, original_html, current_html, '
+            'size_bytes, history_bytes, revision FROM sessions WHERE id = ?',
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        session = {
+            'created_at': row[0],
+            'last_accessed': row[1],
+            'current_version_id': row[2],
+            'original_html': self._unpack_text(row[3]),
+            'current_html': self._unpack_text(row[4]),
+            'size_bytes': row[5],
+            'history_bytes': row[6],
+            'revision': row[7]
+        }
+        if with_history:
+            session['history'] = self.get_history(session_id, session)
+        return session
+
+    def get_history(self, session_id: str, session: dict) -> List[dict]:
+        rows = self._conn().execute(
+            'SELECT data FROM history WHERE session_id = ? ORDER BY seq',
+            (session_id,)
+        ).fetchall()
+        history = [self._unpack_entry(item[0]) for item in rows]
+        for entry in history:
+            if entry.get('base_is_original'):
+                entry['base_html'] = session['original_html']
+        return history
+
+    def save(self, session_id: str, session: dict, expected_revision: Optional[int] = None):
+        conn = self._conn()
+        sql = (
+            'UPDATE sessions SET last_accessed = ?, current_version_id = ?, original_html = ?, '
+            'current_html = ?, size_bytes = ?, history_bytes = ?, revision = ? WHERE id = ?'
+        )
+        params = [
+            session['last_accessed'], session['current_version_id'],
+            self._pack_text(session['original_html']), self._pack_text(session['current_html']),
+            session['size_bytes'], session['history_bytes'], session['revision'], session_id
+        ]
+        if expected_revision is not None:
+            # 比较并交换：其他进程在此期间提交过修改时不覆盖
+            sql += ' AND revision = ?'
+            params.append(expected_revision)
+        cursor = conn.execute(sql, params)
+        if cursor.rowcount == 0 and expected_revision is not None:
+            if conn.execute('SELECT 1 FROM sessions WHERE id = ?', (session_id,)).fetchone():
+                raise SessionConflictError("会话已被其他请求修改")
+
+    def touch(self, session_id: str, timestamp: float) -> bool:
+        cursor = self._conn().execute(
+            'UPDATE sessions SET last_accessed = ? WHERE id = ?',
+            (timestamp, session_id)
+        )
+        return cursor.rowcount > 0
+
+    def append_history(self, session_id: str, entry: dict):
+        self._conn().execute(
+            'INSERT INTO history (session_id, seq, id, data) VALUES ('
+            '?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM history WHERE session_id = ?), ?, ?)',
+            (session_id, session_id, entry['id'], self._pack_entry(entry))
+        )
+
+    def update_history(self, session_id: str, entry: dict):
+        self._conn().execute(
+            'UPDATE history SET data = ? WHERE session_id = ? AND id = ?',
+            (self._pack_entry(entry), session_id, entry['id'])
+        )
+
+    def delete_history(self, session_id: str, history_ids: List[str]):
+        self._conn().executemany(
+            'DELETE FROM history WHERE session_id = ? AND id = ?',
+            [(session_id, history_id) for history_id in history_ids]
+        )
+
+    def clear_history(self, session_id: str):
+        self._conn().execute('DELETE FROM history WHERE session_id = ?', (session_id,))
+
+    def delete(self, session_id: str) -> Optional[int]:
+        conn = self._conn()
+        with self.transaction():
+            row = conn.execute('SELECT size_bytes FROM sessions WHERE id = ?', (session_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM history WHERE session_id = ?', (session_id,))
+            conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+            return row[0]
+
+    def list_by_access(self) -> List[Tuple[str, float, int]]:
+        return [
+            (row[0], row[1], row[2])
+            for row in self._conn().execute(
+                'SELECT id, last_accessed, size_bytes FROM sessions ORDER BY last_accessed'
+            )
+        ]
+
+    def count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def total_bytes(self) -> int:
+        return self._conn().execute('SELECT COALESCE(SUM(size_bytes), 0) FROM sessions').fetchone()[0]
+
+
+def create_session_store(backend: Optional[str] = None) -> SessionStore:
+    """
+    按配置创建会话存储
+
+    Args:
+        backend: 'memory' 或 'sqlite'，默认读取 Config.SESSION_STORE
+
+    Returns:
+        SessionStore 实例
+    """
+    backend = backend or Config.SESSION_STORE
+    if backend == 'sqlite':
+        return SQLiteSessionStore(Config.SESSION_DB_PATH, touch_interval=Config.SESSION_TOUCH_INTERVAL)
+    if backend == 'memory':
+        return InMemorySessionStore()
+    raise ValueError(f"未知的会话存储后端: {backend}")
@@ -0,0 +1,190 @@
+"""
+推测执行模块
+分类结果不确定时同时发起快速模式与完整模式调用，快速结果通过验收则取消完整调用
+"""
+import concurrent.futures
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from api_clients import APIResponse
+from async_api_clients import AsyncAPIClientFactory, get_async_runtime
+from config import Config
+
+
+def parse_fast_operations(response: APIResponse) -> Optional[List[dict]]:
+    """
+    解析快速模式响应
+
+    Args:
+        response: generate_fast_operations 的返回值
+
+    Returns:
+        非空操作数组，无效或为空时返回 None
+    """
+    if not response.success:
+        return None
+    try:
+        operations = json.loads(response.content)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(operations, list) and len(operations) > 0:
+        return operations
+    return None
+
+
+# 各快速操作类型的必需字段：(不能为空的字段, 只需存在的字段)，与前端 DOMPatcher.validateOperations 一致
+FAST_OPERATION_FIELDS = {
+    'style_change': (('property', 'value'), ()),
+    'text_replace': ((), ('newText',)),
+    'attribute_modify': (('attribute',), ('value',)),
+    'class_toggle': (('className', 'action'), ()),
+    'visibility_toggle': (('action',), ()),
+}
+# 必须为字符串的字段（用作选择器、样式属性名、属性名或类名）；value/newText 只接受标量
+FAST_OPERATION_STRING_FIELDS = ('type', 'selector', 'property', 'attribute', 'className', 'action')
+FAST_OPERATION_SCALAR_FIELDS = ('value', 'newText')
+
+
+def validate_fast_operations(operations: List[dict]) -> Optional[str]:
+    """
+    校验快速操作的结构
+
+    Args:
+        operations: parse_fast_operations 返回的操作数组
+
+    Returns:
+        错误描述，结构有效时返回 None
+    """
+    for idx, operation in enumerate(operations, start=1):
+        if not isinstance(operation, dict):
+            return f'操作 {idx} 不是对象'
+        if not operation.get('type') or not operation.get('selector'):
+            return f'操作 {idx} 缺少 type 或 selector 字段'
+        wrong_type = [
+            name for name in FAST_OPERATION_STRING_FIELDS
+            if name in operation and not isinstance(operation[name], str)
+        ]
+        wrong_type += [
+            name for name in FAST_OPERATION_SCALAR_FIELDS
+            if operation.get(name) is not None and not isinstance(operation[name], (str, int, float, bool))
+        ]
+        if wrong_type:
+            return f"操作 {idx} 的字段类型无效: {'、'.join(wrong_type)}"
+        fields = FAST_OPERATION_FIELDS.get(operation['type'])
+        if fields is None:
+            return f"操作 {idx} 的类型 {operation['type']} 不支持"
+        non_empty, present = fields
+        missing = [name for name in non_empty if not operation.get(name)]
+        missing += [name for name in present if operation.get(name) is None]
+        if missing:
+            return f"操作 {idx} 缺少 {'、'.join(missing)}"
+    return None
+
+
+def should_speculate(classify_meta: Optional[Dict], requested: bool) -> bool:
+    """
+    判断是否启用推测执行
+
+    决策来自学习型路由模型时按快速模式概率与模型阈值的距离判断，
+    否则按关键词启发式的简单/复杂分数差判断。
+
+    Args:
+        classify_meta: 分类器返回的元数据（强制模式时为 None）
+        requested: 请求体是否显式要求推测执行
+
+    Returns:
+        True 表示应同时发起两种调用
+    """
+    if not classify_meta or not (requested or Config.SPECULATIVE_EXECUTION):
+        return False
+    if classify_meta.get('router') == 'learned':
+        margin = classify_meta['fast_probability'] - classify_meta['fast_threshold']
+        return abs(margin) <= Config.SPECULATIVE_PROBABILITY_MARGIN
+    margin = classify_meta['simple_score'] - classify_meta['complex_score']
+    return abs(margin) <= Config.SPECULATIVE_SCORE_MARGIN
+
+
+def run_speculative(provider: str, api_key: str, model: str, instruction: str, html_code: str,
+                    accept: Optional[Callable[[List[dict]], Any]] = None
+                    ) -> Tuple[Optional[List[dict]], Any, Optional[APIResponse], Dict]:
+    """
+    并发执行快速模式与完整模式调用
+
+    快速结果先解析并校验结构，再交给 accept 验收（例如在服务端实际应用）：
+    验收通过才取消完整调用，否则继续等待完整结果。
+    总耗时为两者的较大值，而非顺序降级时的两者之和。
+
+    Args:
+        provider: 提供商名称
+        api_key: API 密钥
+        model: 模型名称
+        instruction: 修改指令
+        html_code: 当前 HTML
+        accept: 验收回调，参数为结构有效的操作数组，返回 None 表示拒绝；默认直接接受
+
+    Returns:
+        (operations, accepted, response, metadata)
+        - operations: 快速模式被采用时的操作数组，否则 None
+        - accepted: accept 的返回值，快速模式未被采用时为 None
+        - response: 被采用的响应（快速模式被采用时为快速响应，否则为完整模式响应）
+        - metadata: 推测执行的耗时信息
+    """
+    runtime = get_async_runtime()
+    client = AsyncAPIClientFactory.create_client(provider=provider, api_key=api_key, model=model)
+    started = time.time()
+    timeout = Config.SPECULATIVE_TIMEOUT
+
+    fast_future = runtime.submit(client.generate_fast_operations(instruction, html_code))
+    full_future = runtime.submit(client.modify_html(instruction, html_code))
+    # 两个调用共用同一截止时间，快速调用耗时再长也不会挤占完整调用的预算
+    deadline = started + timeout
+
+    done, _ = concurrent.futures.wait(
+        [fast_future, full_future], timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+    )
+    operations = None
+    fast_elapsed = None
+    if fast_future in done:
+        try:
+            fast_response = fast_future.result()
+        except Exception:  # pylint: disable=broad-except
+            # 快速调用的任何异常都只意味着改用完整结果
+            fast_response = None
+        fast_elapsed = time.time() - started
+
+        operations = parse_fast_operations(fast_response) if fast_response else None
+        accepted = None
+        if operations is not None and validate_fast_operations(operations) is None:
+            try:
+                accepted = accept(operations) if accept else operations
+            except Exception:  # pylint: disable=broad-except
+                # 验收失败同样改用完整结果，确保完整调用总会被使用或取消
+                accepted = None
+        if accepted is not None:
+            # 快速模式已验收，取消仍在进行的完整调用
+            full_future.cancel()
+            return operations, accepted, fast_response, {
+                'speculative': True,
+                'winner': 'fast',
+                'fast_latency': round(fast_elapsed, 3)
+            }
+    else:
+        # 完整调用先结束或已超时，快速结果不再有用，释放其并发名额与连接
+        fast_future.cancel()
+
+    try:
+        full_response = full_future.result(timeout=max(deadline - time.time(), 0))
+    except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+        full_future.cancel()
+        full_response = APIResponse(success=False, error="请求超时")
+
+    metadata = {
+        'speculative': True,
+        'winner': 'full',
+        'fast_rejected': operations is not None,
+        'full_latency': round(time.time() - started, 3)
+    }
+    if fast_elapsed is not None:
+        metadata['fast_latency'] = round(fast_elapsed, 3)
+    return None, None, full_response, metadata
@@ -9,6 +9,7 @@ import {
   createSession,
   uploadHTML,
   modifyHTML,
+  modifyHTMLStream,
   getHistory,
   revertToHistory,
   downloadHTML,
@@ -31,6 +32,7 @@ function App() {
   const [suggestions, setSuggestions] = useState([]);
   const [loadingSuggestions, setLoadingSuggestions] = useState(false);
   const [processingMode, setProcessingMode] = useState(null);  // 'fast' 或 'full'
+  const [streaming, setStreaming] = useState(false);  // 完整模式分片正在到达
   const [estimatedTime, setEstimatedTime] = useState(null);  // 预估处理时间
   const [isDatasetModalOpen, setDatasetModalOpen] = useState(false);
 
@@ -148,9 +150,43 @@ function App() {
     setProcessingMode(null);
     setEstimatedTime(null);
 
+    const baseHtml = currentHtml;
+
     try {
-      // 调用智能路由API
-      const response = await modifyHTML(sessionId, instruction, apiProvider, model);
+      // 调用智能路由API（需要完整模式时改走流式接口）
+      let response = await modifyHTML(sessionId, instruction, apiProvider, model, null, true);
+
+      if (response.success && response.mode === 'full' && response.stream) {
+        // 完整模式：分片到达即渲染，每帧最多刷新一次预览
+        setProcessingMode('full');
+        setEstimatedTime('10-30秒');
+        setStreaming(true);
+
+        let streamedHtml = '';
+        let frame = null;
+        try {
+          response = await modifyHTMLStream(sessionId, instruction, apiProvider, model, (delta) => {
+            streamedHtml += delta;
+            if (frame === null) {
+              frame = requestAnimationFrame(() => {
+                frame = null;
+                setCurrentHtml(streamedHtml.replace(/^\s*```[\w-]*\n?/, ''));
+              });
+            }
+          });
+        } catch (streamError) {
+          response = { success: false, error: streamError.message };
+        }
+        if (frame !== null) {
+          cancelAnimationFrame(frame);
+        }
+
+        if (!response.success) {
+          // 流式失败：恢复修改前的预览，按请求失败处理
+          setCurrentHtml(baseHtml);
+          throw new Error(response.error || '修改失败');
+        }
+      }
       
       if (response.success) {
         // 根据返回的模式处理
@@ -159,25 +195,28 @@ function App() {
           setProcessingMode('fast');
           setEstimatedTime('2-5秒');
           
-          // 验证操作指令
-          const validation = DOMPatcher.validateOperations(response.operations);
-          if (!validation.valid) {
-            throw new Error(`操作指令验证失败: ${validation.error}`);
-          }
-          
-          // 应用DOM操作
-          const patchResult = await DOMPatcher.applyOperations(currentHtml, response.operations);
-          
-          if (patchResult.success) {
-            setCurrentHtml(patchResult.html);
+          if (response.html_content) {
+            // 服务端已应用操作并写入历史，直接使用返回的HTML
+            setCurrentHtml(response.html_content);
+          } else {
+            // 验证操作指令
+            const validation = DOMPatcher.validateOperations(response.operations);
+            if (!validation.valid) {
+              throw new Error(`操作指令验证失败: ${validation.error}`);
+            }
             
-            // 刷新历史记录
-            const historyResponse = await getHistory(sessionId);
-            if (historyResponse.success) {
-              setHistory(historyResponse.history);
+            // 应用DOM操作
+            const patchResult = await DOMPatcher.applyOperations(currentHtml, response.operations);
+            if (!patchResult.success) {
+              throw new Error(patchResult.error);
             }
-          } else {
-            throw new Error(patchResult.error);
+            setCurrentHtml(patchResult.html);
+          }
+          
+          // 刷新历史记录
+          const historyResponse = await getHistory(sessionId);
+          if (historyResponse.success) {
+            setHistory(historyResponse.history);
           }
           
         } else if (response.mode === 'full' && response.html_content) {
@@ -214,6 +253,7 @@ function App() {
       setError('修改失败：' + (error.response?.data?.error || error.message));
     } finally {
       setLoading(false);
+      setStreaming(false);
       setProcessingMode(null);
       setEstimatedTime(null);
     }
@@ -405,6 +445,7 @@ function App() {
             originalHtml={originalHtml}
             currentHtml={currentHtml}
             loading={loading}
+            streaming={streaming}
           />
         </main>
       </div>
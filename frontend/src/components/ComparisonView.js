@@ -2,7 +2,7 @@ import React from 'react';
 import PreviewPanel from './PreviewPanel';
 import '../styles/ComparisonView.css';
 
-const ComparisonView = ({ originalHtml, currentHtml, loading }) => {
+const ComparisonView = ({ originalHtml, currentHtml, loading, streaming = false }) => {
   return (
     <div className="comparison-view">
       <div className="comparison-panel">
@@ -20,6 +20,7 @@ const ComparisonView = ({ originalHtml, currentHtml, loading }) => {
           html={currentHtml} 
           title="当前版本" 
           loading={loading}
+          streaming={streaming}
         />
       </div>
     </div>
@@ -1,7 +1,7 @@
 import React, { useEffect, useRef } from 'react';
 import '../styles/PreviewPanel.css';
 
-const PreviewPanel = ({ html, title, loading }) => {
+const PreviewPanel = ({ html, title, loading, streaming = false }) => {
   const iframeRef = useRef(null);
 
   useEffect(() => {
@@ -19,7 +19,7 @@ const PreviewPanel = ({ html, title, loading }) => {
     <div className="preview-panel">
       <div className="preview-header">
         <h3>{title}</h3>
-        {loading && <span className="loading-indicator">加载中</span>}
+        {loading && <span className="loading-indicator">{streaming ? '生成中' : '加载中'}</span>}
       </div>
       
       <div className="preview-content">
@@ -31,7 +31,8 @@ const PreviewPanel = ({ html, title, loading }) => {
               className="preview-iframe"
               sandbox="allow-same-origin allow-scripts"
             />
-            {loading && (
+            {/* 流式生成时不遮挡预览，让分片实时可见 */}
+            {loading && !streaming && (
               <div className="loading-overlay">
                 <div className="loading-spinner">
                   <div className="spinner-ring"></div>
@@ -11,6 +11,8 @@ const api = axios.create({
   headers: {
     'Content-Type': 'application/json',
   },
+  // 数组参数序列化为重复键（prompt_type=a&prompt_type=b），与后端 getlist 对应
+  paramsSerializer: { indexes: null },
 });
 
 // 请求拦截器
@@ -65,18 +67,78 @@ export const uploadHTML = async (sessionId, htmlContent) => {
 /**
  * 修改 HTML - 智能路由版本
  * 自动选择快速模式或完整模式
+ * streamFull 为 true 时，路由到完整模式会返回 { mode: 'full', stream: true }，需再调用 modifyHTMLStream
  */
-export const modifyHTML = async (sessionId, instruction, apiProvider, model, forceMode = null) => {
+export const modifyHTML = async (sessionId, instruction, apiProvider, model, forceMode = null, streamFull = false) => {
   const response = await api.post('/api/modify', {
     session_id: sessionId,
     instruction,
     api_provider: apiProvider,
     model,
     force_mode: forceMode,  // 可选：强制使用某种模式
+    stream_full: streamFull,
   });
   return response.data;
 };
 
+/**
+ * 流式完整模式修改 HTML（Server-Sent Events）
+ * onChunk 在每个分片到达时被调用，返回最终 done 事件的数据
+ */
+export const modifyHTMLStream = async (sessionId, instruction, apiProvider, model, onChunk = null) => {
+  const response = await fetch(`${api.defaults.baseURL}/api/modify-stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      session_id: sessionId,
+      instruction,
+      api_provider: apiProvider,
+      model,
+    }),
+  });
+
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    return { success: false, error: data.error || `HTTP ${response.status}` };
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+  let result = { success: false, error: '流式响应意外结束' };
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE 事件以空行分隔
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let eventName = 'message';
+      let dataText = '';
+      rawEvent.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+      });
+      if (!dataText) continue;
+
+      const payload = JSON.parse(dataText);
+      if (eventName === 'chunk') {
+        if (onChunk) onChunk(payload.delta);
+      } else if (eventName === 'done' || eventName === 'error') {
+        result = payload;
+      }
+    }
+  }
+
+  return result;
+};
+
 /**
  * 快速模式修改 HTML（直接调用）
  * 返回JSON操作指令
@@ -158,16 +220,70 @@ export const getDatasetStatus = async () => {
   return response.data;
 };
 
+/**
+ * 数据集：分页获取样本列表
+ * fields 为需要返回的字段数组（默认 prompt / prompt_type / dataset_source），
+ * prompt 预览由服务端截断；filters 可包含 prompt_type / dataset_source（值或数组）
+ */
+export const listDatasetSamples = async (offset = 0, limit = 20, fields = null, filters = {}) => {
+  const params = { offset, limit, ...filters };
+  if (fields && fields.length > 0) {
+    params.fields = fields.join(',');
+  }
+  const response = await api.get('/api/dataset/samples', { params });
+  return response.data;
+};
+
+/**
+ * 数据集：获取分面取值计数与 HTML 长度分布
+ */
+export const getDatasetFacets = async () => {
+  const response = await api.get('/api/dataset/facets');
+  return response.data;
+};
+
+/**
+ * 数据集：在后台开始离线评估全部 prompt 的快速/完整模式路由（返回 202，结果用 getDatasetRoutingReport 查询）
+ */
+export const evaluateDatasetRouting = async (writeReport = true) => {
+  const response = await api.post('/api/dataset/routing-report', { write_report: writeReport });
+  return response.data;
+};
+
+/**
+ * 数据集：获取路由评估任务的状态与最近一次结果
+ */
+export const getDatasetRoutingReport = async () => {
+  const response = await api.get('/api/dataset/routing-report');
+  return response.data;
+};
+
 /**
  * 数据集：按 prompt 搜索样本
+ * filters 可包含 prompt_type / dataset_source（精确匹配）
  */
-export const searchDatasetSamples = async (query = '', limit = 50) => {
+export const searchDatasetSamples = async (query = '', limit = 50, filters = {}) => {
   const response = await api.get('/api/dataset/search', {
-    params: { query, limit },
+    params: { query, limit, ...filters },
   });
   return response.data;
 };
 
+/**
+ * 数据集：按 prompt 相似度查找样本
+ * 传入文本 query，或传入 sampleId 查找与该样本相似的样本
+ */
+export const findSimilarDatasetSamples = async ({ query = '', sampleId = null, limit = 10 } = {}) => {
+  const params = { limit };
+  if (sampleId !== null && sampleId !== undefined) {
+    params.sample_id = sampleId;
+  } else {
+    params.query = query;
+  }
+  const response = await api.get('/api/dataset/similar', { params });
+  return response.data;
+};
+
 /**
  * 数据集：选择样本并加载到会话
  */